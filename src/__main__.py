@@ -1,16 +1,288 @@
-from PyQt5.QtWidgets import QApplication, QMainWindow, QMenu, QAction, QMessageBox
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QIcon
+from PyQt5.QtWidgets import (
+    QApplication,
+    QDockWidget,
+    QMainWindow,
+    QAction,
+    QMessageBox,
+    QLabel,
+    QFileDialog,
+    QFontDialog,
+    QInputDialog,
+    QProgressBar,
+    QTabWidget,
+    QVBoxLayout,
+    QWidget,
+)
+from PyQt5.QtCore import QEvent, Qt, QTimer
+from PyQt5.QtGui import QFont, QIcon
+from collections import namedtuple
+from functools import partial
 import webbrowser
+import shutil
 import sys
+import os
+import tempfile
+import time
+import zlib
+
+from document import Document, STYLE
+from metrics import METRICS
+from theme import THEMES
 
 ICON = "assets/icon.png"
+# Text and styles kept in memory across all tabs, idle tabs hibernate past it
+MEMORY_BUDGET = 256 * 1024 * 1024
+
+# Stored as ``<name>_action`` on the Editor, ``slot`` names an Editor method
+Action = namedtuple(
+    "Action", "name text shortcut tip slot checkable", defaults=(None, False)
+)
+# Menu bars
+# File | Edit | View | Help | About
+# ============================================================
+# A None entry is a separator
+MENUS = (
+    (
+        "File",
+        (
+            Action("new", "New", "Ctrl+N", "Create a new file", "new"),
+            Action("open", "Open", "Ctrl+O", "Open a file", "open"),
+            Action(
+                "open_folder",
+                "Open Folder",
+                "Ctrl+Alt+O",
+                "Open a folder as the workspace",
+                "open_folder",
+            ),
+            Action(
+                "quick_open",
+                "Go to File",
+                "Ctrl+P",
+                "Open a workspace file by name",
+                "quick_open",
+            ),
+            Action("save", "Save", "Ctrl+S", "Save the document", "save"),
+            Action(
+                "save_as",
+                "Save As",
+                "Ctrl+Shift+S",
+                "Save the document without overwriting the current file",
+                "save_as",
+            ),
+            None,
+            Action("exit", "Exit", "Ctrl+Q", "Exit Griph-Pad"),
+        ),
+    ),
+    (
+        "Edit",
+        (
+            Action("undo", "Undo", "Ctrl+Z", "Undo", "undo"),
+            Action("redo", "Redo", "Ctrl+Y", "Redo", "redo"),
+            None,
+            Action("cut", "Cut", "Ctrl+X", "Cut the selection", "cut"),
+            Action("copy", "Copy", "Ctrl+C", "Copy the selection", "copy"),
+            Action("paste", "Paste", "Ctrl+V", "Paste from system clipboard", "paste"),
+            Action(
+                "delete",
+                "Delete",
+                "Del",
+                "Delete the selection or the character after the cursor",
+                "delete",
+            ),
+            None,
+            Action(
+                "select_all",
+                "Select All",
+                "Ctrl+A",
+                "Select all the text",
+                "select_all",
+            ),
+            Action(
+                "select_all_occurrences",
+                "Select All Occurrences",
+                "Alt+F3",
+                "Put a caret on every occurrence of the selection",
+                "select_all_occurrences",
+            ),
+            Action(
+                "complete_word",
+                "Complete Word",
+                "Ctrl+Space",
+                "Complete the word before the cursor",
+                "complete_word",
+            ),
+            Action(
+                "upper_case",
+                "Upper Case",
+                "Ctrl+Shift+U",
+                "Upper case the selections",
+                "upper_case",
+            ),
+            Action(
+                "lower_case",
+                "Lower Case",
+                "Ctrl+U",
+                "Lower case the selections",
+                "lower_case",
+            ),
+            None,
+            Action("find", "Find", "Ctrl+F", "Search the document", "find"),
+            Action(
+                "find_next", "Find Next", "F3", "Select the next match", "find_next"
+            ),
+            Action(
+                "find_previous",
+                "Find Previous",
+                "Shift+F3",
+                "Select the previous match",
+                "find_previous",
+            ),
+            Action(
+                "replace",
+                "Replace",
+                "Ctrl+H",
+                "Replace every match in the document",
+                "replace",
+            ),
+            Action(
+                "find_in_files",
+                "Find in Files",
+                "Ctrl+Alt+F",
+                "Search every file of the workspace",
+                "find_in_files",
+            ),
+        ),
+    ),
+    (
+        "View",
+        (
+            Action("font", "Font", "Ctrl+shift+F", "Change the current font", "font"),
+            Action(
+                "font_size",
+                "Font Size",
+                "Ctrl+Alt+S",
+                "Change the current font size",
+                "font_size",
+            ),
+            Action("zoom_in", "Zoom In", "Ctrl+=", "Make the text bigger", "zoom_in"),
+            Action(
+                "zoom_out", "Zoom Out", "Ctrl+-", "Make the text smaller", "zoom_out"
+            ),
+            Action(
+                "reset_zoom",
+                "Reset Zoom",
+                "Ctrl+0",
+                "Show the text at the font size",
+                "reset_zoom",
+            ),
+            Action(
+                "line_wrap",
+                "Line Wrap",
+                "Ctrl+shift+W",
+                "Toggle line wrap",
+                "line_wrap",
+                True,
+            ),
+            Action(
+                "minimap",
+                "Minimap",
+                "Ctrl+Shift+M",
+                "Toggle the overview of the document beside the text",
+                "minimap",
+                True,
+            ),
+            Action(
+                "status_bar",
+                "Status Bar",
+                "Ctrl+shift+B",
+                "Toggle status bar",
+                "status_bar",
+                True,
+            ),
+            Action(
+                "reload_theme",
+                "Reload Theme",
+                None,
+                "Re-read the colour theme from disk",
+                "reload_theme",
+            ),
+            None,
+            Action(
+                "line_number",
+                "Line Numbers",
+                "Ctrl+shift+L",
+                "Toggle line numbers",
+                "line_number",
+                True,
+            ),
+            Action(
+                "enter_full_screen",
+                "Full Screen",
+                "F11",
+                "Enter/Exit full screen mode",
+                "enter_full_screen",
+                True,
+            ),
+            None,
+            Action(
+                "perf_overlay",
+                "Performance Overlay",
+                "Ctrl+Shift+P",
+                "Show highlighting metrics in the status bar",
+                "perf_overlay",
+                True,
+            ),
+            Action(
+                "dump_metrics",
+                "Dump Metrics",
+                None,
+                "Save the performance metrics as JSON",
+                "dump_metrics",
+            ),
+        ),
+    ),
+    (
+        "Help",
+        (
+            Action(
+                "report_bug",
+                "Report Bug",
+                "Ctrl+B",
+                "Report a bug (Via Github)",
+                "report_bug",
+            ),
+        ),
+    ),
+    (
+        "About",
+        (
+            Action("about", "About", "Ctrl+Shift+A", "About Griph-Pad", "about"),
+            Action(
+                "about_qt",
+                "About Qt",
+                "Ctrl+Shift+Q",
+                "About Qt Framework (PyQt5)",
+                "about_qt",
+            ),
+            Action(
+                "license", "License", "Ctrl+Alt+L", "License Information", "license_"
+            ),
+            Action(
+                "credits", "Credits", "Ctrl+Shift+C", "Credits and Thanks", "credits_"
+            ),
+        ),
+    ),
+)
+# Rarely used, filled in once the window is up (or when first opened)
+LAZY_MENUS = ("Help", "About")
 
 
 class Editor(QMainWindow):
-    def __init__(self):
+    def __init__(self, path=None):
         super().__init__()
         self.initUI()
+        # Show the window first, the editor widget and its imports come next
+        QTimer.singleShot(0, partial(self.init_view, path))
 
     def initUI(self):
         self.setWindowTitle("Griph-Pad - A lightweight editor")
@@ -19,188 +291,484 @@ class Editor(QMainWindow):
         self.status = self.statusBar()
         self.status.startTimer(1000)
         self.status.showMessage("Ready")
+        self.perf_label = QLabel()
+        self.perf_label.hide()
+        self.status.addPermanentWidget(self.perf_label)
+        self.perf_timer = QTimer(self)
+        self.perf_timer.timeout.connect(self.update_perf_overlay)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        self.status.addPermanentWidget(self.progress_bar)
         self.menubar = self.menuBar()
 
-        # Menu bars
-        # File | Edit | View | Help | About
-        # ============================================================
-        # File -> New, Open, Save, Save As, Close, Exit
-        # Edit -> Undo, Redo, Cut, Copy, Paste, Delete, Select All
-        # View -> Font, Font Size, Line Wrap, Status Bar, Line Numbers, Full Screen
-        # Help -> Report Bug
-        # About -> About Griph-Pad, About Qt, License, Credits
+        # Documents, one per tab. The first one is created by init_view
+        self.documents = []
+        # Font of the text in every tab, None for the View's default
+        self.text_font = None
+        self.active = None
+        # Snapshots of hibernated documents, created when first needed
+        self.snapshot_dir = None
+        self.tabs = QTabWidget()
+        self.tabs.setDocumentMode(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.currentChanged.connect(self.tab_changed)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        central = QWidget()
+        self.central_layout = QVBoxLayout(central)
+        self.central_layout.setContentsMargins(0, 0, 0, 0)
+        self.central_layout.setSpacing(0)
+        self.central_layout.addWidget(self.tabs)
+        self.setCentralWidget(central)
+        # Created on first use, the Finder follows the current tab
+        self.find_bar = None
+        self.finder = None
+        # The open folder, its quick-open popup and Find in Files panel
+        self.workspace = None
+        self.quick_open_popup = None
+        self.find_in_files_dock = None
+        # Where to put the caret in documents still loading
+        self.pending_locations = {}
+        # Watches the open files, created with the first one
+        self.file_watcher = None
+        # Documents whose reload the user is being asked about
+        self.confirming_reload = set()
+
         self.initMenuBar()
         self.show()
 
+    def init_view(self, path=None):
+        if self.documents:
+            # A file was opened first
+            return
+        if path is not None and os.path.isdir(path):
+            self.open_workspace(path)
+            self.new_document()
+        elif path is not None:
+            self.open_file(path)
+        else:
+            self.new_document()
+        self.recover_journals()
+
+    def recover_journals(self):
+        """Bring back the unsaved edits of editors that crashed or were closed."""
+        from filewatch import stat_key
+        from journal import orphaned_journals, read_journal
+
+        recovered, lost = [], []
+        for file in orphaned_journals():
+            try:
+                header, edits = read_journal(file)
+                path = header["path"]
+                # The edits only fit the file they were made on
+                if path is not None and stat_key(os.stat(path)) != tuple(
+                    header["base"]
+                ):
+                    raise ValueError(f"{path} changed since")
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                lost.append(f"{file.name}: {e}")
+                try:
+                    os.unlink(file)
+                except OSError:
+                    pass
+                continue
+            if path is None:
+                document = self.document
+                if document is None or not document.is_empty():
+                    document = self.new_document()
+            else:
+                document = self.find_document(path)
+                if document is None:
+                    self.open_file(path)
+                    document = self.document
+            document.recover(file, edits)
+            recovered.append(path or "Untitled")
+        if recovered:
+            self.status.showMessage(
+                f"Recovered unsaved changes to {', '.join(recovered)}"
+            )
+        if lost:
+            QMessageBox.warning(
+                self,
+                "Recovery Failed",
+                "Unsaved changes could not be recovered:\n" + "\n".join(lost),
+            )
+
+    def find_document(self, path):
+        path = os.path.abspath(path)
+        for document in self.documents:
+            if document.path is not None and os.path.abspath(document.path) == path:
+                return document
+        return None
+
+    @property
+    def document(self):
+        return self.document_at(self.tabs.currentIndex())
+
+    @property
+    def view(self):
+        document = self.document
+        return None if document is None else document.view
+
+    def document_at(self, index):
+        page = self.tabs.widget(index)
+        for document in self.documents:
+            if document.page is page:
+                return document
+        return None
+
     def initMenuBar(self):
-        self.file_menu = self.menubar.addMenu("File")
-        self.edit_menu = self.menubar.addMenu("Edit")
-        self.view_menu = self.menubar.addMenu("View")
-        self.help_menu = self.menubar.addMenu("Help")
-        self.about_menu = self.menubar.addMenu("About")
-
-        self.new_action = QAction("New", self)
-        self.new_action.setShortcut("Ctrl+N")
-        self.new_action.setStatusTip("Create a new file")
-        self.new_action.triggered.connect(self.new)
-
-        self.open_action = QAction("Open", self)
-        self.open_action.setShortcut("Ctrl+O")
-        self.open_action.setStatusTip("Open a file")
-        self.open_action.triggered.connect(self.open)
-
-        self.save_action = QAction("Save", self)
-        self.save_action.setShortcut("Ctrl+S")
-        self.save_action.setStatusTip("Save the document")
-        self.save_action.triggered.connect(self.save)
-
-        self.save_as_action = QAction("Save As", self)
-        self.save_as_action.setStatusTip(
-            "Save the document without overwriting the current file"
-        )
-        self.save_as_action.setShortcut("Ctrl+Shift+S")
-        self.save_as_action.triggered.connect(self.save)
-
-        self.exit_action = QAction("Exit", self)
-        self.exit_action.setShortcut("Ctrl+Q")
-        self.exit_action.setStatusTip("Exit Griph-Pad")
-
-        self.file_menu.addAction(self.new_action)
-        self.file_menu.addAction(self.open_action)
-        self.file_menu.addAction(self.save_action)
-        self.file_menu.addAction(self.save_as_action)
-        self.file_menu.addSeparator()
-        self.file_menu.addAction(self.exit_action)
-
-        self.undo_action = QAction("Undo", self)
-        self.undo_action.setShortcut("Ctrl+Z")
-        self.undo_action.setStatusTip("Undo")
-        self.undo_action.triggered.connect(self.undo)
-
-        self.redo_action = QAction("Redo", self)
-        self.redo_action.setShortcut("Ctrl+Y")
-        self.redo_action.setStatusTip("Redo")
-        self.redo_action.triggered.connect(self.redo)
-
-        self.cut_action = QAction("Cut", self)
-        self.cut_action.setShortcut("Ctrl+X")
-        self.cut_action.setStatusTip("Cut the selection")
-        self.cut_action.triggered.connect(self.cut)
-
-        self.copy_action = QAction("Copy", self)
-        self.copy_action.setShortcut("Ctrl+C")
-        self.copy_action.setStatusTip("Copy the selection")
-        self.copy_action.triggered.connect(self.copy)
-
-        self.paste_action = QAction("Paste", self)
-        self.paste_action.setShortcut("Ctrl+V")
-        self.paste_action.setStatusTip("Paste from system clipboard")
-        self.paste_action.triggered.connect(self.paste)
-
-        self.delete_action = QAction("Delete", self)
-        self.delete_action.setShortcut("Del")
-        self.delete_action.setStatusTip(
-            "Delete the selection or the character after the cursor"
-        )
-        self.delete_action.triggered.connect(self.delete)
-
-        self.select_all_action = QAction("Select All", self)
-        self.select_all_action.setShortcut("Ctrl+A")
-        self.select_all_action.setStatusTip("Select all the text")
-        self.select_all_action.triggered.connect(self.select_all)
-
-        self.edit_menu.addAction(self.undo_action)
-        self.edit_menu.addAction(self.redo_action)
-        self.edit_menu.addSeparator()
-        self.edit_menu.addAction(self.cut_action)
-        self.edit_menu.addAction(self.copy_action)
-        self.edit_menu.addAction(self.paste_action)
-        self.edit_menu.addAction(self.delete_action)
-        self.edit_menu.addSeparator()
-        self.edit_menu.addAction(self.select_all_action)
-
-        self.font_action = QAction("Font", self)
-        self.font_action.setStatusTip("Change the current font")
-        self.font_action.setShortcut("Ctrl+shift+F")
-        self.font_action.triggered.connect(self.font)
-
-        self.font_size_action = QAction("Font Size", self)
-        self.font_size_action.setStatusTip("Change the current font size")
-        self.font_size_action.setShortcut("Ctrl+shift+S")
-        self.font_size_action.triggered.connect(self.font_size)
-
-        self.line_wrap_action = QAction("Line Wrap", self)
-        self.line_wrap_action.setStatusTip("Toggle line wrap")
-        self.line_wrap_action.setShortcut("Ctrl+shift+W")
-        self.line_wrap_action.triggered.connect(self.line_wrap)
-        self.line_wrap_action.setCheckable(True)
-
-        self.status_bar_action = QAction("Status Bar", self)
-        self.status_bar_action.setStatusTip("Toggle status bar")
-        self.status_bar_action.setShortcut("Ctrl+shift+B")
-        self.status_bar_action.triggered.connect(self.status_bar)
-        self.status_bar_action.setCheckable(True)
-
-        self.line_number_action = QAction("Line Numbers", self)
-        self.line_number_action.setStatusTip("Toggle line numbers")
-        self.line_number_action.setShortcut("Ctrl+shift+L")
-        self.line_number_action.triggered.connect(self.line_number)
-        self.line_number_action.setCheckable(True)
-
-        self.enter_full_screen_action = QAction("Full Screen", self)
-        self.enter_full_screen_action.setStatusTip("Enter/Exit full screen mode")
-        self.enter_full_screen_action.setShortcut("F11")
-        self.enter_full_screen_action.triggered.connect(self.enter_full_screen)
-        self.enter_full_screen_action.setCheckable(True)
-
-        self.view_menu.addAction(self.font_action)
-        self.view_menu.addAction(self.font_size_action)
-        self.view_menu.addAction(self.line_wrap_action)
-        self.view_menu.addAction(self.status_bar_action)
-        self.view_menu.addSeparator()
-        self.view_menu.addAction(self.line_number_action)
-        self.view_menu.addAction(self.enter_full_screen_action)
-
-        self.report_bug_action = QAction("Report Bug", self)
-        self.report_bug_action.setStatusTip("Report a bug (Via Github)")
-        self.report_bug_action.setShortcut("Ctrl+B")
-        self.report_bug_action.triggered.connect(self.report_bug)
-
-        self.help_menu.addAction(self.report_bug_action)
-
-        self.about_action = QAction("About", self)
-        self.about_action.setStatusTip("About Griph-Pad")
-        self.about_action.setShortcut("Ctrl+Shift+A")
-        self.about_action.triggered.connect(self.about)
-
-        self.about_qt_action = QAction("About Qt", self)
-        self.about_qt_action.setStatusTip("About Qt Framework (PyQt5)")
-        self.about_qt_action.setShortcut("Ctrl+Shift+Q")
-        self.about_qt_action.triggered.connect(self.about_qt)
-
-        self.license = QAction("License", self)
-        self.license.setStatusTip("License Information")
-        self.license.setShortcut("Ctrl+Alt+L")
-        self.license.triggered.connect(self.license_)
-
-        self.credits = QAction("Credits", self)
-        self.credits.setStatusTip("Credits and Thanks")
-        self.credits.setShortcut("Ctrl+Shift+C")
-        self.credits.triggered.connect(self.credits_)
-
-        self.about_menu.addAction(self.about_action)
-        self.about_menu.addAction(self.about_qt_action)
-        self.about_menu.addAction(self.license)
-        self.about_menu.addAction(self.credits)
+        self.menus = {}
+        for title, actions in MENUS:
+            menu = self.menus[title] = self.menubar.addMenu(title)
+            if title in LAZY_MENUS:
+                menu.aboutToShow.connect(partial(self.build_menu, title))
+                # Their shortcuts only work once the actions exist
+                QTimer.singleShot(0, partial(self.build_menu, title))
+            else:
+                self.build_menu(title)
+
+    def build_menu(self, title):
+        menu = self.menus[title]
+        if not menu.isEmpty():
+            return
+        for action in dict(MENUS)[title]:
+            if action is None:
+                menu.addSeparator()
+                continue
+            qaction = QAction(action.text, self)
+            if action.shortcut:
+                qaction.setShortcut(action.shortcut)
+            qaction.setStatusTip(action.tip)
+            qaction.setCheckable(action.checkable)
+            if action.slot:
+                qaction.triggered.connect(getattr(self, action.slot))
+            setattr(self, f"{action.name}_action", qaction)
+            menu.addAction(qaction)
 
     def new(self):
-        print("New file")
+        self.new_document()
+
+    def new_document(self):
+        document = Document(self, self.minimap_action.isChecked(), self.text_font)
+        document.progress.connect(self.show_progress)
+        document.loaded.connect(partial(self.load_finished, document))
+        document.saved.connect(partial(self.save_finished, document))
+        document.save_failed.connect(self.save_failed)
+        document.changed_on_disk.connect(partial(self.confirm_reload, document))
+        document.changed.connect(partial(self.update_title, document))
+        self.documents.append(document)
+        self.tabs.setCurrentIndex(self.tabs.addTab(document.page, document.title()))
+        return document
 
     def open(self):
-        print("Open file")
+        path, _ = QFileDialog.getOpenFileName(self, "Open File")
+        if path:
+            self.open_file(path)
+
+    def open_file(self, path):
+        from editor import convert_size
+
+        document = self.document
+        if document is None or not document.is_empty():
+            document = self.new_document()
+        document.open(path)
+        self.watch_files()
+        self.line_wrap_action.setEnabled(not document.large_file)
+        size = os.path.getsize(path)
+        self.show_progress(0, size)
+        self.progress_bar.show()
+        self.status.showMessage(f"Loading {path} ({convert_size(size)})")
+
+    def open_folder(self):
+        path = QFileDialog.getExistingDirectory(self, "Open Folder")
+        if path:
+            self.open_workspace(path)
+
+    def open_workspace(self, path):
+        from workspace import Workspace
+
+        self.close_workspace()
+        self.workspace = Workspace(path, self)
+        self.workspace.progress.connect(self.show_indexing)
+        self.workspace.finished.connect(self.show_indexed)
+        self.workspace.refresh()
+        self.status.showMessage(f"Indexing {path}")
+
+    def close_workspace(self):
+        if self.workspace is not None:
+            self.workspace.close()
+            self.workspace.deleteLater()
+            self.workspace = None
+        if self.quick_open_popup is not None:
+            self.quick_open_popup.deleteLater()
+            self.quick_open_popup = None
+        if self.find_in_files_dock is not None:
+            self.find_in_files_dock.widget().set_workspace(None)
+
+    def show_indexing(self, scanned, indexed):
+        self.status.showMessage(f"Indexing: {scanned} files scanned, {indexed} read")
+
+    def show_indexed(self):
+        workspace = self.sender()
+        if workspace is self.workspace:
+            count = workspace.file_count()
+            self.status.showMessage(f"{workspace.root}: {count} files indexed")
+
+    def quick_open(self):
+        from workspace import QuickOpen
+
+        if self.workspace is None:
+            self.open_folder()
+            if self.workspace is None:
+                return
+        if self.quick_open_popup is None:
+            self.quick_open_popup = QuickOpen(self.workspace, self)
+            self.quick_open_popup.opened.connect(self.open_file)
+        self.quick_open_popup.popup()
+
+    def find_in_files(self):
+        from filesearch import FindInFiles
+
+        if self.workspace is None:
+            self.open_folder()
+            if self.workspace is None:
+                return
+        if self.find_in_files_dock is None:
+            panel = FindInFiles()
+            panel.activated.connect(self.open_location)
+            dock = self.find_in_files_dock = QDockWidget("Find in Files", self)
+            dock.setWidget(panel)
+            self.addDockWidget(Qt.BottomDockWidgetArea, dock)
+        panel = self.find_in_files_dock.widget()
+        panel.set_workspace(self.workspace)
+        view = self.view
+        if view is not None and view.hasSelectedText():
+            text = view.selectedText()
+            if "\n" not in text:
+                panel.query.setText(text)
+        self.find_in_files_dock.show()
+        panel.query.setFocus()
+        panel.query.selectAll()
+
+    def open_location(self, path, line, column, length):
+        """Show ``path`` (relative to the workspace) with the given span selected."""
+        path = self.workspace.absolute(path)
+        document = self.find_document(path)
+        if document is not None:
+            self.tabs.setCurrentIndex(self.tabs.indexOf(document.page))
+        else:
+            self.open_file(path)
+            document = self.document
+        if document.loader is not None:
+            self.pending_locations[document] = (line, column, length)
+        else:
+            self.select_location(document, line, column, length)
+
+    def select_location(self, document, line, column, length):
+        view = document.view
+        view.SendScintilla(view.SCI_ENSUREVISIBLEENFORCEPOLICY, line)
+        start = view.SendScintilla(view.SCI_POSITIONFROMLINE, line)
+        if start < 0:
+            # The file got shorter since it was searched
+            return
+        start = min(start + column, view.length())
+        end = min(start + length, view.length())
+        view.SendScintilla(view.SCI_SETSEL, start, end)
+        view.setFocus()
+
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if (
+            event.type() == QEvent.ActivationChange
+            and self.isActiveWindow()
+            and self.workspace is not None
+        ):
+            # Files may have changed while another program had the focus
+            self.workspace.refresh()
+
+    def watch_files(self):
+        from filewatch import FileWatcher
+
+        if self.file_watcher is None:
+            self.file_watcher = FileWatcher(self)
+            self.file_watcher.changed.connect(self.file_changed)
+        self.file_watcher.set_paths(
+            document.path for document in self.documents if document.path
+        )
+
+    def file_changed(self, path):
+        for document in self.documents:
+            if document.path is not None and os.path.abspath(document.path) == path:
+                document.check_disk()
+
+    def confirm_reload(self, document):
+        if document in self.confirming_reload:
+            return
+        self.confirming_reload.add(document)
+        try:
+            answer = QMessageBox.question(
+                self,
+                "File Changed",
+                f"{document.title()} was changed by another program. Reload it? "
+                "Your unsaved changes can be brought back with Undo.",
+            )
+        finally:
+            self.confirming_reload.discard(document)
+        if document not in self.documents:
+            return
+        if answer == QMessageBox.Yes:
+            document.reload()
+        else:
+            document.ignore_disk_change()
+
+    def show_progress(self, done, total):
+        self.progress_bar.setValue(int(done * 100 / total) if total else 100)
+
+    def load_finished(self, document):
+        location = self.pending_locations.pop(document, None)
+        if location is not None:
+            self.select_location(document, *location)
+        self.progress_bar.hide()
+        if document.large_file:
+            self.status.showMessage(
+                "Large file: syntax highlighting and line wrap are disabled"
+            )
+        elif document.lossy:
+            self.status.showMessage("Not valid UTF-8: opened read-only")
+        else:
+            self.status.showMessage("Ready")
+        self.enforce_budget()
+
+    def update_title(self, document):
+        self.tabs.setTabText(self.tabs.indexOf(document.page), document.title())
+        if document is self.document and document.path:
+            self.setWindowTitle(f"{os.path.basename(document.path)} - Griph-Pad")
+
+    def tab_changed(self, index):
+        document = self.document_at(index)
+        if document is None:
+            return
+        now = time.monotonic()
+        if self.active is not None:
+            self.active.last_active = now
+        self.active = document
+        document.last_active = now
+        self.stop_finder()
+        if document.view is None:
+            try:
+                document.wake()
+            except (OSError, ValueError, KeyError, zlib.error) as e:
+                QMessageBox.critical(self, "Restore Failed", f"{document.path}: {e}")
+                return
+        self.update_title(document)
+        self.line_wrap_action.setEnabled(not document.large_file)
+        if self.find_bar is not None and self.find_bar.isVisible():
+            self.update_query()
+        self.enforce_budget()
+
+    def close_tab(self, index):
+        document = self.document_at(index)
+        if document.is_modified():
+            answer = QMessageBox.question(
+                self,
+                "Close Tab",
+                f"{document.title()} has unsaved changes. Close it anyway?",
+            )
+            if answer != QMessageBox.Yes:
+                return
+        document.close()
+        self.documents.remove(document)
+        if self.file_watcher is not None:
+            self.watch_files()
+        if self.active is document:
+            self.active = None
+        self.tabs.removeTab(index)
+        document.page.deleteLater()
+        document.deleteLater()
+        if not self.documents:
+            self.new_document()
+
+    def enforce_budget(self):
+        """Hibernate the longest idle documents until the rest fit in MEMORY_BUDGET."""
+        total = sum(document.memory_size() for document in self.documents)
+        if total <= MEMORY_BUDGET:
+            return
+        idle = [
+            document
+            for document in self.documents
+            if document is not self.document
+            and document.memory_size()
+            and document.can_hibernate()
+        ]
+        for document in sorted(idle, key=lambda document: document.last_active):
+            if total <= MEMORY_BUDGET:
+                break
+            size = document.memory_size()
+            try:
+                document.hibernate(self.snapshot_directory())
+            except OSError:
+                # Stays resident
+                continue
+            total -= size
+
+    def snapshot_directory(self):
+        if self.snapshot_dir is None:
+            self.snapshot_dir = tempfile.mkdtemp(prefix="griph-pad-")
+        return self.snapshot_dir
 
     def save(self):
-        print("Save file")
+        document = self.document
+        if document is None:
+            return
+        if document.path is None:
+            self.save_as()
+        else:
+            self.save_file(document.path)
+
+    def save_as(self):
+        document = self.document
+        if document is None:
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "Save As", document.path or "")
+        if path:
+            self.save_file(path)
+
+    def save_file(self, path):
+        from editor import convert_size
+
+        document = self.document
+        if document is None or document.view is None:
+            return
+        if document.loader is not None:
+            self.status.showMessage("The file is still loading")
+            return
+        if document.lossy:
+            QMessageBox.warning(
+                self,
+                "Save",
+                f"{document.title()} isn't valid UTF-8, saving it would replace"
+                " the invalid bytes.",
+            )
+            return
+        document.save(path)
+        size = document.saver.size
+        self.show_progress(0, size)
+        self.progress_bar.show()
+        self.status.showMessage(f"Saving {path} ({convert_size(size)})")
+
+    def save_finished(self, document):
+        self.progress_bar.hide()
+        self.status.showMessage(f"Saved {document.path}")
+        # Maybe under a new name
+        self.watch_files()
+        if self.workspace is not None:
+            self.workspace.refresh([document.path])
+
+    def save_failed(self, message):
+        self.progress_bar.hide()
+        QMessageBox.critical(self, "Save Failed", message)
 
     def exit(self):
         print("Exit")
@@ -226,18 +794,208 @@ class Editor(QMainWindow):
     def select_all(self):
         print("Select all")
 
+    def select_all_occurrences(self):
+        if self.view is not None:
+            self.view.select_all_occurrences()
+
+    def complete_word(self):
+        if self.view is not None and self.view.completer is not None:
+            self.view.completer.complete()
+
+    def upper_case(self):
+        if self.view is not None:
+            self.view.transform_selections(str.upper)
+
+    def lower_case(self):
+        if self.view is not None:
+            self.view.transform_selections(str.lower)
+
+    def find(self):
+        self.show_find_bar().query.setFocus()
+
+    def replace(self):
+        self.show_find_bar().replacement.setFocus()
+
+    def show_find_bar(self):
+        from search import FindBar
+
+        if self.find_bar is None:
+            bar = self.find_bar = FindBar()
+            bar.query.textChanged.connect(self.update_query)
+            for option in (bar.case, bar.word, bar.regex):
+                option.toggled.connect(self.update_query)
+            bar.query.returnPressed.connect(self.find_next)
+            bar.next.clicked.connect(self.find_next)
+            bar.previous.clicked.connect(self.find_previous)
+            bar.replacement.returnPressed.connect(self.replace_all)
+            bar.replace_all.clicked.connect(self.replace_all)
+            self.central_layout.addWidget(bar)
+        view = self.view
+        if view is not None and view.hasSelectedText():
+            # Searching for the selection is the common case
+            text = view.selectedText()
+            if "\n" not in text:
+                self.find_bar.query.setText(text)
+        self.find_bar.show()
+        self.find_bar.query.selectAll()
+        self.update_query()
+        return self.find_bar
+
+    def get_finder(self):
+        from search import Finder
+
+        if self.finder is None and self.view is not None:
+            self.finder = Finder(self.view, self)
+            self.finder.counted.connect(self.show_match_count)
+            self.finder.replaced.connect(self.show_replaced)
+        return self.finder
+
+    def stop_finder(self):
+        if self.finder is not None:
+            self.finder.close()
+            self.finder.deleteLater()
+            self.finder = None
+
+    def update_query(self):
+        import re
+
+        finder = self.get_finder()
+        if finder is None or self.find_bar is None:
+            return
+        try:
+            finder.set_query(self.find_bar.query.text(), **self.find_bar.options())
+        except re.error as e:
+            self.show_search_error(str(e))
+
+    def find_next(self, backwards=False):
+        if self.find_bar is None or not self.find_bar.query.text():
+            self.find()
+        elif self.get_finder() is not None:
+            self.finder.find_next(backwards)
+
+    def find_previous(self):
+        self.find_next(backwards=True)
+
+    def replace_all(self):
+        import re
+
+        if self.find_bar is None or self.get_finder() is None:
+            return
+        try:
+            self.finder.replace_all(self.find_bar.replacement.text())
+        except re.error as e:
+            self.show_search_error(str(e))
+
+    def show_match_count(self, count, complete):
+        if self.find_bar is not None:
+            more = "" if complete else "+"
+            self.find_bar.count.setText(f"{count}{more} matches")
+
+    def show_replaced(self, count):
+        self.status.showMessage(f"Replaced {count} matches")
+
+    def show_search_error(self, message):
+        if self.find_bar is not None:
+            self.find_bar.count.setText(message)
+
     def status_bar(self):
         self.status.hide() if self.status.isVisible() else self.status.show()
 
     def font(self):
-        print("Font")
+        if self.view is None:
+            return
+        font, ok = QFontDialog.getFont(self.view.font, self, "Font")
+        if ok:
+            self.set_text_font(font)
 
     def font_size(self):
-        print("Font size")
+        if self.view is None:
+            return
+        size, ok = QInputDialog.getInt(
+            self, "Font Size", "Points:", self.view.font_size, 4, 72
+        )
+        if ok:
+            font = QFont(self.view.font)
+            font.setPointSize(size)
+            self.set_text_font(font)
+
+    def set_text_font(self, font):
+        # Restyles nothing, hibernated documents get it when they wake
+        self.text_font = font
+        for document in self.documents:
+            document.set_font(font)
+
+    def zoom_in(self):
+        if self.view is not None:
+            self.view.zoom_by(1)
+
+    def zoom_out(self):
+        if self.view is not None:
+            self.view.zoom_by(-1)
+
+    def reset_zoom(self):
+        if self.view is not None:
+            self.view.reset_zoom()
 
     def line_wrap(self):
         print("Line wrap")
 
+    def minimap(self):
+        visible = self.minimap_action.isChecked()
+        shown = all([document.set_minimap(visible) for document in self.documents])
+        if not shown:
+            self.minimap_action.setChecked(False)
+            for document in self.documents:
+                document.set_minimap(False)
+            self.status.showMessage("The minimap needs NumPy")
+
+    def reload_theme(self):
+        try:
+            THEMES.reload(STYLE)
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Reload Theme", f"Can't load {STYLE}: {e}")
+            return
+        for document in self.documents:
+            if document.view is not None:
+                document.view.apply_theme()
+            if document.minimap is not None:
+                # Drawn in the old colours
+                document.minimap.layout_blocks()
+        self.status.showMessage(f"Reloaded theme {STYLE}")
+
+    def perf_overlay(self):
+        METRICS.enabled = self.perf_overlay_action.isChecked()
+        if METRICS.enabled:
+            self.update_perf_overlay()
+            self.perf_label.show()
+            self.perf_timer.start(500)
+        else:
+            self.perf_timer.stop()
+            self.perf_label.hide()
+
+    def update_perf_overlay(self):
+        latency = METRICS.histograms.get("restyle_latency")
+        last = METRICS.last_restyle()
+        if latency is None or last is None:
+            self.perf_label.setText("Restyle: -")
+            return
+        tps = METRICS.tokens_per_second() or 0
+        self.perf_label.setText(
+            f"Restyle p50 {latency.percentile(0.5) * 1000:.1f}ms"
+            f" p99 {latency.percentile(0.99) * 1000:.1f}ms"
+            f" | last {last['bytes']}B / {last['lines']} lines"
+            f" in {last['latency'] * 1000:.1f}ms"
+            f" | {tps:,.0f} tokens/s"
+        )
+
+    def dump_metrics(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Dump Metrics", "metrics.json", "JSON (*.json)"
+        )
+        if path:
+            METRICS.dump(path)
+            self.status.showMessage(f"Metrics saved to {path}")
+
     def report_bug(self):
         webbrowser.open_new_tab(
             "https://github.com/Griphitor/Griph-pad/issues/new/choose"
@@ -288,8 +1046,7 @@ class Editor(QMainWindow):
         msg.setText("Thanks to the following people for their contributions:")
         msg.setWindowIcon(self.windowIcon())
         msg.setStandardButtons(QMessageBox.Ok)
-        msg.setInformativeText(
-            """
+        msg.setInformativeText("""
             Advik-B: Developer, UI, and Testing
             Oxmc: Original Developer of Griphitor, Testing
             GivingHawk: Domain and Hosting (Money money money)
@@ -309,8 +1066,7 @@ class Editor(QMainWindow):
             Griphcode (Rafeal):
                 github.com/Griphcode
 
-            """
-        )
+            """)
         msg.exec_()
 
     def line_number(self):
@@ -325,6 +1081,21 @@ class Editor(QMainWindow):
         self.line_number_action.setChecked(False)
 
     def closeEvent(self, event):
+        self.stop_finder()
+        self.close_workspace()
+        if self.find_in_files_dock is not None:
+            from filesearch import shutdown_pool
+
+            shutdown_pool()
+        for document in self.documents:
+            document.cache_styles()
+            # Unsaved edits are recovered on the next start
+            document.stop_journal(keep=document.is_modified())
+            if document.saver is not None:
+                # Let a running save reach the disk before quitting
+                document.saver.wait()
+        if self.snapshot_dir is not None:
+            shutil.rmtree(self.snapshot_dir, ignore_errors=True)
         event.accept()
 
     def enter_full_screen(self):
@@ -337,7 +1108,8 @@ class Editor(QMainWindow):
 def main():
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
     app = QApplication(sys.argv)
-    UI = Editor()
+    # python src [file]
+    UI = Editor(sys.argv[1] if len(sys.argv) > 1 else None)
     return app.exec_()
 
 
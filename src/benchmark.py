@@ -0,0 +1,298 @@
+"""
+Headless highlighting benchmarks for ViewLexer/View.
+
+Runs under the Qt offscreen platform, so no display is needed:
+
+    python benchmark.py --sizes 1KB 1MB --languages python c --out bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+from PyQt5.QtWidgets import QApplication
+import pygments
+
+from editor import View
+
+SIZES = ("1KB", "100KB", "1MB", "10MB", "100MB")
+LANGUAGES = ("python", "c", "javascript", "html")
+SCENARIOS = (
+    "open",
+    "full",
+    "edit_start",
+    "edit_middle",
+    "edit_end",
+    "paste",
+    "scroll",
+)
+UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+SAMPLES = {
+    "python": '''\
+class Node:
+    """A node in a singly linked list."""
+
+    def __init__(self, value, next=None):
+        self.value = value  # payload
+        self.next = next
+
+    def __iter__(self):
+        node = self
+        while node is not None:
+            yield node.value
+            node = node.next
+
+
+def total(values, start=0.5):
+    return sum((v * 2 for v in values if v % 3), start) + 0x1F
+''',
+    "c": """\
+#include <stdio.h>
+#include <stdlib.h>
+
+/* A node in a singly linked list. */
+struct node {
+    int value;
+    struct node *next;
+};
+
+static int total(const struct node *n)
+{
+    int sum = 0;
+    for (; n != NULL; n = n->next)
+        sum += n->value * 2; // payload
+    printf("total: %d\\n", sum);
+    return sum + 0x1F;
+}
+""",
+    "javascript": """\
+// A node in a singly linked list.
+class Node {
+  constructor(value, next = null) {
+    this.value = value;
+    this.next = next;
+  }
+
+  *[Symbol.iterator]() {
+    for (let node = this; node !== null; node = node.next) yield node.value;
+  }
+}
+
+const total = (values, start = 0.5) =>
+  [...values].filter((v) => v % 3).reduce((a, v) => a + v * 2, start) + 0x1f;
+console.log(`total: ${total(new Node(1, new Node(2)))}`);
+""",
+    "html": """\
+<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="utf-8">
+    <title>Linked list</title>
+    <style>
+      .node { color: #f92672; margin: 0 1em; }
+    </style>
+  </head>
+  <body class="list">
+    <!-- A node in a singly linked list -->
+    <ul id="nodes"><li class="node" data-value="1">One &amp; two</li></ul>
+    <script>document.getElementById("nodes").hidden = false;</script>
+  </body>
+</html>
+""",
+}
+
+
+def parse_size(text):
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if text.upper().endswith(unit):
+            return int(float(text[: -len(unit)]) * UNITS[unit])
+    return int(text)
+
+
+def make_corpus(language, size):
+    sample = SAMPLES[language]
+    corpus = sample * (size // len(sample) + 1)
+    # Cut on a line boundary so the corpus stays well formed
+    cut = corpus.rfind("\n", 0, size) + 1
+    return corpus[: cut or size]
+
+
+class Bench:
+    def __init__(self, app, options):
+        self.app = app
+        self.options = options
+
+    def make_view(self, language):
+        view = View(
+            language,
+            self.options.style,
+            lazy_margin=self.options.lazy_margin,
+            threaded=self.options.threaded,
+            combined=not self.options.no_combined,
+        )
+        view.resize(800, 600)
+        view.show()
+        return view
+
+    def settle(self, view):
+        # Wait for a threaded restyle to come back and be applied
+        while view.lexer.job is not None:
+            self.app.processEvents()
+            time.sleep(0.0005)
+        self.app.processEvents()
+
+    def style_visible(self, view):
+        """Ask for styles up to the end of the screen, like a paint does."""
+        first = view.SendScintilla(view.SCI_GETFIRSTVISIBLELINE)
+        lines = view.SendScintilla(view.SCI_LINESONSCREEN)
+        end = view.SendScintilla(view.SCI_POSITIONFROMLINE, first + lines + 1)
+        if end < 0:
+            end = view.length()
+        # From the end styled position, so Scintilla doesn't mark more of
+        # the document dirty, and never backwards
+        start = view.SendScintilla(view.SCI_GETENDSTYLED)
+        view.SendScintilla(view.SCI_COLOURISE, start, max(start, end))
+        self.settle(view)
+
+    def style_all(self, view):
+        view.SendScintilla(view.SCI_COLOURISE, 0, -1)
+        self.settle(view)
+        # Lazy and threaded modes stop early, keep asking until done
+        while view.SendScintilla(view.SCI_GETENDSTYLED) < view.length():
+            view.SendScintilla(view.SCI_COLOURISE, view.length(), -1)
+            self.settle(view)
+
+    def timed(self, func, *args):
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    def show_line(self, view, line):
+        view.SendScintilla(view.SCI_SETFIRSTVISIBLELINE, max(line - 5, 0))
+
+    def show_and_style(self, view, line):
+        # Scrolling can restyle by itself, it counts too
+        self.show_line(view, line)
+        self.style_visible(view)
+
+    def edit(self, view, pos, text):
+        view.SendScintilla(view.SCI_INSERTTEXT, pos, text.encode("utf-8"))
+        line = view.SendScintilla(view.SCI_LINEFROMPOSITION, pos)
+        return self.timed(self.show_and_style, view, line)
+
+    def run(self, language, corpus):
+        repeat = self.options.repeat
+        timings = {name: [] for name in self.options.scenarios}
+
+        view = None
+        for _ in range(repeat):
+            view = self.make_view(language)
+            start = time.perf_counter()
+            view.setText(corpus)
+            self.style_visible(view)
+            timings.get("open", []).append(time.perf_counter() - start)
+
+        for _ in range(repeat):
+            timings.get("full", []).append(self.timed(self.style_all, view))
+
+        for scenario in ("edit_start", "edit_middle", "edit_end"):
+            if scenario not in timings:
+                continue
+            for _ in range(repeat):
+                length = view.length()
+                pos = {"edit_start": 0, "edit_middle": length // 2, "edit_end": length}
+                timings[scenario].append(self.edit(view, pos[scenario], "x"))
+
+        if "paste" in timings:
+            block = corpus[: 64 * 1024]
+            for _ in range(repeat):
+                timings["paste"].append(self.edit(view, view.length() // 2, block))
+
+        if "scroll" in timings:
+            # Fresh view so the pages aren't styled yet
+            view = self.make_view(language)
+            view.setText(corpus)
+            self.style_visible(view)
+            page = view.SendScintilla(view.SCI_LINESONSCREEN)
+            lines = view.lines()
+            for step in range(1, self.options.scroll_pages + 1):
+                line = min(step * page, lines)
+                timings["scroll"].append(self.timed(self.show_and_style, view, line))
+
+        return timings
+
+
+def summarize(seconds):
+    if not seconds:
+        return {}
+    return {
+        "seconds": seconds,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "max": max(seconds),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=SIZES)
+    parser.add_argument("--languages", nargs="+", default=LANGUAGES, choices=SAMPLES)
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--style", default="monokai")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scroll-pages", type=int, default=20)
+    parser.add_argument("--lazy-margin", type=int, default=None)
+    parser.add_argument("--threaded", action="store_true")
+    parser.add_argument("--no-combined", action="store_true")
+    parser.add_argument("--out", default="-", help="JSON output file, - for stdout")
+    options = parser.parse_args(argv)
+
+    app = QApplication(sys.argv[:1])
+    bench = Bench(app, options)
+    results = []
+    for language in options.languages:
+        for size_name in options.sizes:
+            corpus = make_corpus(language, parse_size(size_name))
+            print(f"{language} {size_name}...", file=sys.stderr, flush=True)
+            for scenario, seconds in bench.run(language, corpus).items():
+                results.append(
+                    {
+                        "language": language,
+                        "size": size_name,
+                        "bytes": len(corpus.encode("utf-8")),
+                        "scenario": scenario,
+                        **summarize(seconds),
+                    }
+                )
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "pygments": pygments.__version__,
+            "options": {k: v for k, v in vars(options).items() if k not in ("out",)},
+        },
+        "results": results,
+    }
+    if options.out == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(options.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Word completion from the identifiers the lexer finds.
+
+The ViewLexer passes on the ``Name`` tokens of every line it lexes and
+an IdentifierIndex keeps them per line, with a count of each identifier
+and the distinct ones in a sorted list. A restyle replaces only the
+lines it lexed, and an edit that adds or removes lines shifts them like
+the lexer's line states, so keeping the index costs as much as the
+restyle. A completion is a binary search in the sorted list; the
+buffer is never scanned and no QsciAPIs list is prepared.
+
+Lines are indexed once they are lexed, the ones Scintilla never needed
+styled (or had their styles restored from the style cache) aren't.
+"""
+
+import re
+from bisect import bisect_left, insort
+
+from PyQt5.QtCore import QObject
+
+# Characters typed before the list pops up by itself
+MIN_PREFIX = 3
+# Shorter identifiers aren't worth completing
+MIN_WORD_LENGTH = 2
+MAX_COMPLETIONS = 200
+# Identifiers inside Name tokens that aren't one, e.g. "@property"
+WORD = re.compile(r"[^\W\d]\w*")
+EMPTY = ()
+
+
+def group_words(names, first, end):
+    """
+    The identifiers of lines ``first`` to ``end``, a tuple per line, from
+    ``(line, token text)`` pairs.
+    """
+    lines = [EMPTY] * (end - first)
+    for line, value in names:
+        index = line - first
+        if not 0 <= index < len(lines):
+            continue
+        if value.isidentifier():
+            words = (value,) if len(value) >= MIN_WORD_LENGTH else EMPTY
+        else:
+            words = tuple(
+                word for word in WORD.findall(value) if len(word) >= MIN_WORD_LENGTH
+            )
+        if words:
+            lines[index] += words
+    return lines
+
+
+class IdentifierIndex:
+    """Identifiers per line, counted, the distinct ones sorted."""
+
+    def __init__(self):
+        # A tuple of identifiers per line, sharing one str per identifier
+        self.lines = []
+        self.counts = {}
+        self.canonical = {}
+        self.words = []
+
+    def set_lines(self, first, lines):
+        """Replace the identifiers of the lines from ``first`` on with ``lines``."""
+        stored = self.lines
+        if len(stored) < first + len(lines):
+            stored.extend([EMPTY] * (first + len(lines) - len(stored)))
+        old = stored[first : first + len(lines)]
+        # Added before the old ones go, an identifier still there stays in words
+        stored[first : first + len(lines)] = [self.add(words) for words in lines]
+        self.remove(old)
+
+    def insert_lines(self, line, count):
+        if line < len(self.lines):
+            self.lines[line:line] = [EMPTY] * count
+
+    def delete_lines(self, line, end):
+        removed = self.lines[line:end]
+        del self.lines[line:end]
+        self.remove(removed)
+
+    def truncate(self, line):
+        """Forget the lines from ``line`` on."""
+        self.delete_lines(line, len(self.lines))
+
+    def add(self, words):
+        if not words:
+            return EMPTY
+        counts = self.counts
+        canonical = self.canonical
+        shared = []
+        for word in words:
+            count = counts.get(word, 0)
+            if not count:
+                canonical[word] = word
+                insort(self.words, word)
+            else:
+                word = canonical[word]
+            counts[word] = count + 1
+            shared.append(word)
+        return tuple(shared)
+
+    def remove(self, lines):
+        counts = self.counts
+        for words in lines:
+            for word in words:
+                count = counts[word] - 1
+                if count:
+                    counts[word] = count
+                    continue
+                del counts[word]
+                del self.canonical[word]
+                words_list = self.words
+                del words_list[bisect_left(words_list, word)]
+
+    def complete(self, prefix, limit=MAX_COMPLETIONS):
+        """Up to ``limit`` identifiers starting with ``prefix``, sorted."""
+        words = self.words
+        i = bisect_left(words, prefix)
+        found = []
+        while i < len(words) and len(found) < limit and words[i].startswith(prefix):
+            found.append(words[i])
+            i += 1
+        return found
+
+
+class Completer(QObject):
+    """
+    Shows the identifiers of an IdentifierIndex that complete the word
+    before the caret in a View's autocompletion list, by itself once
+    ``min_prefix`` characters are typed or on ``complete()``.
+    """
+
+    def __init__(self, view, index, parent=None, min_prefix=MIN_PREFIX):
+        super().__init__(parent)
+        self.view = view
+        self.index = index
+        self.min_prefix = min_prefix
+        view.SCN_CHARADDED.connect(self.on_char_added)
+
+    def on_char_added(self, char):
+        if self.view.SendScintilla(self.view.SCI_AUTOCACTIVE):
+            # Scintilla narrows the list itself
+            return
+        if char <= 0 or not (chr(char).isalnum() or char == ord("_")):
+            return
+        self.complete(self.min_prefix)
+
+    def complete(self, min_prefix=1):
+        """Show the completions of the word before the caret, False if none."""
+        view = self.view
+        position = view.SendScintilla(view.SCI_GETCURRENTPOS)
+        start = view.SendScintilla(view.SCI_WORDSTARTPOSITION, position, True)
+        if position - start < max(min_prefix, 1):
+            return False
+        prefix = view.text_range(start, position).decode("utf-8", "replace")
+        line = view.SendScintilla(view.SCI_LINEFROMPOSITION, position)
+        index = self.index
+        # The caret line was indexed as it was a keystroke ago, its own
+        # half typed word is no completion
+        own = index.lines[line] if line < len(index.lines) else EMPTY
+        words = [
+            word
+            for word in index.complete(prefix)
+            if word != prefix and index.counts[word] > own.count(word)
+        ]
+        if not words:
+            return False
+        # Sorted like Scintilla expects, by UTF-8 bytes
+        view.SendScintilla(
+            view.SCI_AUTOCSHOW, position - start, " ".join(words).encode("utf-8")
+        )
+        return True
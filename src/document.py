@@ -0,0 +1,448 @@
+import os
+import time
+
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtWidgets import QHBoxLayout, QWidget
+
+from loader import FileLoader
+from saver import FileSaver
+from stylecache import (
+    MIN_DOCUMENT_SIZE,
+    STYLE_CACHE,
+    pack_states,
+    read_entry,
+    unpack_states,
+    write_entry,
+)
+
+STYLE = "monokai"
+# Lines styled past the visible ones
+LAZY_MARGIN = 100
+# Files this big open as plain text without word wrap
+LARGE_FILE_SIZE = 32 * 1024 * 1024
+
+
+class Document(QObject):
+    """
+    A file open in a tab: its View, loading and saving it, and hibernation.
+
+    A hibernated document has no View. Its text, styles, line states and
+    fold levels are compressed to a snapshot file and read back when the tab is shown again.
+
+    ``check_disk()`` brings in changes made to the file by other programs.
+    Without unsaved edits they are applied right away, else
+    ``changed_on_disk`` asks first.
+
+    Edits not saved yet are kept in a Journal, see ``recover()``.
+
+    A file that isn't valid UTF-8 is ``lossy`` and read-only, see FileLoader.
+    """
+
+    progress = pyqtSignal(int, int)
+    loaded = pyqtSignal()
+    saved = pyqtSignal()
+    save_failed = pyqtSignal(str)
+    changed_on_disk = pyqtSignal()
+    # The tab title or the modified flag changed
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None, minimap=True, font=None):
+        super().__init__(parent)
+        # Tab page, holds the View and its minimap while the document is awake
+        self.page = QWidget()
+        self.layout = QHBoxLayout(self.page)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+        self.layout.setSpacing(0)
+        self.view = None
+        self.show_minimap = minimap
+        self.minimap = None
+        # Font of the text, None for the View's default
+        self.font = font
+        self.path = None
+        self.lexer_name = None
+        self.large_file = False
+        self.lossy = False
+        self.loader = None
+        self.saver = None
+        self.reloader = None
+        # stat_key of the file as last loaded, saved or reloaded, and
+        # whether it changed while that couldn't be looked at
+        self.disk_state = None
+        self.stale = False
+        # Hash of the file as loaded and bytes of styles cached for it
+        self.digest = None
+        self.cached_size = 0
+        # Snapshot file while hibernated
+        self.snapshot = None
+        self.last_active = time.monotonic()
+        self.journal = None
+        # Journal file and edits to replay once loaded
+        self.recovery = None
+        self.create_view()
+        self.start_journal()
+
+    def title(self):
+        name = os.path.basename(self.path) if self.path else "Untitled"
+        return f"{name}*" if self.is_modified() else name
+
+    def is_modified(self):
+        return self.view is not None and self.view.isModified()
+
+    def is_empty(self):
+        return (
+            self.path is None
+            and self.snapshot is None
+            and self.view is not None
+            and not self.view.length()
+            and not self.view.isModified()
+        )
+
+    def create_view(self):
+        from editor import View
+
+        if self.large_file:
+            # Reduced features, highlighting and wrapping don't scale to this
+            view = View(None, STYLE, font=self.font)
+            view.setWrapMode(View.WrapNone)
+        else:
+            view = View(
+                self.lexer_name, STYLE, LAZY_MARGIN, threaded=True, font=self.font
+            )
+        view.modificationChanged.connect(self.changed)
+        self.layout.addWidget(view)
+        self.view = view
+        if self.show_minimap:
+            self.create_minimap()
+        return view
+
+    def create_minimap(self):
+        """Show the minimap, False if NumPy isn't installed."""
+        try:
+            from minimap import Minimap
+        except ImportError:
+            return False
+        self.minimap = Minimap(self.view)
+        self.layout.addWidget(self.minimap)
+        return True
+
+    def drop_minimap(self):
+        if self.minimap is not None:
+            self.layout.removeWidget(self.minimap)
+            self.minimap.deleteLater()
+            self.minimap = None
+
+    def set_minimap(self, visible):
+        """Show or hide the minimap, False if it can't be shown."""
+        self.show_minimap = visible
+        if self.view is None or visible == (self.minimap is not None):
+            return True
+        if visible:
+            return self.create_minimap()
+        self.drop_minimap()
+        return True
+
+    def set_font(self, font):
+        self.font = font
+        if self.view is not None:
+            self.view.set_font(font)
+
+    def start_journal(self):
+        from journal import Journal
+
+        self.journal = Journal(self.view, self.path, self.disk_state, self)
+
+    def stop_journal(self, keep=False):
+        """Keep the journal file for recovery if ``keep``, else remove it."""
+        if self.journal is not None:
+            self.journal.close(keep)
+            self.journal.deleteLater()
+            self.journal = None
+
+    def recover(self, file, edits):
+        """Replay the ``edits`` of the journal ``file`` left by a crash, then remove it."""
+        if self.loader is not None:
+            self.recovery = file, edits
+            return
+        # One undo action, undoing it shows the file as saved
+        self.view.replace_ranges(edits)
+        # Recorded again by this document's journal
+        self.journal.sync()
+        try:
+            os.unlink(file)
+        except OSError:
+            pass
+
+    def drop_view(self):
+        if self.view.lexer is not None:
+            self.view.lexer.cancel()
+        self.drop_minimap()
+        self.layout.removeWidget(self.view)
+        self.view.deleteLater()
+        self.view = None
+
+    def open(self, path):
+        from filewatch import stat_key
+        from languages import find_lexer_name
+
+        self.close()
+        st = os.stat(path)
+        size = st.st_size
+        self.path = path
+        self.disk_state = stat_key(st)
+        self.stale = False
+        self.lossy = False
+        self.large_file = size >= LARGE_FILE_SIZE
+        self.lexer_name = None if self.large_file else find_lexer_name(path)
+        if self.view is not None:
+            self.drop_view()
+        view = self.create_view()
+        self.changed.emit()
+
+        self.digest = None
+        self.cached_size = 0
+        highlighted = view.lexer is not None and size >= MIN_DOCUMENT_SIZE
+        self.loader = FileLoader(view, path, self, hash_content=highlighted)
+        self.loader.progress.connect(self.progress)
+        self.loader.finished.connect(self.load_finished)
+        self.loader.start()
+
+    def load_finished(self):
+        self.digest = self.loader.digest
+        self.lossy = self.loader.lossy
+        self.loader = None
+        self.restore_styles()
+        self.start_journal()
+        if self.recovery is not None:
+            self.recover(*self.recovery)
+            self.recovery = None
+        self.loaded.emit()
+        self.check_stale()
+
+    def restore_styles(self):
+        if self.digest is None:
+            return
+        lexer = self.view.lexer
+        cached = STYLE_CACHE.get(lexer.cache_key(self.digest), self.view.length())
+        if cached is not None:
+            lexer.restore_styles(*cached)
+            self.cached_size = len(cached[0])
+
+    def cache_styles(self):
+        """Keep the highlighting of an unchanged file for the next time it opens."""
+        if self.digest is None or self.view is None or self.view.isModified():
+            return
+        lexer = self.view.lexer
+        styles, line_states, folds = lexer.styled_prefix()
+        if len(styles) <= self.cached_size:
+            return
+        try:
+            STYLE_CACHE.put(
+                lexer.cache_key(self.digest),
+                self.view.length(),
+                styles,
+                line_states,
+                folds,
+            )
+        except OSError:
+            # Only a cache, opening the file next time is just slower
+            return
+        self.cached_size = len(styles)
+
+    def check_disk(self):
+        """Reload the file if another program changed it."""
+        from filewatch import stat_key
+
+        if self.path is None:
+            return
+        try:
+            state = stat_key(os.stat(self.path))
+        except OSError:
+            # Deleted or moved, the text stays as it is
+            return
+        if state == self.disk_state:
+            return
+        if (
+            self.view is None
+            or self.loader is not None
+            or self.saver is not None
+            or self.reloader is not None
+        ):
+            # Looked at again once that is done
+            self.stale = True
+        elif self.view.isModified():
+            self.changed_on_disk.emit()
+        else:
+            self.reload()
+
+    def check_stale(self):
+        if self.stale:
+            self.stale = False
+            self.check_disk()
+
+    def ignore_disk_change(self):
+        """Keep the unsaved edits, the file as it is now needs no reload."""
+        from filewatch import stat_key
+
+        try:
+            self.disk_state = stat_key(os.stat(self.path))
+        except OSError:
+            pass
+
+    def reload(self):
+        """Apply the file's changes to the View as edits, diffed on a worker thread."""
+        from filewatch import Reload
+
+        if self.reloader is not None:
+            self.reloader.cancel()
+        view = self.view
+        self.reloader = Reload(
+            view, self.path, self, hash_content=view.lexer is not None
+        )
+        self.reloader.finished.connect(self.reload_finished)
+        self.reloader.failed.connect(self.reload_failed)
+        self.reloader.start()
+
+    def reload_finished(self, result):
+        reloader = self.sender()
+        if reloader is not self.reloader:
+            return
+        self.reloader = None
+        if reloader.cancelled:
+            # Edited while diffing, the edits don't fit the buffer any more
+            self.stale = True
+        else:
+            edits, self.disk_state, self.digest, lossy = result
+            self.cached_size = 0
+            self.view.setReadOnly(False)
+            self.view.replace_ranges(edits)
+            self.lossy = lossy
+            self.view.setReadOnly(lossy)
+            # The buffer is the file now, undoing the reload modifies it again
+            self.view.SendScintilla(self.view.SCI_SETSAVEPOINT)
+            self.journal.reset(self.path, self.disk_state)
+        self.check_stale()
+
+    def reload_failed(self, message):
+        if self.sender() is self.reloader:
+            self.reloader = None
+            self.check_stale()
+
+    def save(self, path):
+        if self.saver is not None:
+            # Superseded, its temporary file is removed
+            self.saver.cancel()
+        self.path = path
+        self.changed.emit()
+        self.journal.mark()
+        self.saver = FileSaver(self.view, path)
+        self.saver.progress.connect(self.progress)
+        self.saver.finished.connect(self.save_finished)
+        self.saver.failed.connect(self.on_save_failed)
+        self.saver.start()
+
+    def save_finished(self):
+        saver = self.sender()
+        if saver is not self.saver:
+            return
+        self.saver = None
+        # What was loaded isn't what's on disk any more
+        self.digest = None
+        if not saver.detached:
+            # Edits made during the save are not on disk yet
+            self.view.setModified(False)
+        self.ignore_disk_change()
+        # Edits made during the save are only in the journal
+        self.journal.reset(self.path, self.disk_state, keep=saver.detached)
+        self.saved.emit()
+        self.check_stale()
+
+    def on_save_failed(self, message):
+        if self.sender() is not self.saver:
+            return
+        self.saver = None
+        self.journal.unmark()
+        self.save_failed.emit(message)
+        self.check_stale()
+
+    def memory_size(self):
+        """Rough resident size: the text plus a style byte per text byte."""
+        return 0 if self.view is None else 2 * self.view.length()
+
+    def can_hibernate(self):
+        # Hibernating drops the undo history, keep unsaved work resident
+        return (
+            self.view is not None
+            and self.loader is None
+            and self.saver is None
+            and self.reloader is None
+            and not self.view.isModified()
+        )
+
+    def hibernate(self, directory):
+        view = self.view
+        self.cache_styles()
+        length = view.length()
+        pointer = view.SendScintillaPtrResult(view.SCI_GETCHARACTERPOINTER)
+        pointer.setsize(length)
+        styles, line_states, folds = b"", [], b""
+        if view.lexer is not None:
+            styles, line_states, folds = view.lexer.styled_prefix()
+        table, indices = pack_states(line_states)
+        header = {
+            "length": length,
+            "states": table,
+            "position": view.SendScintilla(view.SCI_GETCURRENTPOS),
+            "anchor": view.SendScintilla(view.SCI_GETANCHOR),
+            "first_line": view.SendScintilla(view.SCI_GETFIRSTVISIBLELINE),
+            "zoom": view.SendScintilla(view.SCI_GETZOOM),
+        }
+        path = os.path.join(directory, f"{id(self):x}.snapshot")
+        # Unmodified, there is nothing to recover
+        self.stop_journal()
+        # Compressed straight from Scintilla's buffer
+        write_entry(path, header, (memoryview(pointer), styles, indices, folds))
+        self.snapshot = path
+        self.drop_view()
+
+    def wake(self):
+        header, (text, styles, indices, folds) = read_entry(self.snapshot)
+        view = self.create_view()
+        view.SendScintilla(view.SCI_SETUNDOCOLLECTION, False)
+        view.SendScintilla(view.SCI_APPENDTEXT, len(text), text)
+        view.SendScintilla(view.SCI_SETUNDOCOLLECTION, True)
+        view.SendScintilla(view.SCI_EMPTYUNDOBUFFER)
+        view.SendScintilla(view.SCI_SETSAVEPOINT)
+        view.setReadOnly(self.lossy)
+        del text
+        if view.lexer is not None and styles:
+            view.lexer.restore_styles(
+                styles, unpack_states(header["states"], indices), folds
+            )
+        view.SendScintilla(view.SCI_SETSEL, header["anchor"], header["position"])
+        view.SendScintilla(view.SCI_SETZOOM, header["zoom"])
+        view.SendScintilla(view.SCI_SETFIRSTVISIBLELINE, header["first_line"])
+        self.discard_snapshot()
+        self.start_journal()
+        self.check_stale()
+
+    def discard_snapshot(self):
+        if self.snapshot is not None:
+            try:
+                os.unlink(self.snapshot)
+            except OSError:
+                pass
+            self.snapshot = None
+
+    def close(self):
+        """Stop loading, let a running save finish on its own copy."""
+        if self.loader is not None:
+            self.loader.cancel()
+            self.loader = None
+        if self.saver is not None:
+            self.saver.detach()
+        if self.reloader is not None:
+            self.reloader.cancel()
+            self.reloader = None
+        self.stop_journal()
+        self.cache_styles()
+        self.discard_snapshot()
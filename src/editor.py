@@ -1,28 +1,27 @@
 import math
+import re
 import sys
-import textwrap
-import time
-import os
-from pathlib import Path
-from collections import defaultdict
-
-from PyQt5.Qsci import QsciLexerCustom, QsciScintilla
-from PyQt5.Qt import (
-    QFont,
-    QColor,
-    QShortcut,
-)
-
-from pygments import lexers, styles, highlight, formatters
-from pygments.lexer import Error, RegexLexer, Text, _TokenType
-from pygments.style import Style
+
+from PyQt5.Qsci import QsciScintilla
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QColor
 from PyQt5.QtWidgets import QApplication
-import json
 
-tf = os.path.join(os.getcwd(), "themes")
-THEMES = {}
-for file in os.listdir(tf):
-    THEMES.update({file.replace(".json", ""): json.load(open(os.path.join(tf, file)))})
+from theme import THEMES
+
+# From this many selections on, typing goes through bulk_edit. Scintilla
+# edits each selection separately, restyling after every one
+BULK_SELECTIONS = 64
+# Scintilla moves every selection on each edit of a bulk_edit, past this
+# many rebuilding them afterwards is quicker
+MAX_MOVED_SELECTIONS = 2048
+# Milliseconds between zoom steps while Ctrl+wheel events keep coming
+ZOOM_DELAY = 30
+# Scintilla's zoom range, in points added to every font size
+MIN_ZOOM = -10
+MAX_ZOOM = 20
+# Wheel angle of one zoom step, in eighths of a degree
+WHEEL_STEP = 120
 
 
 def convert_size(size_bytes):
@@ -35,133 +34,53 @@ def convert_size(size_bytes):
     return f"{s} {size_name[i]}"
 
 
-class ViewLexer(QsciLexerCustom):
-    def __init__(self, lexer_name, style_name, font: QFont):
-        super().__init__()
-
-        # Lexer + Style
-        self.pyg_style = styles.get_style_by_name(style_name)
-        self.pyg_lexer = lexers.get_lexer_by_name(lexer_name, stripnl=False)
-        self.cache = {0: ("root",)}
-        self.extra_style = THEMES[style_name]
-
-        # Generate QScintilla styles
-        self.font = font
-        self.token_styles = {}
-        index = 0
-        for k, v in self.pyg_style:
-            self.token_styles[k] = index
-            if v.get("color", None):
-                self.setColor(QColor(f"#{v['color']}"), index)
-            if v.get("bgcolor", None):
-                self.setPaper(QColor(f"#{v['bgcolor']}"), index)
-
-            self.setFont(self.font, index)
-            index += 1
-
-    def defaultPaper(self, style):
-        return QColor(self.extra_style["background"])
-
-    def language(self):
-        return self.pyg_lexer.name
-
-    def get_tokens_unprocessed(self, text, stack=("root",)):
-        """
-        Split ``text`` into (tokentype, text) pairs.
-
-        ``stack`` is the inital stack (default: ``['root']``)
-        """
-        lexer = self.pyg_lexer
-        pos = 0
-        tokendefs = lexer._tokens
-        statestack = list(stack)
-        statetokens = tokendefs[statestack[-1]]
-        while 1:
-            for rexmatch, action, new_state in statetokens:
-                m = rexmatch(text, pos)
-                if m:
-                    if action is not None:
-                        if type(action) is _TokenType:
-                            yield pos, action, m.group()
-                        else:
-                            for item in action(lexer, m):
-                                yield item
-                    pos = m.end()
-                    if new_state is not None:
-                        # state transition
-                        if isinstance(new_state, tuple):
-                            for state in new_state:
-                                if state == "#pop":
-                                    statestack.pop()
-                                elif state == "#push":
-                                    statestack.append(statestack[-1])
-                                else:
-                                    statestack.append(state)
-                        elif isinstance(new_state, int):
-                            # pop
-                            del statestack[new_state:]
-                        elif new_state == "#push":
-                            statestack.append(statestack[-1])
-                        else:
-                            assert False, "wrong state def: %r" % new_state
-                        statetokens = tokendefs[statestack[-1]]
-                    break
-            else:
-                # We are here only if all state tokens have been considered
-                # and there was not a match on any of them.
-                try:
-                    if text[pos] == "\n":
-                        # at EOL, reset state to "root"
-                        statestack = ["root"]
-                        statetokens = tokendefs["root"]
-                        yield pos, Text, "\n"
-                        pos += 1
-                        continue
-                    yield pos, Error, text[pos]
-                    pos += 1
-                except IndexError:
-                    break
-
-    def highlight_slow(self, start, end):
-        style = self.pyg_style
-        view = self.editor()
-        code = view.text()[start:]
-        tokensource = self.get_tokens_unprocessed(code)
-
-        self.startStyling(start)
-        for _, ttype, value in tokensource:
-            self.setStyling(len(value), self.token_styles[ttype])
-
-    def styleText(self, start, end):
-        view = self.editor()
-        t_start = time.time()
-        self.highlight_slow(start, end)
-        t_elapsed = time.time() - t_start
-        len_text = len(view.text())
-        text_size = convert_size(len_text)
-        view.setWindowTitle(
-            f"Text size: {len_text} - {text_size} Elapsed: {t_elapsed}s"
-        )
-
-    def description(self, style_nr):
-        return str(style_nr)
-
-
 class View(QsciScintilla):
-    def __init__(self, lexer_name, style_name):
+    # start, end and text of each replace_ranges edit, which sends no
+    # SCN_MODIFIED for its inserts and deletes
+    replaced = pyqtSignal(int, int, object)
+
+    def __init__(
+        self,
+        lexer_name,
+        style_name,
+        lazy_margin=None,
+        threaded=False,
+        combined=True,
+        font=None,
+    ):
         super().__init__()
         view = self
         # -------- Shortcuts --------
-        self.font_size = 8
-        self.font = QFont("JetBrains Mono", self.font_size)
+        self.font = QFont("JetBrains Mono", 8) if font is None else QFont(font)
+        self.font_size = self.font.pointSize()
         self.setFont(self.font)
         self.setTabWidth(4)
-        self.setText("Hello")
+        # Wheel angle not zoomed yet, applied at most every ZOOM_DELAY
+        self.pending_zoom = 0
+        self.zoom_timer = QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(ZOOM_DELAY)
+        self.zoom_timer.timeout.connect(self.apply_zoom)
 
         # -------- Lexer --------
         self.setEolMode(QsciScintilla.EolUnix)
-        self.lexer = ViewLexer(lexer_name, style_name, self.font)
-        self.setLexer(self.lexer)
+        if lexer_name is None:
+            # Plain text, nothing to highlight
+            self.lexer = None
+            self.completer = None
+        else:
+            # Pygments is only imported once something needs highlighting
+            from completion import Completer
+            from highlighter import ViewLexer
+
+            self.lexer = ViewLexer(
+                lexer_name, style_name, self.font, lazy_margin, threaded, combined
+            )
+            self.setLexer(self.lexer)
+            # Words from the identifiers the lexer finds
+            self.completer = Completer(self, self.lexer.identifiers, self)
+            # Fold levels come from the lexer, plain text has none
+            self.setFolding(QsciScintilla.BoxedTreeFoldStyle)
 
         # # -------- Multiselection --------
         self.SendScintilla(view.SCI_SETMULTIPLESELECTION, True)
@@ -169,7 +88,246 @@ class View(QsciScintilla):
         self.SendScintilla(view.SCI_SETADDITIONALSELECTIONTYPING, True)
 
         # -------- Extra settings --------
-        self.set_extra_settings(THEMES[style_name])
+        self.style_name = style_name
+        self.apply_theme()
+
+    def apply_theme(self):
+        """(Re-)apply the theme colours, e.g. after ``THEMES.reload()``."""
+        theme = THEMES[self.style_name]
+        if self.lexer is None:
+            self.setPaper(theme.color("background"))
+            self.setColor(theme.color("foreground", "#000000"))
+        else:
+            self.lexer.set_theme(theme)
+        self.set_extra_settings(theme)
+
+    def set_font(self, font):
+        """
+        Show the text in ``font``. Only the style definitions change,
+        Scintilla measures the text again but nothing is lexed again.
+        """
+        self.font = QFont(font)
+        self.font_size = self.font.pointSize()
+        if self.lexer is None:
+            self.setFont(self.font)
+            self.apply_theme()
+        else:
+            self.lexer.set_font(self.font)
+
+    def zoom_by(self, steps):
+        """
+        Zoom in ``steps`` points, out if negative. Like the zoom of other
+        calls soon after, it is applied in one go.
+        """
+        self.pending_zoom += steps * WHEEL_STEP
+        if not self.zoom_timer.isActive():
+            self.zoom_timer.start()
+
+    def reset_zoom(self):
+        self.pending_zoom = 0
+        self.zoom_timer.stop()
+        self.SendScintilla(self.SCI_SETZOOM, 0)
+
+    def apply_zoom(self):
+        # Whole steps, a touchpad sends fractions of one
+        steps = int(self.pending_zoom / WHEEL_STEP)
+        if not steps:
+            return
+        self.pending_zoom -= steps * WHEEL_STEP
+        zoom = self.SendScintilla(self.SCI_GETZOOM) + steps
+        self.SendScintilla(self.SCI_SETZOOM, max(MIN_ZOOM, min(zoom, MAX_ZOOM)))
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            # Each zoom lays out the visible text again, Scintilla would do
+            # it for every event
+            self.zoom_by(event.angleDelta().y() / WHEEL_STEP)
+            event.accept()
+            return
+        super().wheelEvent(event)
+
+    def text_range(self, start, end):
+        """The bytes between two positions."""
+        # bytes() adds a NUL
+        return self.bytes(start, end).data()[: end - start]
+
+    def selections(self):
+        """``(anchor, caret)`` of every selection."""
+        return [
+            (
+                self.SendScintilla(self.SCI_GETSELECTIONNANCHOR, i),
+                self.SendScintilla(self.SCI_GETSELECTIONNCARET, i),
+            )
+            for i in range(self.SendScintilla(self.SCI_GETSELECTIONS))
+        ]
+
+    def set_selections(self, selections, main=0):
+        """
+        Select the ``(anchor, caret)`` pairs. SCI_ADDSELECTION takes time
+        proportional to the number of selections, so existing ones are moved
+        instead, and new ones come from a rectangular selection, which
+        Scintilla builds a line at a time.
+        """
+        if self.SendScintilla(self.SCI_GETSELECTIONS) != len(selections):
+            lines = min(len(selections), self.lines())
+            self.SendScintilla(self.SCI_SETSELECTION, 0, 0)
+            if lines > 1:
+                last = self.SendScintilla(self.SCI_POSITIONFROMLINE, lines - 1)
+                self.SendScintilla(self.SCI_SETRECTANGULARSELECTIONANCHOR, 0)
+                self.SendScintilla(self.SCI_SETRECTANGULARSELECTIONCARET, last)
+                # Back to a stream selection, the second call turns off the
+                # "movement extends the selection" mode the first one enables
+                self.SendScintilla(self.SCI_SETSELECTIONMODE, self.SC_SEL_STREAM)
+                self.SendScintilla(self.SCI_SETSELECTIONMODE, self.SC_SEL_STREAM)
+            # More carets than lines
+            for anchor, caret in selections[lines:]:
+                self.SendScintilla(self.SCI_ADDSELECTION, caret, anchor)
+        for i, (anchor, caret) in enumerate(selections):
+            self.SendScintilla(self.SCI_SETSELECTIONNCARET, i, caret)
+            self.SendScintilla(self.SCI_SETSELECTIONNANCHOR, i, anchor)
+        self.SendScintilla(self.SCI_SETMAINSELECTION, main)
+
+    def replace_range(self, start, end, text):
+        """Replace ``start:end`` with the bytes ``text`` as one undo action."""
+        self.replace_ranges([(start, end, text)])
+
+    def replace_ranges(self, edits):
+        """
+        Make the ``(start, end, text)`` replacements in order as one undo
+        action. Ordered last first, the offsets all refer to the text as it
+        was.
+
+        Only the before-change notifications are sent, QScintilla spends
+        time proportional to the position on each insert or delete one.
+        The lexer is told directly instead.
+        """
+        if not edits:
+            return
+        mask = self.SendScintilla(self.SCI_GETMODEVENTMASK)
+        self.SendScintilla(
+            self.SCI_SETMODEVENTMASK,
+            self.SC_MOD_BEFOREINSERT | self.SC_MOD_BEFOREDELETE,
+        )
+        try:
+            self.SendScintilla(self.SCI_BEGINUNDOACTION)
+            for start, end, text in edits:
+                self.SendScintilla(self.SCI_SETTARGETRANGE, start, end)
+                self.SendScintilla(self.SCI_REPLACETARGET, len(text), text)
+                self.replaced.emit(start, end, text)
+            self.SendScintilla(self.SCI_ENDUNDOACTION)
+        finally:
+            self.SendScintilla(self.SCI_SETMODEVENTMASK, mask)
+        if self.lexer is not None:
+            self.lexer.invalidate(min(edit[0] for edit in edits))
+
+    def bulk_edit(self, edits):
+        """
+        Make many edits as one: a single undo action and a single restyle.
+
+        ``edits`` are ``(start, end, text, anchor, caret)``, replacing
+        ``start:end`` with the bytes ``text`` and leaving a selection from
+        ``anchor`` to ``caret``, offsets into ``text``. Each goes through
+        ``replace_ranges``, the text between them isn't touched.
+        """
+        if not edits:
+            return
+        edits = sorted(edits, key=lambda edit: edit[0])
+        replacements = []
+        selections = []
+        # End of the last edit, and how far the edits so far moved the text
+        position = shift = 0
+        for start, end, text, anchor, caret in edits:
+            # Overlapping edits, e.g. two carets deleting the same character
+            start = max(start, position)
+            end = max(end, start)
+            if text or end > start:
+                replacements.append((start, end, text))
+            selections.append((start + shift + anchor, start + shift + caret))
+            shift += len(text) - (end - start)
+            position = end
+        replacements.reverse()
+        if len(selections) > MAX_MOVED_SELECTIONS:
+            self.SendScintilla(self.SCI_SETSELECTION, 0, 0)
+        self.replace_ranges(replacements)
+        self.set_selections(selections)
+
+    def insert_at_carets(self, text):
+        """Type ``text`` at every caret, replacing the selections."""
+        data = text.encode()
+        n = len(data)
+        self.bulk_edit([(min(sel), max(sel), data, n, n) for sel in self.selections()])
+
+    def delete_at_carets(self, forward=False):
+        """Backspace (or Delete) at every caret, or delete the selections."""
+        edits = []
+        for anchor, caret in self.selections():
+            start, end = sorted((anchor, caret))
+            if start == end:
+                if forward:
+                    end = self.SendScintilla(self.SCI_POSITIONAFTER, caret)
+                else:
+                    start = self.SendScintilla(self.SCI_POSITIONBEFORE, caret)
+            edits.append((start, end, b"", 0, 0))
+        self.bulk_edit(edits)
+
+    def transform_selections(self, transform):
+        """Replace the text of every selection with ``transform(text)``."""
+        edits = []
+        for anchor, caret in self.selections():
+            start, end = sorted((anchor, caret))
+            text = self.text_range(start, end).decode("utf-8", "surrogateescape")
+            text = transform(text).encode("utf-8", "surrogateescape")
+            if anchor <= caret:
+                edits.append((start, end, text, 0, len(text)))
+            else:
+                edits.append((start, end, text, len(text), 0))
+        self.bulk_edit(edits)
+
+    def select_all_occurrences(self):
+        """
+        Select every occurrence of the main selection, or of the word at
+        the caret when nothing is selected.
+        """
+        start = self.SendScintilla(self.SCI_GETSELECTIONSTART)
+        end = self.SendScintilla(self.SCI_GETSELECTIONEND)
+        if start == end:
+            start = self.SendScintilla(self.SCI_WORDSTARTPOSITION, start, True)
+            end = self.SendScintilla(self.SCI_WORDENDPOSITION, end, True)
+            if start == end:
+                return
+            # Whole words only, Scintilla counts non-ASCII as word characters
+            word = re.escape(self.text_range(start, end))
+            pattern = rb"(?<![\w\x80-\xff])" + word + rb"(?![\w\x80-\xff])"
+        else:
+            pattern = re.escape(self.text_range(start, end))
+        pointer = self.SendScintillaPtrResult(self.SCI_GETCHARACTERPOINTER)
+        pointer.setsize(self.length())
+        spans = [match.span() for match in re.finditer(pattern, memoryview(pointer))]
+        main = spans.index((start, end)) if (start, end) in spans else 0
+        self.set_selections(spans, main)
+        self.SendScintilla(self.SCI_SCROLLCARET)
+
+    def keyPressEvent(self, event):
+        if (
+            self.SendScintilla(self.SCI_GETSELECTIONS) >= BULK_SELECTIONS
+            and not self.isReadOnly()
+        ):
+            key = event.key()
+            text = event.text()
+            if key == Qt.Key_Backspace:
+                self.delete_at_carets()
+                return
+            if key == Qt.Key_Delete:
+                self.delete_at_carets(forward=True)
+                return
+            if (
+                text
+                and text.isprintable()
+                and not event.modifiers() & (Qt.ControlModifier | Qt.AltModifier)
+            ):
+                self.insert_at_carets(text)
+                return
+        super().keyPressEvent(event)
 
     def get_line_separator(self):
         m = self.eolMode()
@@ -188,35 +346,36 @@ class View(QsciScintilla):
         self.setIndentationGuidesForegroundColor(QColor(0, 255, 0, 0))
 
         if "caret" in dct:
-            self.setCaretForegroundColor(QColor(dct["caret"]))
+            self.setCaretForegroundColor(dct.color("caret"))
 
         if "line_highlight" in dct:
-            self.setCaretLineBackgroundColor(QColor(dct["line_highlight"]))
+            self.setCaretLineBackgroundColor(dct.color("line_highlight"))
 
         if "brackets_background" in dct:
-            self.setMatchedBraceBackgroundColor(QColor(dct["brackets_background"]))
+            self.setMatchedBraceBackgroundColor(dct.color("brackets_background"))
 
         if "brackets_foreground" in dct:
-            self.setMatchedBraceForegroundColor(QColor(dct["brackets_foreground"]))
+            self.setMatchedBraceForegroundColor(dct.color("brackets_foreground"))
 
         if "selection" in dct:
-            self.setSelectionBackgroundColor(QColor(dct["selection"]))
+            self.setSelectionBackgroundColor(dct.color("selection"))
 
         if "background" in dct:
-            c = QColor(dct["background"])
+            c = dct.color("background")
             self.resetFoldMarginColors()
             self.setFoldMarginColors(c, c)
 
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    view = View("python", "monokai")
+    view = View("python", "monokai", lazy_margin=100, threaded=True)
+    view.setText("Hello")
     # view.setText(textwrap.dedent("""\
     #     '''
     #     Ctrl+1 = You'll decrease the size of existing text
     #     Ctrl+2 = You'll increase the size of existing text
 
-    #     Warning: Check the window title to see how long it takes rehighlighting
+    #     Warning: Check METRICS.snapshot() to see how long it takes rehighlighting
     #     '''
     # """))
     view.resize(800, 600)
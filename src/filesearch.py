@@ -0,0 +1,387 @@
+"""
+Find in Files: a pattern searched across the workspace by a pool of
+processes.
+
+The workspace index narrows the search to the files that can match.
+They are split into batches of up to half a megabyte and each batch is
+searched by a worker process, so a search keeps every core busy while
+the GUI thread only adds results. Batches finish in any order but their
+results are passed on in path order.
+
+Results are paged. Once a page of hits is in, no more batches are sent
+until the next page is asked for, so a query matching everywhere doesn't
+fill memory with hits no one scrolls to.
+"""
+
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from PyQt5.QtWidgets import (
+    QCheckBox,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QPushButton,
+    QTreeWidget,
+    QTreeWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+from search import compile_pattern
+from workspace import BINARY_SNIFF, required_literals
+
+# A batch is sent once it has this many bytes or files. Small enough that
+# a page isn't overshot by much
+BATCH_SIZE = 512 * 1024
+BATCH_FILES = 64
+# Hits per page of results
+PAGE_SIZE = 1000
+# Hits reported per file, and characters shown of a hit's line
+MAX_FILE_HITS = 100
+MAX_LINE_LENGTH = 200
+
+# Worker processes, started on the first search
+POOL = None
+
+
+def get_pool():
+    global POOL
+    if POOL is None:
+        # Forking a process with Qt's threads running isn't safe, spawn
+        context = multiprocessing.get_context("spawn")
+        POOL = ProcessPoolExecutor(os.cpu_count(), mp_context=context)
+    return POOL
+
+
+def shutdown_pool():
+    global POOL
+    if POOL is not None:
+        POOL.shutdown(wait=False, cancel_futures=True)
+        POOL = None
+
+
+def search_batch(root, paths, pattern):
+    """
+    Search the files at ``paths`` under ``root``, in a worker process.
+    ``[(path, [(line, column, length, text), ...]), ...]`` for the files
+    with matches, lines counted from 0 and columns in bytes.
+    """
+    results = []
+    for path in paths:
+        try:
+            with open(os.path.join(root, path), "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        if b"\0" in data[:BINARY_SNIFF]:
+            # Binary since it was indexed
+            continue
+        hits = []
+        line = 0
+        counted = 0
+        for match in pattern.finditer(data):
+            start, end = match.span()
+            if start == end:
+                # Nothing to select, e.g. a lone ^
+                continue
+            line += data.count(b"\n", counted, start)
+            counted = start
+            line_start = data.rfind(b"\n", 0, start) + 1
+            line_end = data.find(b"\n", start)
+            if line_end < 0:
+                line_end = len(data)
+            text = data[line_start : min(line_end, line_start + MAX_LINE_LENGTH)]
+            text = text.decode("utf-8", "replace").rstrip("\r")
+            hits.append((line, start - line_start, end - start, text))
+            if len(hits) == MAX_FILE_HITS:
+                break
+        if hits:
+            results.append((path, hits))
+    return results
+
+
+class FileSearch(QObject):
+    """
+    One Find in Files run over a Workspace.
+
+    ``found`` gets the hits of each batch with any. ``paused`` means a
+    page is full, ``more()`` carries on. ``finished`` comes once every
+    file was searched, nothing comes after ``cancel()``. Started before
+    the workspace's first scan finished, the index would leave files out:
+    ``waiting`` comes and the search starts once the scan is done.
+    """
+
+    found = pyqtSignal(object)
+    waiting = pyqtSignal()
+    # Files searched, files to search
+    progress = pyqtSignal(int, int)
+    paused = pyqtSignal(int)
+    finished = pyqtSignal(int)
+    # From the pool's thread, handled on the GUI thread
+    batch_done = pyqtSignal(int, object)
+
+    def __init__(self, workspace, pattern, literals, parent=None, page_size=PAGE_SIZE):
+        super().__init__(parent)
+        self.workspace = workspace
+        self.pattern = pattern
+        self.literals = literals
+        self.page_size = page_size
+        self.limit = page_size
+        self.batches = []
+        self.total = 0
+        # Batches sent, passed on, and done out of order
+        self.next_batch = 0
+        self.next_result = 0
+        self.results = {}
+        self.futures = {}
+        self.searched = 0
+        self.hits = 0
+        self.started = False
+        self.cancelled = False
+        self.batch_done.connect(self.on_batch_done)
+
+    def start(self):
+        workspace = self.workspace
+        # Connected first, the scan may end on its thread while this looks
+        workspace.finished.connect(self.on_scanned)
+        if workspace.scanned:
+            self.on_scanned()
+        else:
+            self.waiting.emit()
+
+    def on_scanned(self):
+        if self.cancelled or self.started or not self.workspace.scanned:
+            return
+        self.started = True
+        self.disconnect_workspace()
+        files = self.workspace.candidates(self.literals)
+        self.total = len(files)
+        batch, size = [], 0
+        for path, file_size in files:
+            batch.append(path)
+            size += file_size
+            if size >= BATCH_SIZE or len(batch) == BATCH_FILES:
+                self.batches.append(batch)
+                batch, size = [], 0
+        if batch:
+            self.batches.append(batch)
+        self.submit()
+
+    def more(self):
+        self.limit = self.hits + self.page_size
+        self.submit()
+
+    def cancel(self):
+        self.cancelled = True
+        self.disconnect_workspace()
+        for future in self.futures.values():
+            future.cancel()
+        self.futures.clear()
+
+    def disconnect_workspace(self):
+        try:
+            self.workspace.finished.disconnect(self.on_scanned)
+        except (RuntimeError, TypeError):
+            # Not connected any more, or the workspace is gone
+            pass
+
+    def submit(self):
+        # Enough batches queued that no worker waits for the GUI thread
+        window = 2 * (os.cpu_count() or 1)
+        while (
+            not self.cancelled
+            and self.hits < self.limit
+            and self.next_batch < len(self.batches)
+            and len(self.futures) < window
+        ):
+            index = self.next_batch
+            args = (
+                search_batch,
+                self.workspace.root,
+                self.batches[index],
+                self.pattern,
+            )
+            try:
+                future = get_pool().submit(*args)
+            except BrokenProcessPool:
+                # A worker died, start over with a new pool
+                shutdown_pool()
+                future = get_pool().submit(*args)
+            self.next_batch += 1
+            self.futures[index] = future
+            future.add_done_callback(partial(self.on_future_done, index))
+        if self.cancelled or self.futures:
+            return
+        if self.next_batch < len(self.batches):
+            self.paused.emit(self.hits)
+        else:
+            self.finished.emit(self.hits)
+
+    def on_future_done(self, index, future):
+        if future.cancelled():
+            return
+        try:
+            results = future.result()
+        except (BrokenProcessPool, OSError):
+            results = []
+        try:
+            self.batch_done.emit(index, results)
+        except RuntimeError:
+            # Deleted along with its panel
+            pass
+
+    def on_batch_done(self, index, results):
+        if self.cancelled:
+            return
+        del self.futures[index]
+        self.results[index] = results
+        while self.next_result in self.results:
+            results = self.results.pop(self.next_result)
+            self.searched += len(self.batches[self.next_result])
+            self.next_result += 1
+            if results:
+                self.hits += sum(len(hits) for _, hits in results)
+                self.found.emit(results)
+        self.progress.emit(self.searched, self.total)
+        self.submit()
+
+
+class FindInFiles(QWidget):
+    """The Find in Files panel: query, options and the hits grouped by file."""
+
+    # Path relative to the workspace, line, column and length of a hit
+    activated = pyqtSignal(str, int, int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.workspace = None
+        self.search = None
+        self.files = 0
+
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Find in files")
+        self.query.returnPressed.connect(self.start)
+        self.case = QCheckBox("Aa")
+        self.case.setToolTip("Match case")
+        self.word = QCheckBox("Word")
+        self.word.setToolTip("Whole words only")
+        self.regex = QCheckBox(".*")
+        self.regex.setToolTip("Regular expression")
+        self.find = QPushButton("Find")
+        self.find.clicked.connect(self.start)
+        self.stop = QPushButton("Stop")
+        self.stop.clicked.connect(self.cancel)
+        self.stop.setEnabled(False)
+        self.more = QPushButton("More results")
+        self.more.clicked.connect(self.next_page)
+        self.more.hide()
+        self.status = QLabel()
+        self.results = QTreeWidget()
+        self.results.setHeaderHidden(True)
+        self.results.setUniformRowHeights(True)
+        self.results.itemActivated.connect(self.open_item)
+
+        row = QHBoxLayout()
+        for widget in (self.query, self.case, self.word, self.regex, self.find):
+            row.addWidget(widget)
+        row.addWidget(self.stop)
+        footer = QHBoxLayout()
+        footer.addWidget(self.status, 1)
+        footer.addWidget(self.more)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addLayout(row)
+        layout.addWidget(self.results)
+        layout.addLayout(footer)
+
+    def set_workspace(self, workspace):
+        if workspace is not self.workspace:
+            self.cancel()
+            self.results.clear()
+            self.status.clear()
+            self.workspace = workspace
+
+    def start(self):
+        self.cancel()
+        self.results.clear()
+        self.more.hide()
+        self.files = 0
+        text = self.query.text()
+        if not text or self.workspace is None:
+            return
+        regex = self.regex.isChecked()
+        try:
+            pattern = compile_pattern(
+                text, regex, self.case.isChecked(), self.word.isChecked()
+            )
+        except re.error as e:
+            self.status.setText(str(e))
+            return
+        self.search = FileSearch(
+            self.workspace, pattern, required_literals(text, regex), self
+        )
+        self.search.found.connect(self.add_results)
+        self.search.waiting.connect(self.on_waiting)
+        self.search.progress.connect(self.show_progress)
+        self.search.paused.connect(self.on_paused)
+        self.search.finished.connect(self.on_finished)
+        self.stop.setEnabled(True)
+        self.status.setText("Searching")
+        self.search.start()
+
+    def cancel(self):
+        if self.search is not None:
+            if self.stop.isEnabled():
+                self.status.setText("Stopped")
+            self.search.cancel()
+            self.search.deleteLater()
+            self.search = None
+        self.stop.setEnabled(False)
+
+    def next_page(self):
+        if self.search is not None:
+            self.more.hide()
+            self.stop.setEnabled(True)
+            self.search.more()
+
+    def add_results(self, results):
+        items = []
+        for path, hits in results:
+            item = QTreeWidgetItem([f"{path} ({len(hits)})"])
+            for line, column, length, text in hits:
+                child = QTreeWidgetItem(item, [f"{line + 1}: {text.strip()}"])
+                child.setData(0, Qt.UserRole, (path, line, column, length))
+            items.append(item)
+        self.files += len(items)
+        self.results.addTopLevelItems(items)
+        for item in items:
+            item.setExpanded(True)
+
+    def show_progress(self, searched, total):
+        hits = self.search.hits
+        self.status.setText(
+            f"{hits} matches in {self.files} files, {searched} of {total} searched"
+        )
+
+    def on_waiting(self):
+        self.status.setText("Indexing the workspace, the search starts once it's done")
+
+    def on_paused(self, hits):
+        self.stop.setEnabled(False)
+        self.more.show()
+        self.status.setText(f"First {hits} matches in {self.files} files")
+
+    def on_finished(self, hits):
+        self.stop.setEnabled(False)
+        self.status.setText(f"{hits} matches in {self.files} files")
+
+    def open_item(self, item):
+        location = item.data(0, Qt.UserRole)
+        if location is not None:
+            self.activated.emit(*location)
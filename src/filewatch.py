@@ -0,0 +1,334 @@
+"""
+Open files changed by other programs, brought into their Views.
+
+QFileSystemWatcher (inotify on Linux) reports the changes. A Reload
+compares the file with the buffer on a worker thread, line by line, and
+the GUI thread replaces only the lines that differ. Unlike setText this
+keeps the undo history, the carets and the scroll position, and the
+lexer restyles from the first changed line on. Appending to a log costs
+as much as the appended lines.
+"""
+
+import os
+import threading
+from itertools import accumulate
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QThreadPool, QTimer, pyqtSignal
+
+from stylecache import MIN_DOCUMENT_SIZE, content_digest
+
+# Milliseconds to wait for more changes, writers often take several writes
+DELAY = 100
+# Bytes compared at once while looking for the first difference
+BLOCK_SIZE = 64 * 1024
+# Changed lines past which the lines between the first and the last
+# change are replaced as a whole, as a rewrite would be
+MAX_CHANGES = 500
+
+
+def stat_key(st):
+    """What tells two versions of a file apart without reading them."""
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def common_prefix(a, b):
+    """Length of the longest common prefix of the bytes ``a`` and ``b``."""
+    # startswith compares a memoryview without copying it
+    a = memoryview(a)
+    n = min(len(a), len(b))
+    start = 0
+    block = BLOCK_SIZE
+    while block:
+        end = min(start + block, n)
+        if b.startswith(a[start:end], start):
+            if end == n:
+                return n
+            start = end
+        else:
+            # The difference is in this block, halve it
+            block //= 2
+    return start
+
+
+def common_suffix(a, b, limit):
+    """Length of the longest common suffix of ``a`` and ``b``, up to ``limit``."""
+    a = memoryview(a)
+    end = 0
+    block = BLOCK_SIZE
+    while block:
+        start = min(end + block, limit)
+        if b.endswith(a[len(a) - start : len(a) - end], 0, len(b) - end):
+            if start == limit:
+                return limit
+            end = start
+        else:
+            block //= 2
+    return end
+
+
+def match_length(a, i, b, j):
+    """How many items of the lists ``a`` and ``b`` are equal from ``a[i]`` and ``b[j]`` on."""
+    n = min(len(a) - i, len(b) - j)
+    length = 0
+    step = 8
+    while step:
+        end = min(length + step, n)
+        if a[i + length : i + end] == b[j + length : j + end]:
+            if end == n:
+                return n
+            length = end
+            step *= 2
+        else:
+            step //= 2
+    return length
+
+
+def diff_sequences(a, b, max_changes=MAX_CHANGES):
+    """
+    Myers' diff of the lists ``a`` and ``b``: ``(i1, i2, j1, j2)`` when
+    ``a[i1:i2]`` becomes ``b[j1:j2]``, in order. None if more than
+    ``max_changes`` items are inserted or deleted.
+
+    Takes time proportional to the changes squared, the runs of equal
+    items between them are skipped by comparing slices.
+    """
+    n, m = len(a), len(b)
+    # Furthest x reached on each diagonal k = x - y, one copy per edit count
+    v = {1: 0}
+    trace = []
+    for d in range(max_changes + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[k - 1] < v[k + 1]):
+                x = v[k + 1]
+            else:
+                x = v[k - 1] + 1
+            y = x - k
+            if x < n and y < m:
+                x += match_length(a, x, b, y)
+            v[k] = x
+            if x >= n and x - k >= m:
+                return backtrack(trace, n, m)
+        trace.append(dict(v))
+    return None
+
+
+def backtrack(trace, x, y):
+    """The spans of ``diff_sequences``, walking its ``trace`` back from ``(x, y)``."""
+    # (x, y, inserted): b[y] inserted before a[x], else a[x] deleted
+    steps = []
+    for d in range(len(trace), 0, -1):
+        v = trace[d - 1]
+        k = x - y
+        if k == -d or (k != d and v[k - 1] < v[k + 1]):
+            k += 1
+            x = v[k]
+            steps.append((x, x - k, True))
+        else:
+            k -= 1
+            x = v[k]
+            steps.append((x, x - k, False))
+        y = x - k
+    spans = []
+    for x, y, inserted in reversed(steps):
+        if spans and spans[-1][1] == x and spans[-1][3] == y:
+            span = spans[-1]
+        else:
+            span = [x, x, y, y]
+            spans.append(span)
+        if inserted:
+            span[3] += 1
+        else:
+            span[1] += 1
+    return spans
+
+
+def line_diff(old, new):
+    """
+    The ``(start, end, text)`` replacements turning the bytes ``old`` into
+    ``new``, offsets into ``old``, last first.
+
+    The common start and end are skipped with block compares, the lines
+    in between are diffed. Lines are compared as bytes objects, whole
+    runs of them at once, so they needn't be hashed into a table first.
+    """
+    prefix = common_prefix(old, new)
+    if prefix == len(old) == len(new):
+        return []
+    # Whole lines, a changed line is replaced rather than spliced
+    prefix = old.rfind(b"\n", 0, prefix) + 1
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+    end = len(old) - suffix
+    if end > prefix and old[end - 1] != ord("\n"):
+        end = old.find(b"\n", end) + 1 or len(old)
+    suffix = len(old) - end
+    old_lines = old[prefix:end].splitlines(True)
+    new_lines = new[prefix : len(new) - suffix].splitlines(True)
+    spans = None
+    if old_lines and new_lines:
+        spans = diff_sequences(old_lines, new_lines)
+    if spans is None:
+        return [(prefix, end, b"".join(new_lines))]
+
+    # Offsets of the lines, with the end of the last one
+    offsets = list(accumulate(map(len, old_lines), initial=prefix))
+    return [
+        (offsets[i1], offsets[i2], b"".join(new_lines[j1:j2]))
+        for i1, i2, j1, j2 in reversed(spans)
+    ]
+
+
+class FileWatcher(QObject):
+    """
+    ``changed`` gets the absolute path of a watched file that may have
+    changed, once its writer paused for ``delay`` milliseconds.
+
+    A file replaced by a rename or deleted and written again stops being
+    watched by the system, so the directories are watched too and the
+    file is watched again when it shows up.
+    """
+
+    changed = pyqtSignal(str)
+
+    def __init__(self, parent=None, delay=DELAY):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_changed)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.paths = set()
+        self.pending = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+
+    def set_paths(self, paths):
+        """Watch exactly the files at ``paths``."""
+        paths = {os.path.abspath(path) for path in paths}
+        directories = {os.path.dirname(path) for path in paths}
+        old_directories = {os.path.dirname(path) for path in self.paths}
+        removed = [path for path in self.paths - paths if path in self.watched()]
+        removed += old_directories - directories
+        if removed:
+            self.watcher.removePaths(removed)
+        added = [path for path in paths - self.paths if os.path.exists(path)]
+        added += [path for path in directories - old_directories if os.path.isdir(path)]
+        if added:
+            self.watcher.addPaths(added)
+        self.paths = paths
+        self.pending &= paths
+
+    def watched(self):
+        return set(self.watcher.files())
+
+    def on_changed(self, path):
+        self.pending.add(path)
+        self.timer.start()
+
+    def on_directory_changed(self, directory):
+        self.pending.update(
+            path for path in self.paths if os.path.dirname(path) == directory
+        )
+        self.timer.start()
+
+    def flush(self):
+        watched = self.watched()
+        pending, self.pending = self.pending, set()
+        for path in sorted(pending & self.paths):
+            if path not in watched and os.path.exists(path):
+                self.watcher.addPath(path)
+            self.changed.emit(path)
+
+
+class ReloadCancelled(Exception):
+    pass
+
+
+class Reload(QObject):
+    """
+    Diffs the file at ``path`` against a View's buffer on a worker thread.
+
+    ``finished`` gets ``(edits, state, digest, lossy)``: the replacements
+    for ``View.replace_ranges``, the ``stat_key`` of the file read, its
+    hash for the style cache, None unless ``hash_content``, and whether
+    it wasn't valid UTF-8 (see FileLoader). An edit to
+    the buffer while the worker runs cancels the reload, ``finished``
+    then comes with ``cancelled`` set, its result None if nothing was
+    diffed.
+    """
+
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, view, path, parent=None, hash_content=False):
+        super().__init__(parent)
+        self.view = view
+        self.path = path
+        self.hash_content = hash_content
+        self.size = view.length()
+        self.before_change = view.SC_MOD_BEFOREINSERT | view.SC_MOD_BEFOREDELETE
+        self.data = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.finished.connect(self.close)
+        self.failed.connect(self.close)
+
+    def start(self):
+        view = self.view
+        # Moves the gap to the end, the pointer stays valid until the next edit
+        pointer = view.SendScintillaPtrResult(view.SCI_GETCHARACTERPOINTER)
+        pointer.setsize(self.size)
+        self.data = memoryview(pointer).toreadonly()
+        view.SCN_MODIFIED.connect(self.on_modified)
+        QThreadPool.globalInstance().start(self.run)
+
+    def on_modified(self, position, modification_type, *args):
+        if modification_type & self.before_change:
+            self.cancel()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            self.data = None
+
+    def close(self):
+        try:
+            self.view.SCN_MODIFIED.disconnect(self.on_modified)
+        except (RuntimeError, TypeError):
+            # The view is gone or was never connected
+            pass
+
+    def run(self):
+        try:
+            signal, value = self.finished, self.diff()
+        except ReloadCancelled:
+            # Still finished, the document sees ``cancelled`` and looks again
+            signal, value = self.finished, None
+        except OSError as e:
+            signal, value = self.failed, f"{self.path}: {e.strerror or e}"
+        try:
+            signal.emit(value)
+        except RuntimeError:
+            # Deleted along with its document
+            pass
+
+    def diff(self):
+        with open(self.path, "rb") as f:
+            state = stat_key(os.fstat(f.fileno()))
+            data = f.read()
+        digest = None
+        if self.hash_content and len(data) >= MIN_DOCUMENT_SIZE:
+            digest = content_digest(data)
+        # As FileLoader puts it in the view, invalid UTF-8 replaced
+        try:
+            data.decode("utf-8")
+            new, lossy = data, False
+        except UnicodeDecodeError:
+            new, lossy = data.decode("utf-8", "replace").encode("utf-8"), True
+        del data
+        with self.lock:
+            if self.cancelled:
+                raise ReloadCancelled
+            old = bytes(self.data)
+            # Copied, the buffer may change freely
+            self.data = None
+        return line_diff(old, new), state, digest, lossy
@@ -0,0 +1,159 @@
+"""
+.gitignore matching for workspace scans.
+
+Patterns follow gitignore(5): ``#`` comments, ``!`` to include again,
+a trailing ``/`` for directories only, a ``/`` at the start or in the
+middle to anchor the pattern to the .gitignore's directory, and ``*``,
+``?``, ``[...]`` and ``**`` globs. The last matching pattern of a file
+wins, and the .gitignore closest to a path wins over those above it.
+Like git, nothing inside an ignored directory is looked at again.
+"""
+
+import os
+import re
+
+NAME = ".gitignore"
+
+
+def translate(pattern):
+    """A regex for the glob ``pattern``, matched against whole relative paths."""
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == "*":
+            if pattern.startswith("*", i):
+                i += 1
+                if pattern.startswith("/", i):
+                    # "**/" matches zero or more directories
+                    i += 1
+                    parts.append("(?:.*/)?")
+                else:
+                    parts.append(".*")
+            else:
+                parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 1)
+            if end < 0:
+                parts.append(re.escape(char))
+                continue
+            members = pattern[i:end]
+            if members.startswith("!"):
+                members = "^" + members[1:]
+            parts.append(f"[{members}]")
+            i = end + 1
+        elif char == "\\" and i < len(pattern):
+            parts.append(re.escape(pattern[i]))
+            i += 1
+        else:
+            parts.append(re.escape(char))
+    prefix = "" if anchored else "(?:.*/)?"
+    return re.compile(prefix + "".join(parts) + r"\Z", re.DOTALL)
+
+
+class IgnoreRules:
+    """The patterns of one .gitignore, for paths relative to its directory."""
+
+    def __init__(self, lines, base=""):
+        # "" for the root, else the directory with a trailing "/"
+        self.base = base
+        self.rules = []
+        for line in lines:
+            line = line.rstrip("\n\r")
+            if not line.strip() or line.startswith("#"):
+                continue
+            if not line.endswith("\\ "):
+                line = line.rstrip(" ")
+            negated = line.startswith("!")
+            if negated or line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            directory_only = line.endswith("/")
+            line = line.rstrip("/")
+            if line:
+                self.rules.append((translate(line), negated, directory_only))
+        # Without "!" patterns order doesn't matter, one regex does
+        self.combined = None
+        if not any(negated for _, negated, _ in self.rules):
+            self.combined = tuple(
+                self.join([rule for rule in self.rules if rule[2] == directory_only])
+                for directory_only in (False, True)
+            )
+
+    @staticmethod
+    def join(rules):
+        if not rules:
+            return None
+        return re.compile("|".join(f"(?:{rule[0].pattern})" for rule in rules), re.S)
+
+    @classmethod
+    def read(cls, path, base=""):
+        """The rules in the file at ``path``, None if there is none."""
+        try:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                return cls(f, base)
+        except OSError:
+            return None
+
+    def match(self, path, is_dir):
+        """
+        True if ``path`` (relative to the workspace, ``/`` separated) is
+        ignored, False if it's included again, None if no pattern matches.
+        """
+        if not path.startswith(self.base):
+            return None
+        path = path[len(self.base) :]
+        if self.combined is not None:
+            files, directories = self.combined
+            if files is not None and files.match(path):
+                return True
+            if is_dir and directories is not None and directories.match(path):
+                return True
+            return None
+        for regex, negated, directory_only in reversed(self.rules):
+            if (is_dir or not directory_only) and regex.match(path):
+                return not negated
+        return None
+
+
+def is_ignored(chain, path, is_dir):
+    """Whether ``path`` is ignored by the IgnoreRules in ``chain``, outermost first."""
+    for rules in reversed(chain):
+        ignored = rules.match(path, is_dir)
+        if ignored is not None:
+            return ignored
+    return False
+
+
+def rules_for(root, directory):
+    """
+    The chain of IgnoreRules that applies inside ``directory``, given
+    relative to ``root`` (``""`` for the root itself).
+    """
+    chain = []
+    exclude = IgnoreRules.read(os.path.join(root, ".git", "info", "exclude"))
+    if exclude is not None:
+        chain.append(exclude)
+    base = ""
+    for name in [""] + [part for part in directory.split("/") if part]:
+        base = f"{base}{name}/" if name else ""
+        rules = IgnoreRules.read(os.path.join(root, *base.split("/"), NAME), base)
+        if rules is not None:
+            chain.append(rules)
+    return chain
+
+
+def is_path_ignored(root, path):
+    """Whether ``path`` or any directory above it is ignored, for one-off checks."""
+    parts = path.split("/")
+    for depth in range(1, len(parts) + 1):
+        parent = "/".join(parts[: depth - 1])
+        if is_ignored(
+            rules_for(root, parent), "/".join(parts[:depth]), depth < len(parts)
+        ):
+            return True
+    return False
@@ -0,0 +1,803 @@
+"""
+Pygments highlighting for View: the ViewLexer and the machinery behind it.
+
+Kept apart from editor.py so plain text views never import Pygments.
+"""
+
+import ctypes
+import re
+import time
+from array import array
+from collections import defaultdict
+
+from PyQt5 import sip
+from PyQt5.Qsci import QsciLexerCustom, QsciScintilla
+from PyQt5.QtCore import QThreadPool, pyqtSignal
+from PyQt5.QtGui import QColor, QFont
+
+import pygments
+from pygments import lexers, styles
+from pygments.lexer import Error, Text, _TokenType
+from pygments.token import Token
+
+from completion import IdentifierIndex, group_words
+from metrics import METRICS
+from theme import THEMES
+
+# Rules that can't be merged into one alternation (group references)
+GROUP_REFERENCE = re.compile(r"\\\d|\(\?P=|\(\?\(")
+INLINE_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+FLAG_LETTERS = {
+    "a": re.A,
+    "i": re.I,
+    "L": re.L,
+    "m": re.M,
+    "s": re.S,
+    "u": re.U,
+    "x": re.X,
+}
+# Combined regex tables per Pygments lexer name
+COMBINED_STATES = {}
+# Resolved style tables per (style name, font)
+STYLE_TABLES = {}
+
+# Single style bytes, repeated to fill a token's style buffer
+STYLE_BYTES = [bytes((i,)) for i in range(256)]
+# Bytes per SCI_GETSTYLEDTEXT call when reading styles back
+READ_CHUNK = 1024 * 1024
+
+# Fold data per line: the bracket depth at the line start in the high 16
+# bits, the Scintilla fold level with its flags in the low 16
+FOLD_LEVEL = 0xFFFF
+FOLD_DEPTH_SHIFT = 16
+MAX_DEPTH = 0xFFFF
+MAX_FOLD_NUMBER = QsciScintilla.SC_FOLDLEVELNUMBERMASK - QsciScintilla.SC_FOLDLEVELBASE
+LEADING_WHITESPACE = re.compile(r"[ \t]*")
+# Bracket depth change per punctuation/operator token value
+BRACKET_DELTAS = {}
+
+
+class TextRange(ctypes.Structure):
+    # Sci_TextRange
+    _fields_ = [
+        ("cpMin", ctypes.c_long),
+        ("cpMax", ctypes.c_long),
+        ("lpstrText", ctypes.c_char_p),
+    ]
+
+
+def read_styles(view, start, end):
+    """The style bytes of ``view`` between two positions."""
+    styles = bytearray()
+    # SCI_GETSTYLEDTEXT interleaves characters and styles, plus two NULs
+    buf = ctypes.create_string_buffer(2 * READ_CHUNK + 2)
+    text_range = TextRange(0, 0, ctypes.cast(buf, ctypes.c_char_p))
+    pointer = sip.voidptr(ctypes.addressof(text_range))
+    styled = memoryview(buf).cast("B")
+    for pos in range(start, end, READ_CHUNK):
+        text_range.cpMin = pos
+        text_range.cpMax = min(pos + READ_CHUNK, end)
+        view.SendScintilla(view.SCI_GETSTYLEDTEXT, 0, pointer)
+        styles += styled[1 : 2 * (text_range.cpMax - pos) : 2].tobytes()
+    return bytes(styles)
+
+
+class CombinedStates(dict):
+    """
+    Maps a lexer state to ``(match, rules)`` where ``match`` tries all of
+    the state's rules as one alternation and ``rules[m.lastindex]`` is the
+    rule that matched, or to None when the rules can't be combined.
+    Tables are built the first time a state is entered.
+    """
+
+    def __init__(self, tokendefs):
+        super().__init__()
+        self.tokendefs = tokendefs
+
+    def __missing__(self, state):
+        table = self[state] = combine_rules(self.tokendefs[state])
+        return table
+
+
+def combine_rules(rules):
+    parts = []
+    table = [None]
+    flags = set()
+    for rule in rules:
+        regex = getattr(rule[0], "__self__", None)
+        if not isinstance(regex, re.Pattern) or GROUP_REFERENCE.search(regex.pattern):
+            return None
+        pattern, scoped = regex.pattern, 0
+        inline = INLINE_FLAGS.match(pattern)
+        if inline:
+            # Leading global flags only apply to their own alternative
+            pattern = f"(?{inline.group(1)}:{pattern[inline.end():]})"
+            scoped = sum(FLAG_LETTERS[c] for c in set(inline.group(1)))
+        flags.add(regex.flags & ~scoped)
+        # The wrapping group closes last, so it is the match's lastindex
+        parts.append(f"({pattern})")
+        table.append(rule)
+        table.extend([None] * regex.groups)
+    if len(flags) != 1:
+        return None
+    try:
+        combined = re.compile("|".join(parts), flags.pop())
+    except re.error:
+        return None
+    return combined.match, table
+
+
+class TokenStyles(dict):
+    """Token type to style index, subtypes missing from the style use their parent's."""
+
+    def __missing__(self, ttype):
+        index = self[ttype] = self[ttype.parent]
+        return index
+
+
+class BracketTokens(dict):
+    """Token type to whether brackets in it count towards the fold depth."""
+
+    def __missing__(self, ttype):
+        counts = self[ttype] = ttype in Token.Punctuation or ttype in Token.Operator
+        return counts
+
+
+BRACKET_TOKENS = BracketTokens()
+
+
+class InnerTokens(dict):
+    """
+    Token type to whether the lines starting inside it fold under the line
+    it starts on, strings and comments over several lines.
+    """
+
+    def __missing__(self, ttype):
+        inner = self[ttype] = ttype in Token.String or ttype in Token.Comment
+        return inner
+
+
+INNER_TOKENS = InnerTokens()
+
+
+class NameTokens(dict):
+    """Token type to whether its text goes into the identifier index."""
+
+    def __missing__(self, ttype):
+        named = self[ttype] = ttype in Token.Name
+        return named
+
+
+NAME_TOKENS = NameTokens()
+
+
+def bracket_delta(value):
+    delta = BRACKET_DELTAS.get(value)
+    if delta is None:
+        delta = BRACKET_DELTAS[value] = sum(map(value.count, "([{")) - sum(
+            map(value.count, ")]}")
+        )
+    return delta
+
+
+def fold_levels(code, starts, tab_width, next_number):
+    """
+    Fold data for the lines at ``starts``, ``(offset, depth, inner)`` per
+    line of ``code``. A line's level is its indentation in columns plus the
+    bracket depth at its start, so both indented blocks and bracketed ones
+    fold. Lines starting inside a token (strings, comments) fold under the
+    line the token starts on. Blank lines take the level of the next line
+    that isn't blank, ``next_number`` for blank lines at the end.
+    """
+    base = QsciScintilla.SC_FOLDLEVELBASE
+    numbers = []
+    number = 0
+    for offset, depth, inner in starts:
+        if inner:
+            numbers.append(number + 1)
+            continue
+        indent = LEADING_WHITESPACE.match(code, offset).group()
+        if code[offset + len(indent) : offset + len(indent) + 1] in ("", "\n", "\r"):
+            numbers.append(None)
+            continue
+        number = min(len(indent.expandtabs(tab_width)) + depth, MAX_FOLD_NUMBER)
+        numbers.append(number)
+
+    levels = array("I", bytes(4 * len(starts)))
+    for i in range(len(starts) - 1, -1, -1):
+        depth = min(starts[i][1], MAX_DEPTH) << FOLD_DEPTH_SHIFT
+        number = numbers[i]
+        if number is None:
+            levels[i] = depth | QsciScintilla.SC_FOLDLEVELWHITEFLAG | base + next_number
+            continue
+        level = base + number
+        if next_number > number:
+            level |= QsciScintilla.SC_FOLDLEVELHEADERFLAG
+        levels[i] = depth | level
+        next_number = number
+    return levels
+
+
+class StyleTable:
+    """A Pygments style resolved once and shared by every lexer using it."""
+
+    def __init__(self, style_name, font):
+        self.pyg_style = styles.get_style_by_name(style_name)
+        self.font = QFont(font)
+        self.token_styles = TokenStyles()
+        self.colors = []
+        for index, (ttype, style) in enumerate(self.pyg_style):
+            self.token_styles[ttype] = index
+            self.colors.append(
+                (
+                    QColor(f"#{style['color']}") if style["color"] else None,
+                    QColor(f"#{style['bgcolor']}") if style["bgcolor"] else None,
+                )
+            )
+
+        # Resolve the parent fallback for every token type known so far
+        pending = [Token]
+        while pending:
+            ttype = pending.pop()
+            self.token_styles[ttype]
+            pending.extend(ttype.subtypes)
+
+
+def get_style_table(style_name, font: QFont):
+    key = (style_name, font.toString())
+    if key not in STYLE_TABLES:
+        STYLE_TABLES[key] = StyleTable(style_name, font)
+    return STYLE_TABLES[key]
+
+
+def get_combined_states(lexer):
+    if lexer.name not in COMBINED_STATES:
+        COMBINED_STATES[lexer.name] = CombinedStates(lexer._tokens)
+    return COMBINED_STATES[lexer.name]
+
+
+class LexJob:
+    """A snapshot of the text to restyle, tokenized on the thread pool."""
+
+    def __init__(self, lexer, pos, code, line, end_line, stop_line):
+        self.lexer = lexer
+        self.pos = pos
+        self.code = code
+        self.line = line
+        self.end_line = end_line
+        self.stop_line = stop_line
+        self.complete = True
+        # Stopped where the line states match the old ones again
+        self.settled = False
+        self.old_states = None
+        self.cancelled = False
+        # Requested range, set by ViewLexer.prepare
+        self.start = self.end = None
+
+        self.old_folds = None
+        self.tab_width = 8
+
+        # Results
+        self.styles = bytearray()
+        self.new_states = []
+        self.last_line = None
+        # Fold data from ``line`` on, see fold_levels
+        self.folds = array("I")
+        # Identifiers of the lines lexed from ``line`` on, see group_words
+        self.identifiers = []
+
+        # Metrics, only filled in while METRICS.enabled
+        self.created = 0.0
+        self.lex_seconds = 0.0
+        self.tokens = 0
+        self.lines = 0
+
+    def run(self):
+        self.lexer.lex(self)
+        if not self.cancelled:
+            try:
+                self.lexer.job_done.emit(self)
+            except RuntimeError:
+                # The view was closed while lexing
+                pass
+
+
+class ViewLexer(QsciLexerCustom):
+    job_done = pyqtSignal(object)
+    # Start and end position of styles just set
+    restyled = pyqtSignal(int, int)
+
+    def __init__(
+        self,
+        lexer_name,
+        style_name,
+        font: QFont,
+        lazy_margin=None,
+        threaded=False,
+        combined=True,
+    ):
+        super().__init__()
+
+        # Lexer + Style
+        self.pyg_lexer = lexers.get_lexer_by_name(lexer_name, stripnl=False)
+        # One alternation regex per state instead of a regex call per rule
+        if combined:
+            self.combined_states = get_combined_states(self.pyg_lexer)
+        else:
+            self.combined_states = defaultdict(type(None))
+        # Lexer state stack at the start of each line (None = unknown)
+        self.line_states = [("root",)]
+        # Fold data of each line, set along with the styles (0 = unknown)
+        self.folds = array("I")
+        # Identifiers of the lexed lines, for word completion
+        self.identifiers = IdentifierIndex()
+        # Lines styled past the requested range; None lexes until the state settles
+        self.lazy_margin = lazy_margin
+        # Tokenize on the thread pool and apply the styles when done
+        self.threaded = threaded
+        self.job = None
+        # Styles from Scintilla's end styled position up to styled_end
+        # are still right once the text edited before it is lexed again,
+        # unless edited themselves: edits since the last restyle reach up
+        # to edited_end
+        self.styled_end = 0
+        self.edited_end = 0
+        self.job_done.connect(self.on_job_done)
+        self.style_name = style_name
+        self.extra_style = THEMES[style_name]
+
+        # Generate QScintilla styles
+        self.font = font
+        table = self.style_table = get_style_table(style_name, font)
+        self.token_styles = table.token_styles
+        for index, (color, paper) in enumerate(table.colors):
+            if color is not None:
+                self.setColor(color, index)
+            if paper is not None:
+                self.setPaper(paper, index)
+
+            self.setFont(table.font, index)
+
+    def setEditor(self, editor):
+        super().setEditor(editor)
+        if editor is not None:
+            editor.SCN_MODIFIED.connect(self.on_modified)
+
+    def on_modified(self, position, mtype, text, length, lines_added, *args):
+        if not mtype & (
+            self.editor().SC_MOD_INSERTTEXT | self.editor().SC_MOD_DELETETEXT
+        ):
+            return
+        # Stale, the worker drops it
+        self.cancel()
+
+        # Follow the text after the edit
+        if mtype & self.editor().SC_MOD_INSERTTEXT:
+            if position < self.styled_end:
+                self.styled_end += length
+            if position < self.edited_end:
+                self.edited_end += length
+            self.edited_end = max(self.edited_end, position + length)
+        else:
+            if position < self.styled_end:
+                self.styled_end -= min(length, self.styled_end - position)
+            if position < self.edited_end:
+                self.edited_end -= min(length, self.edited_end - position)
+            self.edited_end = max(self.edited_end, position)
+
+        # Keep the per-line checkpoints aligned with the document lines
+        if not lines_added:
+            return
+        view = self.editor()
+        line = view.SendScintilla(view.SCI_LINEFROMPOSITION, position) + 1
+        if lines_added > 0:
+            self.identifiers.insert_lines(line, lines_added)
+        else:
+            self.identifiers.delete_lines(line, line - lines_added)
+        if line >= len(self.line_states):
+            return
+        if lines_added > 0:
+            self.line_states[line:line] = [None] * lines_added
+            if line < len(self.folds):
+                self.folds[line:line] = array("I", bytes(4 * lines_added))
+        else:
+            del self.line_states[line : line - lines_added]
+            del self.folds[line : line - lines_added]
+            if line - 1 < len(self.folds):
+                # Scintilla moved the header flag of the deleted lines to
+                # the line above, its level is sent again. The depth stays
+                self.folds[line - 1] &= ~FOLD_LEVEL
+
+    def set_line_state(self, line, state):
+        states = self.line_states
+        if line >= len(states):
+            states.extend([None] * (line - len(states) + 1))
+        states[line] = state
+
+    def defaultPaper(self, style):
+        return self.extra_style.color("background")
+
+    def set_theme(self, theme):
+        self.extra_style = theme
+        # Styles without their own background follow the theme's
+        paper = self.defaultPaper(QsciScintilla.STYLE_DEFAULT)
+        for index, (color, style_paper) in enumerate(self.style_table.colors):
+            if style_paper is None:
+                self.paperChanged.emit(paper, index)
+        self.paperChanged.emit(paper, QsciScintilla.STYLE_DEFAULT)
+
+    def set_font(self, font: QFont):
+        """Change the font of every style, the text keeps its styles."""
+        self.font = font
+        # Each style is set through fontChanged, QScintilla doesn't recolour
+        for index in range(len(self.style_table.colors)):
+            self.setFont(font, index)
+
+    def language(self):
+        return self.pyg_lexer.name
+
+    def get_tokens_unprocessed(self, text, stack=("root",), checkpoints=None):
+        """
+        Split ``text`` into (tokentype, text) pairs.
+
+        ``stack`` is the inital stack (default: ``['root']``)
+        ``checkpoints`` if given, is filled with ``{pos: stack}`` for every
+        line start that falls on a token boundary
+        """
+        lexer = self.pyg_lexer
+        pos = 0
+        tokendefs = lexer._tokens
+        combined_states = self.combined_states
+        statestack = list(stack)
+        statetokens = tokendefs[statestack[-1]]
+        combined = combined_states[statestack[-1]]
+        while 1:
+            if checkpoints is not None and (pos == 0 or text[pos - 1] == "\n"):
+                checkpoints[pos] = tuple(statestack)
+            m = None
+            if combined is not None:
+                # One regex call per token, the group tells which rule matched
+                m = combined[0](text, pos)
+                if m:
+                    rexmatch, action, new_state = combined[1][m.lastindex]
+                    if action is not None and type(action) is not _TokenType:
+                        # Callbacks need the rule's own groups
+                        m = rexmatch(text, pos)
+            else:
+                for rexmatch, action, new_state in statetokens:
+                    m = rexmatch(text, pos)
+                    if m:
+                        break
+            if m:
+                if action is not None:
+                    if type(action) is _TokenType:
+                        yield pos, action, m.group()
+                    else:
+                        for item in action(lexer, m):
+                            yield item
+                pos = m.end()
+                if new_state is not None:
+                    # state transition
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == "#pop":
+                                statestack.pop()
+                            elif state == "#push":
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        # pop
+                        del statestack[new_state:]
+                    elif new_state == "#push":
+                        statestack.append(statestack[-1])
+                    else:
+                        assert False, "wrong state def: %r" % new_state
+                    statetokens = tokendefs[statestack[-1]]
+                    combined = combined_states[statestack[-1]]
+            else:
+                # We are here only if all state tokens have been considered
+                # and there was not a match on any of them.
+                try:
+                    if text[pos] == "\n":
+                        # at EOL, reset state to "root"
+                        statestack = ["root"]
+                        statetokens = tokendefs["root"]
+                        combined = combined_states["root"]
+                        yield pos, Text, "\n"
+                        pos += 1
+                        continue
+                    yield pos, Error, text[pos]
+                    pos += 1
+                except IndexError:
+                    break
+
+    def cache_key(self, digest):
+        """STYLE_CACHE key for a document whose contents hash to ``digest``."""
+        return (digest, self.pyg_lexer.name, self.style_name, pygments.__version__)
+
+    def styled_prefix(self):
+        """
+        ``(styles, line_states, folds)`` for the styled start of the
+        document, cut at the last line whose state is known so lexing can
+        resume there. ``folds`` is the fold data of those lines as bytes.
+        """
+        view = self.editor()
+        states = self.line_states
+        end_styled = view.SendScintilla(view.SCI_GETENDSTYLED)
+        line = min(
+            view.SendScintilla(view.SCI_LINEFROMPOSITION, end_styled), len(states) - 1
+        )
+        while line > 0 and states[line] is None:
+            line -= 1
+        end = view.SendScintilla(view.SCI_POSITIONFROMLINE, line)
+        return (
+            read_styles(view, 0, end),
+            states[: line + 1],
+            self.folds[: line + 1].tobytes(),
+        )
+
+    def cancel(self):
+        """Drop the job in flight, its styles are never applied."""
+        if self.job is not None:
+            self.job.cancelled = True
+            self.job = None
+
+    def invalidate(self, position):
+        """Forget the line states after ``position``, edited without notifications."""
+        self.cancel()
+        view = self.editor()
+        line = view.SendScintilla(view.SCI_LINEFROMPOSITION, position)
+        del self.line_states[line + 1 :]
+        del self.folds[line + 1 :]
+        if line < len(self.folds):
+            # May have the header flag of deleted lines, see on_modified
+            self.folds[line] &= ~FOLD_LEVEL
+        self.styled_end = min(self.styled_end, position)
+        self.identifiers.truncate(line + 1)
+
+    def restore_styles(self, styles, line_states, folds):
+        """Apply a ``styled_prefix`` saved earlier for the same text."""
+        view = self.editor()
+        self.cancel()
+        self.startStyling(0)
+        view.SendScintilla(view.SCI_SETSTYLINGEX, len(styles), styles)
+        self.restyled.emit(0, len(styles))
+        self.styled_end = len(styles)
+        self.edited_end = 0
+        self.line_states = list(line_states)
+        self.folds = array("I")
+        self.folds.frombytes(folds)
+        # Nothing is folded yet, QScintilla needn't hear of each level
+        mask = view.SendScintilla(view.SCI_GETMODEVENTMASK)
+        view.SendScintilla(
+            view.SCI_SETMODEVENTMASK,
+            mask & ~(view.SC_MOD_CHANGEFOLD | view.SC_MOD_CHANGEMARKER),
+        )
+        base = QsciScintilla.SC_FOLDLEVELBASE
+        for line, value in enumerate(self.folds):
+            if value & FOLD_LEVEL != base:
+                view.SendScintilla(view.SCI_SETFOLDLEVEL, line, value & FOLD_LEVEL)
+        view.SendScintilla(view.SCI_SETMODEVENTMASK, mask)
+
+    def highlight(self, start, end):
+        """
+        Re-lex from the nearest line checkpoint before ``start`` and stop
+        once past ``end`` the line start state matches the cached one.
+        """
+        if self.job is not None:
+            # Still lexing this version of the document
+            return
+        if end <= start:
+            # Already styled up to there
+            return
+        job = self.prepare(start, end)
+        if self.threaded:
+            self.job = job
+            QThreadPool.globalInstance().start(job.run)
+        else:
+            self.lex(job)
+            self.apply(job)
+
+    def prepare(self, start, end):
+        view = self.editor()
+        states = self.line_states
+        line = min(
+            view.SendScintilla(view.SCI_LINEFROMPOSITION, start), len(states) - 1
+        )
+        while states[line] is None:
+            line -= 1
+        end_line = view.SendScintilla(view.SCI_LINEFROMPOSITION, end)
+        length = view.length()
+        text_end = length
+        stop_line = None
+        if self.lazy_margin is not None:
+            stop_line = end_line + self.lazy_margin
+            # Leave room for rules that look ahead past the last styled line
+            text_end = view.SendScintilla(
+                view.SCI_POSITIONFROMLINE, stop_line + self.lazy_margin
+            )
+            if text_end < 0:
+                text_end = length
+        pos = view.SendScintilla(view.SCI_POSITIONFROMLINE, line)
+        # A reversed range makes QScintilla allocate without bound
+        text_end = max(text_end, pos)
+
+        job = LexJob(self, pos, view.text(pos, text_end), line, end_line, stop_line)
+        job.start, job.end = start, end
+        job.complete = text_end == length
+        if METRICS.enabled:
+            job.created = time.perf_counter()
+        # The worker compares against a snapshot, the GUI thread keeps editing
+        job.old_states = states[:] if self.threaded else states
+        job.old_folds = self.folds[:] if self.threaded else self.folds
+        job.tab_width = view.tabWidth()
+        return job
+
+    def lex(self, job):
+        """
+        Tokenize ``job.code`` into one style byte per UTF-8 byte. Safe to
+        call off the GUI thread, it only reads the lexer and the job.
+        """
+        token_styles = self.token_styles
+        bracket_tokens = BRACKET_TOKENS
+        name_tokens = NAME_TOKENS
+        inner_tokens = INNER_TOKENS
+        old_states = job.old_states
+        old_folds = job.old_folds
+        new_states = job.new_states
+        buf = job.styles
+        line = job.line
+        code = job.code
+        depth = old_folds[line] >> FOLD_DEPTH_SHIFT if line < len(old_folds) else 0
+        # (offset, bracket depth, starts inside a string or comment) per line start
+        starts = [(0, depth, False)]
+        timed = METRICS.enabled
+        if timed:
+            t_start = time.perf_counter()
+
+        checkpoints = {}
+        tokens = 0
+        # (line, text) of the Name tokens
+        names = []
+        # Lines before this one were lexed to their end
+        lexed_end = None
+        tokensource = self.get_tokens_unprocessed(
+            job.code, old_states[line], checkpoints
+        )
+        for tokens, (index, ttype, value) in enumerate(tokensource, 1):
+            if job.cancelled:
+                return
+            state = checkpoints.pop(index, None)
+            if state is not None and index:
+                if (
+                    line > job.end_line
+                    and line < len(old_states)
+                    and old_states[line] == state
+                    and line < len(old_folds)
+                    and old_folds[line] >> FOLD_DEPTH_SHIFT == depth
+                ):
+                    job.settled = True
+                    break
+                new_states.append((line, state))
+                if job.stop_line is not None and line > job.stop_line:
+                    # Scintilla asks for the rest once it scrolls into view
+                    break
+            # Scintilla positions are bytes, not characters
+            size = len(value) if value.isascii() else len(value.encode("utf-8"))
+            buf += STYLE_BYTES[token_styles[ttype]] * size
+            if bracket_tokens[ttype]:
+                depth = max(depth + bracket_delta(value), 0)
+            elif name_tokens[ttype]:
+                names.append((line, value))
+
+            newlines = value.count("\n")
+            if newlines:
+                # Lines starting inside this token can't be resumed from
+                inside = newlines if value.endswith("\n") else newlines + 1
+                for n in range(line + 1, line + inside):
+                    new_states.append((n, None))
+                if not inner_tokens[ttype]:
+                    # Blank lines in whitespace fold like any other
+                    inside = 0
+                offset = -1
+                for n in range(newlines):
+                    offset = value.index("\n", offset + 1)
+                    starts.append((index + offset + 1, depth, n + 1 < inside))
+                line += newlines
+        else:
+            if job.complete:
+                state = checkpoints.pop(len(code), None)
+                if state is not None and code:
+                    new_states.append((line, state))
+                job.last_line = line
+            lexed_end = line + 1 if job.complete else line
+        if lexed_end is None:
+            # Stopped at the start of ``line``
+            lexed_end = line
+        job.identifiers = group_words(names, job.line, lexed_end)
+
+        # Blank lines at the end fold like the line after them did
+        next_number = 0
+        if line + 1 < len(old_folds):
+            next_number = (
+                old_folds[line + 1] & QsciScintilla.SC_FOLDLEVELNUMBERMASK
+            ) - (QsciScintilla.SC_FOLDLEVELBASE)
+        job.folds = fold_levels(code, starts, job.tab_width, max(next_number, 0))
+
+        if timed:
+            job.lex_seconds = time.perf_counter() - t_start
+            job.tokens = tokens
+            job.lines = line - job.line
+
+    def apply(self, job):
+        view = self.editor()
+        self.startStyling(job.pos)
+        view.SendScintilla(view.SCI_SETSTYLINGEX, len(job.styles), bytes(job.styles))
+        self.restyled.emit(job.pos, job.pos + len(job.styles))
+        end = job.pos + len(job.styles)
+        if job.settled and end >= self.edited_end and self.styled_end > end:
+            # The lines after are styled for the states they start with,
+            # Scintilla needn't ask for them again
+            self.startStyling(self.styled_end)
+        else:
+            self.styled_end = end
+        self.edited_end = 0
+        for line, state in job.new_states:
+            self.set_line_state(line, state)
+        self.apply_folds(job.line, job.folds)
+        self.identifiers.set_lines(job.line, job.identifiers)
+        if job.last_line is not None:
+            del self.line_states[job.last_line + 1 :]
+            del self.folds[job.last_line + 1 :]
+            self.identifiers.truncate(job.last_line + 1)
+        if METRICS.enabled and job.created:
+            METRICS.record_restyle(job)
+
+    def apply_folds(self, first, folds):
+        """
+        Store the fold data of the lines from ``first`` on and pass the
+        levels that changed to Scintilla. The lines before only need their
+        header flag and blank line levels brought in line with ``first``.
+        """
+        view = self.editor()
+        stored = self.folds
+        if len(stored) < first + len(folds):
+            stored.frombytes(bytes(4 * (first + len(folds) - len(stored))))
+        for line, value in enumerate(folds, first):
+            if stored[line] & FOLD_LEVEL != value & FOLD_LEVEL or not stored[line]:
+                view.SendScintilla(view.SCI_SETFOLDLEVEL, line, value & FOLD_LEVEL)
+        stored[first : first + len(folds)] = folds
+        if not folds:
+            return
+
+        number_mask = QsciScintilla.SC_FOLDLEVELNUMBERMASK
+        header = QsciScintilla.SC_FOLDLEVELHEADERFLAG
+        next_number = folds[0] & number_mask
+        line = first - 1
+        while line >= 0 and stored[line]:
+            value = stored[line]
+            if value & QsciScintilla.SC_FOLDLEVELWHITEFLAG:
+                value = value & ~number_mask | next_number
+            elif next_number > value & number_mask:
+                value |= header
+            else:
+                value &= ~header
+            if value != stored[line]:
+                stored[line] = value
+                view.SendScintilla(view.SCI_SETFOLDLEVEL, line, value & FOLD_LEVEL)
+            if not value & QsciScintilla.SC_FOLDLEVELWHITEFLAG:
+                break
+            line -= 1
+
+    def on_job_done(self, job):
+        if job is not self.job:
+            return
+        self.job = None
+        self.apply(job)
+
+    def styleText(self, start, end):
+        self.highlight(start, end)
+
+    def description(self, style_nr):
+        return str(style_nr)
@@ -0,0 +1,291 @@
+"""
+Edit journals: unsaved changes that survive a crash.
+
+Each document with unsaved edits has an append-only journal file: a JSON
+header line naming the file the edits apply to (its ``stat_key`` at the
+time, None for a new document) followed by one binary record per insert,
+delete or replacement. Records are batched and written with one fsync a
+second on a worker thread, so the cost of the journal follows the typing,
+not the size of the document. Saving starts the journal over.
+
+On the next start the journals of editors that are no longer running are
+replayed onto their files.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+import uuid
+
+from PyQt5.QtCore import QObject, QThreadPool, QTimer
+
+from stylecache import default_directory as style_directory
+
+FORMAT = 1
+# Milliseconds between writes, each one fsynced
+FLUSH_DELAY = 1000
+# Position, bytes deleted there and bytes inserted, followed by those
+RECORD = struct.Struct("<QII")
+SUFFIX = ".journal"
+# Seconds after which a journal without a header counts as left behind,
+# a running editor may be writing it
+HEADER_TIMEOUT = 60
+
+
+def default_directory():
+    return style_directory().with_name("journals")
+
+
+def process_alive(pid):
+    if os.name == "nt":
+        # os.kill would end the process
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x100000, False, pid)  # SYNCHRONIZE
+        if not handle:
+            return False
+        try:
+            return kernel32.WaitForSingleObject(handle, 0) == 0x102  # WAIT_TIMEOUT
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_journal(file):
+    """
+    ``(header, edits)`` of the journal at ``file``, the edits as
+    ``(start, end, text)`` in the order they were made. A record cut
+    short by a crash is left out.
+    """
+    with open(file, "rb") as f:
+        header = json.loads(f.readline())
+        data = f.read()
+    if header.get("format") != FORMAT:
+        raise ValueError(f"{file}: unknown journal format")
+    edits = []
+    offset = 0
+    while offset + RECORD.size <= len(data):
+        position, deleted, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data):
+            break
+        edits.append((position, position + deleted, data[offset : offset + length]))
+        offset += length
+    return header, edits
+
+
+def orphaned_journals(directory=None):
+    """The journal files left by editors that aren't running, oldest first."""
+    directory = default_directory() if directory is None else directory
+    try:
+        files = sorted(
+            directory.glob(f"*{SUFFIX}"), key=lambda file: file.stat().st_mtime
+        )
+    except OSError:
+        return []
+    orphans = []
+    for file in files:
+        try:
+            with open(file, "rb") as f:
+                pid = json.loads(f.readline())["pid"]
+        except (OSError, ValueError, KeyError):
+            try:
+                if time.time() - file.stat().st_mtime > HEADER_TIMEOUT:
+                    orphans.append(file)
+            except OSError:
+                pass
+            continue
+        if pid != os.getpid() and not process_alive(pid):
+            orphans.append(file)
+    return orphans
+
+
+class Journal(QObject):
+    """
+    Records the edits made to a View from now on, those of the user, of
+    undo and redo and of ``View.replace_ranges``, on top of the file at
+    ``path`` as its ``stat_key`` was ``base``.
+
+    Nothing is written until the first edit. ``reset()`` starts over once
+    the View matches the file again. ``mark()`` before a save keeps the
+    edits made while it runs, the file saved won't have them.
+    """
+
+    def __init__(
+        self, view, path, base, parent=None, directory=None, delay=FLUSH_DELAY
+    ):
+        super().__init__(parent)
+        directory = default_directory() if directory is None else directory
+        self.file = directory / f"{uuid.uuid4().hex}{SUFFIX}"
+        self.view = view
+        self.path = path
+        self.base = base
+        # Records not written yet. With truncate they start a new file,
+        # with remove the file goes first
+        self.pending = []
+        self.started = False
+        self.truncate = False
+        self.remove = False
+        # Records since mark(), None without a mark
+        self.kept = None
+        # A write failed, nothing is recorded until the next reset()
+        self.broken = False
+        self.writing = False
+        self.lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+        self.text_changes = view.SC_MOD_INSERTTEXT | view.SC_MOD_DELETETEXT
+        view.SCN_MODIFIED.connect(self.on_modified)
+        view.replaced.connect(self.on_replaced)
+
+    def on_modified(self, position, modification_type, text, length, *args):
+        if not modification_type & self.text_changes:
+            return
+        if modification_type & self.view.SC_MOD_INSERTTEXT:
+            self.record(position, 0, self.view.text_range(position, position + length))
+        else:
+            self.record(position, length, b"")
+
+    def on_replaced(self, start, end, text):
+        self.record(start, end - start, text)
+
+    def record(self, position, deleted, text):
+        data = RECORD.pack(position, deleted, len(text)) + text
+        with self.lock:
+            if self.broken:
+                return
+            if not self.started:
+                self.start_file()
+            self.pending.append(data)
+            if self.kept is not None:
+                self.kept.append(data)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def start_file(self):
+        header = {
+            "format": FORMAT,
+            "path": self.path,
+            "base": self.base,
+            "pid": os.getpid(),
+        }
+        self.pending = [json.dumps(header).encode() + b"\n"]
+        self.started = True
+        self.truncate = True
+        self.remove = False
+
+    def mark(self):
+        with self.lock:
+            self.kept = []
+
+    def unmark(self):
+        with self.lock:
+            self.kept = None
+
+    def reset(self, path, base, keep=False):
+        """
+        The View matches the file at ``path``, ``base`` its ``stat_key``,
+        plus the edits since ``mark()`` if ``keep``.
+        """
+        with self.lock:
+            kept = self.kept if keep else None
+            self.kept = None
+            self.path = path
+            self.base = base
+            self.broken = False
+            self.started = False
+            self.pending = []
+            self.truncate = False
+            self.remove = True
+            if kept:
+                self.start_file()
+                self.pending.extend(kept)
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.writing or not (self.pending or self.remove):
+                return
+            self.writing = True
+            self.idle.clear()
+        QThreadPool.globalInstance().start(self.run)
+
+    def sync(self):
+        """Write everything recorded so far before returning."""
+        self.timer.stop()
+        self.idle.wait()
+        with self.lock:
+            self.writing = True
+            self.idle.clear()
+        self.run()
+
+    def close(self, keep=False):
+        """Stop recording. Keep the file for recovery if ``keep``, else remove it."""
+        for signal, slot in (
+            (self.view.SCN_MODIFIED, self.on_modified),
+            (self.view.replaced, self.on_replaced),
+        ):
+            try:
+                signal.disconnect(slot)
+            except (RuntimeError, TypeError):
+                # The view is gone
+                pass
+        if not keep:
+            with self.lock:
+                self.pending = []
+                self.kept = None
+                self.remove = self.started or self.remove
+                self.started = False
+        self.sync()
+
+    def run(self):
+        try:
+            while self.write():
+                pass
+        finally:
+            self.idle.set()
+
+    def write(self):
+        with self.lock:
+            batch, truncate, remove = self.pending, self.truncate, self.remove
+            self.pending, self.truncate, self.remove = [], False, False
+            if not batch and not remove:
+                self.writing = False
+                return False
+        try:
+            if remove:
+                try:
+                    os.unlink(self.file)
+                except FileNotFoundError:
+                    pass
+            if batch:
+                self.file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.file, "wb" if truncate else "ab") as f:
+                    f.write(b"".join(batch))
+                    f.flush()
+                    os.fsync(f.fileno())
+        except OSError:
+            # A partly written record would garble what follows
+            with self.lock:
+                self.broken = True
+                self.started = False
+                self.pending = []
+            try:
+                os.unlink(self.file)
+            except OSError:
+                pass
+        return True
@@ -0,0 +1,174 @@
+"""
+Which Pygments lexer highlights a file, found without importing every
+lexer.
+
+Pygments' own lookup by file name loads the plugin entry points and the
+module of every lexer whose patterns match, on each call, and
+``guess_lexer`` runs every lexer over the whole text. Here the file name
+is looked up in maps built once from Pygments' table of lexers. Only the
+first few KB of the file are ever read, when several lexers claim the
+name (they rate the text, like Pygments does) or when none does (for a
+shebang, an editor modeline or a markup declaration). Results are kept
+per path.
+"""
+
+import fnmatch
+import os
+import re
+
+from pygments.lexer import ExtendedRegexLexer, RegexLexer
+from pygments.lexers import find_lexer_class
+from pygments.lexers._mapping import LEXERS
+
+# Bytes read when the name isn't enough
+SNIFF_SIZE = 4096
+# Lexer alias (None for plain text) per absolute path
+LEXER_NAMES = {}
+
+SHEBANG = re.compile(rb"#!\s*(\S+)(?:[ \t]+(.*))?")
+VERSION_SUFFIX = re.compile(r"[\d.]+$")
+EMACS_MODE = re.compile(rb"-\*-\s*(?:.*?\bmode:\s*([\w+-]+)|([\w+-]+)\s*-\*-)", re.I)
+VIM_MODE = re.compile(rb"\b(?:vi|vim|ex):.*?\b(?:ft|filetype|syntax)=([\w+-]+)")
+# Leading markup that tells the language
+DECLARATIONS = (
+    (re.compile(rb"\s*<\?xml\b"), "xml"),
+    (re.compile(rb"\s*<!doctype\s+html|\s*<html\b", re.I), "html"),
+    (re.compile(rb"\s*<\?php\b"), "php"),
+)
+# Interpreters named differently from a lexer alias
+INTERPRETERS = {
+    "sh": "bash",
+    "node": "javascript",
+    "nodejs": "javascript",
+    "tclsh": "tcl",
+    "wish": "tcl",
+    "runghc": "haskell",
+    "Rscript": "r",
+}
+
+
+class LexerTable:
+    """Pygments' lexer patterns sorted by how they are looked up."""
+
+    def __init__(self):
+        # Lexer name per alias, and (lexer name, pattern) pairs per exact
+        # file name, per ".extension" and for the other globs
+        self.aliases = {}
+        self.names = {}
+        self.extensions = {}
+        self.globs = []
+        for _, name, aliases, patterns, _ in LEXERS.values():
+            for alias in aliases:
+                self.aliases.setdefault(alias, name)
+            for pattern in patterns:
+                if not any(char in pattern for char in "*?["):
+                    self.names.setdefault(pattern, []).append((name, pattern))
+                elif pattern.startswith("*.") and not any(
+                    char in pattern[1:] for char in "*?["
+                ):
+                    self.extensions.setdefault(pattern[1:], []).append((name, pattern))
+                else:
+                    match = re.compile(fnmatch.translate(pattern)).match
+                    self.globs.append((match, name, pattern))
+
+    def candidates(self, filename):
+        """``(lexer name, pattern)`` of the lexers claiming ``filename``."""
+        found = list(self.names.get(filename, ()))
+        dot = filename.find(".", 1)
+        while dot >= 0:
+            found.extend(self.extensions.get(filename[dot:], ()))
+            dot = filename.find(".", dot + 1)
+        found.extend(
+            (name, pattern) for match, name, pattern in self.globs if match(filename)
+        )
+        return found
+
+    def lexer_for_alias(self, alias):
+        name = self.aliases.get(alias)
+        return None if name is None else find_lexer_class(name)
+
+
+TABLE = None
+
+
+def get_table():
+    global TABLE
+    if TABLE is None:
+        TABLE = LexerTable()
+    return TABLE
+
+
+def read_head(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(SNIFF_SIZE)
+    except OSError:
+        return b""
+
+
+def best_rated(candidates, head):
+    """Pygments' pick among lexers claiming a name: explicit names first."""
+
+    def rating(candidate):
+        cls, pattern = candidate
+        bonus = 0 if "*" in pattern else 0.5
+        if head:
+            return cls.analyse_text(head) + bonus, cls.__name__
+        return cls.priority + bonus, cls.__name__
+
+    loaded = [(find_lexer_class(name), pattern) for name, pattern in candidates]
+    return max(loaded, key=rating)[0]
+
+
+def sniff(head, table):
+    """The lexer class a file's first bytes call for, or None."""
+    first_line = head.split(b"\n", 1)[0]
+    shebang = SHEBANG.match(first_line)
+    if shebang is not None:
+        interpreter = os.path.basename(shebang.group(1).decode("utf-8", "replace"))
+        if interpreter == "env" and shebang.group(2):
+            arguments = shebang.group(2).decode("utf-8", "replace").split()
+            interpreter = next((arg for arg in arguments if arg[:1] != "-"), "")
+        for name in (interpreter, VERSION_SUFFIX.sub("", interpreter)):
+            cls = table.lexer_for_alias(INTERPRETERS.get(name, name))
+            if cls is not None:
+                return cls
+    for line in head.splitlines()[:2] + head.splitlines()[-2:]:
+        for pattern in (EMACS_MODE, VIM_MODE):
+            mode = pattern.search(line)
+            if mode is not None:
+                alias = next(group for group in mode.groups() if group)
+                cls = table.lexer_for_alias(alias.decode("ascii", "replace").lower())
+                if cls is not None:
+                    return cls
+    for pattern, alias in DECLARATIONS:
+        if pattern.match(head):
+            return table.lexer_for_alias(alias)
+    return None
+
+
+def find_lexer_name(path):
+    """Alias of the Pygments lexer for the file at ``path``, None for plain text."""
+    path = os.path.abspath(path)
+    if path in LEXER_NAMES:
+        return LEXER_NAMES[path]
+    table = get_table()
+    candidates = table.candidates(os.path.basename(path))
+    if len({name for name, _ in candidates}) == 1:
+        cls = find_lexer_class(candidates[0][0])
+    elif candidates:
+        head = read_head(path).decode("utf-8", "replace")
+        cls = best_rated(candidates, head)
+    else:
+        cls = sniff(read_head(path), table)
+    # ViewLexer drives the RegexLexer state machine itself
+    name = None
+    if (
+        cls is not None
+        and issubclass(cls, RegexLexer)
+        and not issubclass(cls, ExtendedRegexLexer)
+        and cls.aliases
+    ):
+        name = cls.aliases[0]
+    LEXER_NAMES[path] = name
+    return name
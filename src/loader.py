@@ -0,0 +1,107 @@
+import mmap
+import os
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from stylecache import content_digest
+
+# Bytes inserted into the view per event loop turn
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class FileLoader(QObject):
+    """
+    Streams a file into a View in chunks, one chunk per event loop turn,
+    so the window keeps painting and the file never sits in memory as a
+    whole Python str.
+
+    Chunks are read from the end of the file and inserted at position 0:
+    QScintilla's modification handling costs time proportional to the
+    insert position, so appending would make loading quadratic.
+
+    Invalid UTF-8 is shown replaced by U+FFFD and sets ``lossy``: the
+    View stays read-only, saving it would write the replacements back.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+
+    def __init__(
+        self, view, path, parent=None, chunk_size=CHUNK_SIZE, hash_content=False
+    ):
+        super().__init__(parent)
+        self.view = view
+        self.path = path
+        self.chunk_size = chunk_size
+        # Hash of the file once loaded, for the style cache
+        self.hash_content = hash_content
+        self.digest = None
+        # Whether any chunk wasn't valid UTF-8
+        self.lossy = False
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        # mmap can't map empty files
+        self.map = None
+        if self.size:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # Everything from offset to the end of the file is loaded
+        self.offset = self.size
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.load_chunk)
+
+    def start(self):
+        view = self.view
+        # Loading isn't an undoable edit
+        view.SendScintilla(view.SCI_SETUNDOCOLLECTION, False)
+        view.clear()
+        view.SendScintilla(view.SCI_ALLOCATE, self.size + 1)
+        view.setReadOnly(True)
+        self.timer.start(0)
+
+    def chunk_start(self, end):
+        start = max(end - self.chunk_size, 0)
+        if start == 0:
+            return 0
+        # Split after a newline, or at least between UTF-8 characters
+        newline = self.map.find(b"\n", start, end - 1)
+        if newline >= 0:
+            return newline + 1
+        while start > 0 and self.map[start] & 0xC0 == 0x80:
+            start -= 1
+        return start
+
+    def load_chunk(self):
+        view = self.view
+        end = self.offset
+        start = self.chunk_start(end) if self.map is not None else 0
+        if start < end:
+            data = self.map[start:end]
+            try:
+                data.decode("utf-8")
+            except UnicodeDecodeError:
+                self.lossy = True
+                data = data.decode("utf-8", "replace").encode("utf-8")
+            view.setReadOnly(False)
+            view.SendScintilla(view.SCI_INSERTTEXT, 0, data)
+            view.setReadOnly(True)
+        self.offset = start
+        self.progress.emit(self.size - self.offset, self.size)
+        if start == 0:
+            if self.hash_content:
+                self.digest = content_digest(self.map if self.map is not None else b"")
+            self.close()
+            view.SendScintilla(view.SCI_EMPTYUNDOBUFFER)
+            view.SendScintilla(view.SCI_SETSAVEPOINT)
+            self.finished.emit()
+
+    def cancel(self):
+        self.close()
+
+    def close(self):
+        self.timer.stop()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+        self.view.setReadOnly(self.lossy)
+        self.view.SendScintilla(self.view.SCI_SETUNDOCOLLECTION, True)
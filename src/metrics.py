@@ -0,0 +1,149 @@
+"""
+Performance metrics for highlighting and other editor work.
+
+Recording is off by default; callers check ``METRICS.enabled`` before
+timing anything so a disabled build pays a single attribute lookup.
+"""
+import bisect
+import json
+import time
+from collections import defaultdict, deque
+
+# Histogram bucket upper bounds in seconds (the last bucket is open ended)
+LATENCY_BUCKETS = (
+    0.0001,
+    0.0002,
+    0.0005,
+    0.001,
+    0.002,
+    0.005,
+    0.01,
+    0.02,
+    0.05,
+    0.1,
+    0.2,
+    0.5,
+    1.0,
+    2.0,
+    5.0,
+)
+
+
+class Histogram:
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean(),
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": [
+                {"le": bound, "count": count}
+                for bound, count in zip(self.bounds + (None,), self.counts)
+            ],
+        }
+
+
+class Metrics:
+    def __init__(self, history=256):
+        self.enabled = False
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        self.histograms = defaultdict(Histogram)
+        self.counters = defaultdict(int)
+        # The latest restyles, oldest first
+        self.restyles = deque(maxlen=self.history)
+
+    def time(self, name, seconds):
+        self.histograms[name].add(seconds)
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def record_restyle(self, job):
+        """Record a restyle applied from a finished ``LexJob``."""
+        latency = time.perf_counter() - job.created
+        size = len(job.styles)
+        self.time("restyle_latency", latency)
+        self.time("lex_time", job.lex_seconds)
+        self.count("restyles")
+        self.count("bytes_lexed", size)
+        self.count("lines_lexed", job.lines)
+        self.count("tokens", job.tokens)
+        self.count("lex_seconds", job.lex_seconds)
+        self.restyles.append(
+            {
+                "requested": [job.start, job.end],
+                "styled": [job.pos, job.pos + size],
+                "bytes": size,
+                "lines": job.lines,
+                "tokens": job.tokens,
+                "latency": latency,
+                "lex_seconds": job.lex_seconds,
+            }
+        )
+
+    def tokens_per_second(self):
+        seconds = self.counters["lex_seconds"]
+        return self.counters["tokens"] / seconds if seconds else None
+
+    def last_restyle(self):
+        return self.restyles[-1] if self.restyles else None
+
+    def snapshot(self):
+        return {
+            "enabled": self.enabled,
+            "started": self.started,
+            "counters": dict(self.counters),
+            "tokens_per_second": self.tokens_per_second(),
+            "histograms": {k: v.to_dict() for k, v in self.histograms.items()},
+            "restyles": list(self.restyles),
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.snapshot(), **kwargs)
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            f.write(self.to_json(indent=2))
+
+
+METRICS = Metrics()
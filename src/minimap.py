@@ -0,0 +1,344 @@
+"""
+The minimap: the whole document drawn small beside its View, for
+overview and navigation.
+
+The document is drawn from Scintilla's text and style bytes, not by
+rendering text again. It is cut into blocks of lines and each block's
+picture is reduced with NumPy: one pixel per ``lines_per_row`` lines and
+``CHARS_PER_PIXEL`` columns, coloured with the style most of its
+characters have and shaded by how many there are. Pictures are cached
+per block. An edit or a restyle only redraws the blocks of the lines it
+touched, and inserted or deleted lines only resize their block, the
+blocks after it keep their pictures.
+"""
+
+import math
+import time
+from bisect import bisect_right
+
+import numpy as np
+from PyQt5 import sip
+from PyQt5.QtCore import QRectF, Qt, QTimer
+from PyQt5.QtGui import QColor, QImage, QPainter
+from PyQt5.QtWidgets import QApplication, QWidget
+
+WIDTH = 100
+# Characters per pixel column, and pixel rows per line when the whole
+# document fits at that size
+CHARS_PER_PIXEL = 2
+MAX_ROW_HEIGHT = 3
+# Pixel rows per block, blocks twice as long as that are split
+BLOCK_ROWS = 4
+# Seconds of drawing per event loop turn
+TIME_SLICE = 0.01
+# Shade of a pixel with the fewest characters
+MIN_INK = 0.3
+# Bytes above it are drawn, spaces, tabs, line ends and controls aren't
+SPACE = 32
+
+
+def argb(bgr):
+    """Scintilla's 0xBBGGRR as an opaque QImage.Format_RGB32 pixel."""
+    return 0xFF000000 | (bgr & 0xFF) << 16 | bgr & 0xFF00 | bgr >> 16 & 0xFF
+
+
+def render_lines(text, styles, lines_per_row, row_height, columns, palette, paper):
+    """
+    The picture of the lines in the bytes ``text``, starting at the start
+    of a line, and their ``styles``, one byte each, as a ``(rows,
+    columns)`` array of RGB32 pixels.
+    """
+    data = np.frombuffer(text, np.uint8)
+    line_starts = np.concatenate(([0], np.flatnonzero(data == 10) + 1))
+    rows = max(math.ceil(len(line_starts) / lines_per_row), 1)
+    pixels = np.full((rows, columns), paper, np.uint32)
+    if not len(data):
+        return np.repeat(pixels, row_height, axis=0)
+    line_lengths = np.diff(np.append(line_starts, len(data)))
+    line_of = np.repeat(np.arange(len(line_starts), dtype=np.int64), line_lengths)
+    column = np.arange(len(data), dtype=np.int64) - line_starts[line_of]
+    ink = (data > SPACE) & (column < columns * CHARS_PER_PIXEL)
+    cells = (line_of[ink] // lines_per_row) * columns + column[ink] // CHARS_PER_PIXEL
+    if styles is None:
+        style = np.zeros(len(cells), np.int64)
+    else:
+        style = np.frombuffer(styles, np.uint8)[ink].astype(np.int64)
+
+    # Characters of each style in each cell
+    counts = np.bincount(cells * 256 + style, minlength=rows * columns * 256)
+    counts = counts.reshape(rows * columns, 256)
+    total = counts.sum(axis=1)
+    dominant = counts.argmax(axis=1)
+    capacity = lines_per_row * CHARS_PER_PIXEL
+    shade = np.clip(total / capacity, MIN_INK, 1.0)[:, None]
+
+    # Blend the style's colour over the paper
+    channels = np.array([16, 8, 0])
+    fore = (palette[dominant][:, None] >> channels) & 0xFF
+    back = (np.uint32(paper) >> channels) & 0xFF
+    blended = (back + (fore.astype(np.float64) - back) * shade).astype(np.uint32)
+    colours = 0xFF000000 | (blended << channels).sum(axis=1).astype(np.uint32)
+    flat = pixels.reshape(-1)
+    drawn = total > 0
+    flat[drawn] = colours[drawn]
+    return np.repeat(pixels, row_height, axis=0)
+
+
+class Minimap(QWidget):
+    """
+    The minimap of ``view``. Click or drag to scroll the View there, the
+    lines on screen are outlined.
+    """
+
+    def __init__(self, view, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.setFixedWidth(WIDTH)
+        self.setCursor(Qt.PointingHandCursor)
+        # Line count and picture (None until drawn) of each block
+        self.blocks = []
+        # First line of each block, None when blocks changed size
+        self.starts = None
+        self.lines_per_row = 1
+        self.row_height = MAX_ROW_HEIGHT
+        self.palette = None
+        self.paper = 0
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render_blocks)
+        self.before_delete = view.SC_MOD_BEFOREDELETE
+        self.insert = view.SC_MOD_INSERTTEXT
+        view.SCN_MODIFIED.connect(self.on_modified)
+        view.replaced.connect(self.on_replaced)
+        view.SCN_UPDATEUI.connect(self.update)
+        if view.lexer is not None:
+            view.lexer.restyled.connect(self.on_restyled)
+
+    def line_count(self):
+        return self.view.SendScintilla(self.view.SCI_GETLINECOUNT)
+
+    def layout_blocks(self):
+        """Pick the scale for the current size and start drawing over."""
+        view = self.view
+        lines = self.line_count()
+        height = max(self.height(), 1)
+        self.row_height = min(max(height // lines, 1), MAX_ROW_HEIGHT)
+        self.lines_per_row = max(math.ceil(lines / (height // self.row_height)), 1)
+        block_lines = self.lines_per_row * BLOCK_ROWS
+        self.blocks = [
+            [min(block_lines, lines - first), None]
+            for first in range(0, lines, block_lines)
+        ]
+        self.starts = None
+        self.palette = np.array(
+            [argb(view.SendScintilla(view.SCI_STYLEGETFORE, i)) for i in range(256)],
+            np.uint32,
+        )
+        self.paper = argb(view.SendScintilla(view.SCI_STYLEGETBACK, view.STYLE_DEFAULT))
+        self.timer.start(0)
+
+    def block_starts(self):
+        if self.starts is None:
+            starts = []
+            line = 0
+            for count, _ in self.blocks:
+                starts.append(line)
+                line += count
+            self.starts = starts
+        return self.starts
+
+    def block_at(self, line):
+        return max(bisect_right(self.block_starts(), line) - 1, 0)
+
+    def invalidate(self, first, last):
+        """Draw the blocks of lines ``first`` to ``last`` again."""
+        if not self.blocks:
+            return
+        for index in range(self.block_at(first), self.block_at(last) + 1):
+            self.blocks[index][1] = None
+        self.timer.start(0)
+
+    def resize_block(self, line, added):
+        """``added`` lines (negative if removed) after ``line``, in its block."""
+        if not self.blocks:
+            return
+        index = self.block_at(line)
+        blocks = self.blocks
+        if added < 0:
+            # Removed lines can span blocks, the first one keeps what's left
+            removed = -added
+            start = self.block_starts()[index]
+            end = index + 1
+            # Lines of this block after line, taken first
+            taken = min(removed, start + blocks[index][0] - line - 1)
+            blocks[index][0] -= taken
+            removed -= taken
+            while removed and end < len(blocks):
+                taken = min(removed, blocks[end][0])
+                blocks[end][0] -= taken
+                blocks[end][1] = None
+                removed -= taken
+                end += 1
+            blocks[index + 1 : end] = [
+                block for block in blocks[index + 1 : end] if block[0]
+            ]
+        else:
+            blocks[index][0] += added
+            count = blocks[index][0]
+            limit = self.lines_per_row * BLOCK_ROWS
+            if count > 2 * limit:
+                blocks[index : index + 1] = [
+                    [min(limit, count - first), None]
+                    for first in range(0, count, limit)
+                ]
+        blocks[index][1] = None
+        self.starts = None
+        # Sent before deletions, the scale is checked once they're done
+        self.timer.start(0)
+
+    def needs_layout(self):
+        """True if the blocks don't add up to the document or the scale is off."""
+        lines = self.line_count()
+        if sum(count for count, _ in self.blocks) != lines:
+            return True
+        rows = lines / self.lines_per_row * self.row_height
+        height = self.height()
+        return rows > 1.25 * height or (
+            rows < 0.5 * height
+            and (self.lines_per_row > 1 or self.row_height < MAX_ROW_HEIGHT)
+        )
+
+    def on_modified(
+        self, position, modification_type, text, length, lines_added, *args
+    ):
+        view = self.view
+        if modification_type & self.before_delete:
+            first = view.SendScintilla(view.SCI_LINEFROMPOSITION, position)
+            last = view.SendScintilla(view.SCI_LINEFROMPOSITION, position + length)
+            if last > first:
+                self.resize_block(first, first - last)
+            else:
+                self.invalidate(first, first)
+        elif modification_type & self.insert:
+            line = view.SendScintilla(view.SCI_LINEFROMPOSITION, position)
+            if lines_added:
+                self.resize_block(line, lines_added)
+            else:
+                self.invalidate(line, line)
+
+    def on_replaced(self, start, end, text):
+        # The deletion was seen before it happened, the insertion wasn't
+        line = self.view.SendScintilla(self.view.SCI_LINEFROMPOSITION, start)
+        lines_added = text.count(b"\n")
+        if lines_added:
+            self.resize_block(line, lines_added)
+        else:
+            self.invalidate(line, line)
+
+    def on_restyled(self, start, end):
+        view = self.view
+        self.invalidate(
+            view.SendScintilla(view.SCI_LINEFROMPOSITION, start),
+            view.SendScintilla(view.SCI_LINEFROMPOSITION, end),
+        )
+
+    def render_blocks(self):
+        """Draw the blocks without a picture, for up to TIME_SLICE at a time."""
+        deadline = time.perf_counter() + TIME_SLICE
+        if self.needs_layout():
+            self.layout_blocks()
+        starts = self.block_starts()
+        for index, block in enumerate(self.blocks):
+            if block[1] is None:
+                block[1] = self.render_block(starts[index], block[0])
+                if time.perf_counter() > deadline:
+                    break
+        else:
+            self.timer.stop()
+        self.update()
+
+    def render_block(self, first, count):
+        view = self.view
+        start = view.SendScintilla(view.SCI_POSITIONFROMLINE, first)
+        end = view.SendScintilla(view.SCI_POSITIONFROMLINE, first + count)
+        if end < 0:
+            end = view.length()
+        # Only moves the gap if it is inside the range
+        address = view.SendScintilla(view.SCI_GETRANGEPOINTER, start, end - start)
+        text = b""
+        if end > start:
+            pointer = sip.voidptr(address)
+            pointer.setsize(end - start)
+            text = bytes(pointer)
+        styles = None
+        if view.lexer is not None:
+            from highlighter import read_styles
+
+            styles = read_styles(view, start, end)
+        pixels = render_lines(
+            text,
+            styles,
+            self.lines_per_row,
+            self.row_height,
+            self.width(),
+            self.palette,
+            self.paper,
+        )
+        image = QImage(
+            pixels.data, pixels.shape[1], pixels.shape[0], QImage.Format_RGB32
+        )
+        # QImage doesn't own the array's memory
+        return image.copy()
+
+    def line_at(self, y):
+        return int(y / self.row_height * self.lines_per_row)
+
+    def line_y(self, line):
+        return line / self.lines_per_row * self.row_height
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.layout_blocks()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor(self.paper))
+        starts = self.block_starts()
+        width = self.width()
+        for (count, image), first in zip(self.blocks, starts):
+            if image is None:
+                continue
+            target = QRectF(0, self.line_y(first), width, self.line_y(count))
+            painter.drawImage(target, image, QRectF(image.rect()))
+        # The lines on screen
+        view = self.view
+        top = view.SendScintilla(
+            view.SCI_DOCLINEFROMVISIBLE,
+            view.SendScintilla(view.SCI_GETFIRSTVISIBLELINE),
+        )
+        on_screen = view.SendScintilla(view.SCI_LINESONSCREEN)
+        outline = QColor(view.color())
+        outline.setAlpha(40)
+        painter.fillRect(
+            QRectF(0, self.line_y(top), width, max(self.line_y(on_screen), 2)), outline
+        )
+
+    def scroll_to(self, y):
+        view = self.view
+        line = min(self.line_at(y), self.line_count() - 1)
+        visible = view.SendScintilla(view.SCI_VISIBLEFROMDOCLINE, max(line, 0))
+        on_screen = view.SendScintilla(view.SCI_LINESONSCREEN)
+        view.SendScintilla(
+            view.SCI_SETFIRSTVISIBLELINE, max(visible - on_screen // 2, 0)
+        )
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.scroll_to(event.y())
+
+    def mouseMoveEvent(self, event):
+        if event.buttons() & Qt.LeftButton:
+            self.scroll_to(event.y())
+
+    def wheelEvent(self, event):
+        # Scrolls the View like a wheel over the text
+        QApplication.sendEvent(self.view.viewport(), event)
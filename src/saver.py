@@ -0,0 +1,155 @@
+import os
+import tempfile
+import threading
+
+from PyQt5.QtCore import QObject, QThreadPool, pyqtSignal
+
+# Bytes written per write() call, also the longest an edit waits on the worker
+CHUNK_SIZE = 1024 * 1024
+
+
+class SaveCancelled(Exception):
+    pass
+
+
+class FileSaver(QObject):
+    """
+    Writes a View's buffer to ``path`` on a worker thread.
+
+    The worker reads straight from Scintilla's character pointer, so the
+    text is never copied into a Python str. If the buffer is edited before
+    the write finishes, the unwritten rest is copied first, keeping the file
+    a snapshot of the document as it was when the save started.
+
+    The data goes to a temporary file next to ``path`` that is fsynced and
+    renamed over it, so a crash leaves either the old file or the new one.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+    failed = pyqtSignal(str)
+
+    def __init__(self, view, path, parent=None, chunk_size=CHUNK_SIZE):
+        super().__init__(parent)
+        self.view = view
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = view.length()
+        self.mode = file_mode(path)
+        # Sent before Scintilla changes the buffer
+        self.before_change = view.SC_MOD_BEFOREINSERT | view.SC_MOD_BEFOREDELETE
+        # Bytes written so far, data starts at base
+        self.offset = 0
+        self.base = 0
+        self.data = None
+        # Set once the buffer changed under the save
+        self.detached = False
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.finished.connect(self.close)
+        self.failed.connect(self.close)
+
+    def start(self):
+        view = self.view
+        # Moves the gap to the end, the pointer stays valid until the next edit
+        pointer = view.SendScintillaPtrResult(view.SCI_GETCHARACTERPOINTER)
+        pointer.setsize(self.size)
+        self.data = memoryview(pointer).toreadonly()
+        view.SCN_MODIFIED.connect(self.on_modified)
+        QThreadPool.globalInstance().start(self.run)
+
+    def on_modified(self, position, modification_type, *args):
+        if modification_type & self.before_change:
+            self.detach()
+
+    def detach(self):
+        """Copy the unwritten bytes so the buffer can change or go away."""
+        with self.lock:
+            if not self.detached and self.data is not None:
+                self.data = bytes(self.data[self.offset - self.base :])
+                self.base = self.offset
+            self.detached = True
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            self.data = None
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def close(self):
+        try:
+            self.view.SCN_MODIFIED.disconnect(self.on_modified)
+        except (RuntimeError, TypeError):
+            # The view is gone or was never connected
+            pass
+
+    def run(self):
+        try:
+            self.write()
+        except SaveCancelled:
+            pass
+        except OSError as e:
+            self.failed.emit(f"{self.path}: {e.strerror or e}")
+        else:
+            self.finished.emit()
+        finally:
+            self.done.set()
+
+    def write(self):
+        directory, name = os.path.split(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    with self.lock:
+                        if self.cancelled:
+                            raise SaveCancelled
+                        start = self.offset - self.base
+                        chunk = self.data[start : start + self.chunk_size]
+                        if not chunk:
+                            # Nothing left to read, the buffer may change freely
+                            self.data = None
+                            break
+                        f.write(chunk)
+                        self.offset += len(chunk)
+                    self.progress.emit(self.offset, self.size)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(temp, self.mode)
+            with self.lock:
+                # A newer save of the same file must not be overwritten
+                if self.cancelled:
+                    raise SaveCancelled
+                os.replace(temp, self.path)
+        except BaseException:
+            try:
+                os.unlink(temp)
+            except OSError:
+                pass
+            raise
+        fsync_directory(directory)
+
+
+def file_mode(path):
+    """Permissions for the new file, mkstemp would leave it 0600."""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        # Reading the umask briefly changes it, keep that off the worker
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def fsync_directory(directory):
+    # Makes the rename itself durable, not possible on Windows
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
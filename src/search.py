@@ -0,0 +1,517 @@
+"""
+Find and replace over a View's buffer.
+
+Searches run on a worker thread straight over Scintilla's character
+pointer, like FileSaver, so the text is never copied into a Python str.
+The buffer is scanned a chunk of whole lines at a time and the matches of
+each chunk are sent back as they are found. Matches don't span lines: one
+that would is looked for again in the line it starts on, so where the
+chunks end doesn't change what is found, and find and replace agree.
+
+Only the matches on the visible lines are marked, an indicator per match
+over a whole 100 MB file costs more than the search itself. Replace all
+applies an edit per match with ``View.replace_ranges``, one undo action
+that only holds the matched text, and a single restyle.
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from PyQt5.QtCore import QObject, QThreadPool, QTimer, Qt, pyqtSignal
+from PyQt5.QtWidgets import (
+    QCheckBox,
+    QHBoxLayout,
+    QLabel,
+    QLineEdit,
+    QPushButton,
+    QShortcut,
+    QToolButton,
+    QWidget,
+)
+
+from theme import THEMES
+
+# Bytes searched per step, also the longest an edit waits on the worker
+CHUNK_SIZE = 256 * 1024
+# The first indicator left to applications (INDIC_CONTAINER)
+INDICATOR = 8
+# Wait for typing to pause before searching again
+DEBOUNCE_MS = 150
+
+NEWLINE = re.compile(rb"\n")
+# Group references and escapes in a template, as re.sub() parses them
+TEMPLATE_ESCAPE = re.compile(
+    rb"\\(?:g<([^>]*)>|(0[0-7]{0,2}|[1-7][0-7]{2})|([1-9][0-9]?)|(.))", re.DOTALL
+)
+ESCAPES = {
+    b"a": b"\a",
+    b"b": b"\b",
+    b"f": b"\f",
+    b"n": b"\n",
+    b"r": b"\r",
+    b"t": b"\t",
+    b"v": b"\v",
+    b"\\": b"\\",
+}
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+def compile_pattern(text, regex=False, case=False, word=False):
+    """A bytes pattern for ``text``, raises ``re.error`` for a bad regex."""
+    pattern = text.encode() if regex else re.escape(text.encode())
+    if word:
+        pattern = rb"\b(?:" + pattern + rb")\b"
+    flags = re.MULTILINE | (0 if case else re.IGNORECASE)
+    return re.compile(pattern, flags)
+
+
+def template(replacement, pattern, regex=False):
+    """
+    ``replacement`` for ``pattern.subn()``. With ``regex`` it's a template
+    where ``\\1`` and ``\\g<name>`` expand to the groups of the match, and a
+    bad group reference raises ``re.error``.
+    """
+    replacement = replacement.encode()
+    if not regex:
+        return replacement.replace(b"\\", b"\\\\")
+    # Parses the template without searching anything
+    pattern.sub(replacement, b"")
+    return replacement
+
+
+def parse_template(template, pattern):
+    """
+    The literal pieces of a ``template`` for ``pattern`` and the numbers of
+    the groups between them, one more piece than groups. ``match.expand()``
+    would parse it again for every match.
+    """
+    literals, groups = [], []
+    position = 0
+    piece = b""
+    for escape in TEMPLATE_ESCAPE.finditer(template):
+        piece += template[position : escape.start()]
+        position = escape.end()
+        name, octal, digits, other = escape.groups()
+        if octal is not None:
+            piece += bytes([int(octal, 8) & 0xFF])
+        elif other is not None:
+            piece += ESCAPES.get(other, b"\\" + other)
+        else:
+            if name is not None:
+                group = (
+                    int(name) if name.isdigit() else pattern.groupindex[name.decode()]
+                )
+            else:
+                group = int(digits)
+            literals.append(piece)
+            groups.append(group)
+            piece = b""
+    literals.append(piece + template[position:])
+    return literals, groups
+
+
+class Search(QObject):
+    """
+    Finds ``pattern`` in a View's buffer on a worker thread.
+
+    ``found`` gets the start and end positions of the matches of each chunk.
+    With a ``template`` it replaces instead: ``replaced`` gets the
+    ``(start, end, text)`` edit of every match, last first, for the GUI
+    thread to apply with ``View.replace_ranges``.
+
+    Any edit to the buffer cancels the search, its results would be stale.
+    """
+
+    found = pyqtSignal(object, object)
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int)
+    replaced = pyqtSignal(object)
+
+    def __init__(
+        self,
+        view,
+        pattern,
+        template=None,
+        parent=None,
+        chunk_size=CHUNK_SIZE,
+        multiline=True,
+    ):
+        super().__init__(parent)
+        self.view = view
+        self.pattern = pattern
+        # Whether a match may span lines, else they aren't checked for it
+        self.multiline = multiline
+        self.template = template
+        self.chunk_size = chunk_size
+        self.size = view.length()
+        self.before_change = view.SC_MOD_BEFOREINSERT | view.SC_MOD_BEFOREDELETE
+        self.data = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.finished.connect(self.close)
+        self.replaced.connect(self.close)
+
+    def start(self):
+        view = self.view
+        # Moves the gap to the end, the pointer stays valid until the next edit
+        pointer = view.SendScintillaPtrResult(view.SCI_GETCHARACTERPOINTER)
+        pointer.setsize(self.size)
+        self.data = memoryview(pointer).toreadonly()
+        view.SCN_MODIFIED.connect(self.on_modified)
+        QThreadPool.globalInstance().start(self.run)
+
+    def on_modified(self, position, modification_type, *args):
+        if modification_type & self.before_change:
+            self.cancel()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            self.data = None
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def close(self):
+        try:
+            self.view.SCN_MODIFIED.disconnect(self.on_modified)
+        except (RuntimeError, TypeError):
+            # The view is gone or was never connected
+            pass
+
+    def run(self):
+        try:
+            if self.template is None:
+                self.find()
+            else:
+                self.replace()
+        except SearchCancelled:
+            pass
+        finally:
+            self.done.set()
+
+    def chunks(self, visit):
+        """Call ``visit(data, start, end)`` under the lock for each chunk of lines."""
+        start = 0
+        while start < self.size:
+            with self.lock:
+                if self.cancelled:
+                    raise SearchCancelled
+                end = start + self.chunk_size
+                newline = NEWLINE.search(self.data, end) if end < self.size else None
+                end = newline.end() if newline else self.size
+                visit(self.data, start, end)
+            self.progress.emit(end, self.size)
+            start = end
+
+    def matches(self, data, start, end):
+        pattern = self.pattern
+        position = start
+        while True:
+            for match in pattern.finditer(data, position, end):
+                # The chunk end looks like the end of the text to the pattern,
+                # an empty match there is found again at the next chunk's start
+                if match.start() == end < self.size:
+                    return
+                if (
+                    not self.multiline
+                    or NEWLINE.search(data, match.start(), match.end()) is None
+                ):
+                    yield match
+                    continue
+                # Spans lines, the line it starts on is searched on its own
+                line_end = NEWLINE.search(data, match.start()).start()
+                yield from pattern.finditer(data, match.start(), line_end)
+                position = line_end + 1
+                break
+            else:
+                return
+
+    def find(self):
+        count = 0
+
+        def visit(data, start, end):
+            nonlocal count
+            starts, ends = array("q"), array("q")
+            for match in self.matches(data, start, end):
+                if match.end() > match.start():
+                    starts.append(match.start())
+                    ends.append(match.end())
+            if starts:
+                count += len(starts)
+                self.found.emit(starts, ends)
+
+        self.chunks(visit)
+        self.finished.emit(count)
+
+    def replace(self):
+        edits = []
+        literals, groups = parse_template(self.template, self.pattern)
+        if not groups:
+            text = literals[0]
+
+        def visit(data, start, end):
+            for match in self.matches(data, start, end):
+                if groups:
+                    pieces = [literals[0]]
+                    for group, literal in zip(groups, literals[1:]):
+                        # An unmatched group expands to nothing
+                        pieces += (match[group] or b"", literal)
+                    edits.append((match.start(), match.end(), b"".join(pieces)))
+                else:
+                    edits.append((match.start(), match.end(), text))
+
+        self.chunks(visit)
+        if edits:
+            edits.reverse()
+            self.replaced.emit(edits)
+        else:
+            self.finished.emit(0)
+
+
+class Finder(QObject):
+    """
+    Incremental find and replace in one View.
+
+    The search restarts when the query changes or the text is edited, and
+    the matches found so far are marked on the visible lines as they come in.
+    """
+
+    # Matches found so far, whether the search is complete
+    counted = pyqtSignal(int, bool)
+    replaced = pyqtSignal(int)
+
+    def __init__(self, view, parent=None):
+        super().__init__(parent)
+        self.view = view
+        self.pattern = None
+        self.regex = False
+        self.multiline = False
+        self.search = None
+        self.complete = False
+        self.starts = array("q")
+        self.ends = array("q")
+        # Range with indicators painted, None when nothing is painted
+        self.painted = None
+        # Direction of a find_next waiting for the search to get further
+        self.pending = None
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(DEBOUNCE_MS)
+        self.timer.timeout.connect(self.run_search)
+
+        theme = THEMES[view.style_name]
+        view.SendScintilla(view.SCI_INDICSETSTYLE, INDICATOR, view.INDIC_ROUNDBOX)
+        view.SendScintilla(
+            view.SCI_INDICSETFORE, INDICATOR, theme.color("findHighlight", "#FFE792")
+        )
+        view.SendScintilla(view.SCI_INDICSETALPHA, INDICATOR, 100)
+        view.SendScintilla(view.SCI_INDICSETUNDER, INDICATOR, True)
+        view.SCN_MODIFIED.connect(self.on_modified)
+        view.SCN_UPDATEUI.connect(self.on_update_ui)
+
+    def set_query(self, text, regex=False, case=False, word=False):
+        """Search for ``text`` from scratch, raises ``re.error`` for a bad regex."""
+        self.pattern = compile_pattern(text, regex, case, word) if text else None
+        self.regex = regex
+        # Plain text can't span lines unless it has a newline
+        self.multiline = regex or "\n" in text
+        self.timer.start()
+
+    def stop(self):
+        if self.search is not None:
+            self.search.cancel()
+            self.search = None
+        self.timer.stop()
+
+    def reset(self):
+        self.stop()
+        self.starts = array("q")
+        self.ends = array("q")
+        self.complete = False
+        self.pending = None
+        self.unpaint()
+
+    def run_search(self):
+        self.reset()
+        if self.pattern is None:
+            self.counted.emit(0, True)
+            return
+        self.search = Search(
+            self.view, self.pattern, parent=self, multiline=self.multiline
+        )
+        self.search.found.connect(self.on_found)
+        self.search.finished.connect(self.on_finished)
+        self.search.start()
+
+    def on_found(self, starts, ends):
+        if self.sender() is not self.search:
+            return
+        self.starts.extend(starts)
+        self.ends.extend(ends)
+        self.paint()
+        self.counted.emit(len(self.starts), False)
+        if self.pending is not None:
+            self.find_next(self.pending)
+
+    def on_finished(self, count):
+        if self.sender() is not self.search:
+            return
+        self.search = None
+        self.complete = True
+        self.counted.emit(len(self.starts), True)
+        if self.pending is not None:
+            self.find_next(self.pending)
+
+    def on_modified(self, position, modification_type, *args):
+        view = self.view
+        # Bulk edits only send the before-change notifications
+        before_change = view.SC_MOD_BEFOREINSERT | view.SC_MOD_BEFOREDELETE
+        if modification_type & before_change:
+            # Positions after the edit are off, search again once it settles
+            self.reset()
+            if self.pattern is not None:
+                self.timer.start()
+
+    def on_update_ui(self, updated, *args):
+        if updated & self.view.SC_UPDATE_V_SCROLL:
+            self.paint()
+
+    def visible_range(self):
+        view = self.view
+        first = view.SendScintilla(view.SCI_GETFIRSTVISIBLELINE)
+        last = first + view.SendScintilla(view.SCI_LINESONSCREEN) + 1
+        first = view.SendScintilla(view.SCI_DOCLINEFROMVISIBLE, first)
+        last = view.SendScintilla(view.SCI_DOCLINEFROMVISIBLE, last)
+        start = view.SendScintilla(view.SCI_POSITIONFROMLINE, first)
+        end = view.SendScintilla(view.SCI_GETLINEENDPOSITION, last)
+        return start, end
+
+    def unpaint(self):
+        if self.painted is not None:
+            view = self.view
+            start, end = self.painted
+            view.SendScintilla(view.SCI_SETINDICATORCURRENT, INDICATOR)
+            view.SendScintilla(view.SCI_INDICATORCLEARRANGE, start, end - start)
+            self.painted = None
+
+    def paint(self):
+        """Mark the matches on the visible lines, clearing the old ones."""
+        view = self.view
+        self.unpaint()
+        start, end = self.visible_range()
+        view.SendScintilla(view.SCI_SETINDICATORCURRENT, INDICATOR)
+        i = bisect_right(self.ends, start)
+        while i < len(self.starts) and self.starts[i] < end:
+            view.SendScintilla(
+                view.SCI_INDICATORFILLRANGE,
+                self.starts[i],
+                self.ends[i] - self.starts[i],
+            )
+            i += 1
+        self.painted = (start, end)
+
+    def find_next(self, backwards=False):
+        """Select the next match after the selection, wrapping around at the end."""
+        view = self.view
+        self.pending = None
+        if backwards:
+            position = view.SendScintilla(view.SCI_GETSELECTIONSTART)
+            i = bisect_right(self.ends, position) - 1
+            if i < 0 and self.complete:
+                i = len(self.starts) - 1
+        else:
+            position = view.SendScintilla(view.SCI_GETSELECTIONEND)
+            i = bisect_left(self.starts, position)
+            if i == len(self.starts) and self.complete:
+                i = 0
+        if 0 <= i < len(self.starts):
+            view.SendScintilla(view.SCI_SETSEL, self.starts[i], self.ends[i])
+        elif not self.complete and self.pattern is not None:
+            # Not found yet, try again as results come in
+            self.pending = backwards
+
+    def replace_all(self, replacement):
+        """Replace every match, raises ``re.error`` for a bad template."""
+        if self.pattern is None:
+            return
+        replacement = template(replacement, self.pattern, self.regex)
+        self.reset()
+        self.search = Search(
+            self.view,
+            self.pattern,
+            replacement,
+            parent=self,
+            multiline=self.multiline,
+        )
+        self.search.replaced.connect(self.on_replaced)
+        self.search.finished.connect(self.on_finished)
+        self.search.start()
+
+    def on_replaced(self, edits):
+        if self.sender() is not self.search:
+            return
+        self.search = None
+        self.view.replace_ranges(edits)
+        self.replaced.emit(len(edits))
+        self.timer.start()
+
+    def close(self):
+        self.reset()
+        for signal, slot in (
+            (self.view.SCN_MODIFIED, self.on_modified),
+            (self.view.SCN_UPDATEUI, self.on_update_ui),
+        ):
+            try:
+                signal.disconnect(slot)
+            except (RuntimeError, TypeError):
+                # The view is gone
+                pass
+
+
+class FindBar(QWidget):
+    """Find and replace fields, shown under the tabs."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(4, 2, 4, 2)
+        self.query = QLineEdit(placeholderText="Find")
+        self.replacement = QLineEdit(placeholderText="Replace with")
+        self.case = QCheckBox("Match case")
+        self.word = QCheckBox("Whole word")
+        self.regex = QCheckBox("Regex")
+        self.previous = QPushButton("Previous")
+        self.next = QPushButton("Next")
+        self.replace_all = QPushButton("Replace All")
+        self.count = QLabel()
+        self.close_button = QToolButton(text="✕", autoRaise=True)
+        for widget in (
+            self.query,
+            self.case,
+            self.word,
+            self.regex,
+            self.previous,
+            self.next,
+            self.replacement,
+            self.replace_all,
+            self.count,
+            self.close_button,
+        ):
+            layout.addWidget(widget)
+        self.close_button.clicked.connect(self.hide)
+        escape = QShortcut(Qt.Key_Escape, self, self.hide)
+        escape.setContext(Qt.WidgetWithChildrenShortcut)
+
+    def options(self):
+        return {
+            "regex": self.regex.isChecked(),
+            "case": self.case.isChecked(),
+            "word": self.word.isChecked(),
+        }
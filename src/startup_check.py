@@ -0,0 +1,112 @@
+"""
+Cold start budget check, fails when Griph-Pad starts slower than it should.
+
+Each run starts a fresh interpreter, builds the Editor window and waits for
+its first event loop turn, where the View is created:
+
+    python startup_check.py --runs 5 --budget 0.6
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds from interpreter start until the window is shown
+BUDGET = 0.6
+# Only imported once a file needs them, never before the window is up
+DEFERRED_MODULES = (
+    "PyQt5.Qsci",
+    "pygments.lexer",
+    "pygments.lexers",
+    "pygments.styles",
+    "editor",
+    "highlighter",
+)
+# Pulls in every Qt module
+FORBIDDEN_MODULES = ("PyQt5.Qt", "PyQt5.QtWebEngineWidgets")
+
+CHILD = """
+import json, os, runpy, sys, time
+start = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv[:1])
+app_module = runpy.run_path({here!r}, run_name="griphpad")
+imported = time.perf_counter()
+window = app_module["Editor"]()
+shown = time.perf_counter()
+early = sorted(sys.modules)
+while window.view is None:
+    app.processEvents()
+ready = time.perf_counter()
+print(json.dumps({{
+    "import": imported - start,
+    "shown": shown - start,
+    "ready": ready - start,
+    "modules": early,
+}}))
+"""
+
+
+def run_once(python, cache):
+    env = dict(
+        os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen")
+    )
+    # The editor recovers journals and caches styles, keep the user's out of it
+    env["XDG_CACHE_HOME"] = env["LOCALAPPDATA"] = cache
+    start = time.perf_counter()
+    output = subprocess.run(
+        [python, "-c", CHILD.format(here=HERE)],
+        cwd=HERE,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process"] = time.perf_counter() - start
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=BUDGET)
+    parser.add_argument("--python", default=sys.executable)
+    options = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="griphpad-startup-") as cache:
+        runs = [run_once(options.python, cache) for _ in range(options.runs)]
+    failures = []
+
+    modules = set(runs[0]["modules"])
+    for name in DEFERRED_MODULES:
+        if name in modules:
+            failures.append(f"{name} is imported before the window is shown")
+    for name in FORBIDDEN_MODULES:
+        if name in modules:
+            failures.append(f"{name} is imported at startup")
+
+    for phase in ("import", "shown", "ready", "process"):
+        median = statistics.median(run[phase] for run in runs)
+        print(f"{phase:>8}: {median * 1000:7.1f} ms (median of {len(runs)})")
+    shown = statistics.median(run["shown"] for run in runs)
+    if shown > options.budget:
+        failures.append(
+            f"window shown after {shown * 1000:.0f} ms, "
+            f"budget is {options.budget * 1000:.0f} ms"
+        )
+
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
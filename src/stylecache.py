@@ -0,0 +1,148 @@
+"""
+On-disk cache of highlighting results, so reopening an unchanged file
+paints highlighted straight away instead of lexing it again.
+
+Entries hold the style bytes of the styled start of a document plus the
+lexer state and fold data at each of its lines. They are keyed by a hash of the file
+contents, the Pygments lexer and style, and the Pygments version. The
+cache is bounded, least recently used entries are removed first.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from array import array
+from pathlib import Path
+
+# Bumped whenever the entry layout changes
+FORMAT = 3
+MAX_SIZE = 256 * 1024 * 1024
+# Smaller documents lex faster than the cache round trip is worth
+MIN_DOCUMENT_SIZE = 256 * 1024
+# Line state index for lines whose state isn't known
+UNKNOWN = 0
+
+
+def default_directory():
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "Griph-Pad" / "styles"
+
+
+def content_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def pack_states(line_states):
+    """Line states as a table of the distinct states plus an index per line."""
+    table = {}
+    indices = array("I")
+    for state in line_states:
+        if state is None:
+            indices.append(UNKNOWN)
+        else:
+            indices.append(table.setdefault(state, len(table) + 1))
+    return [list(state) for state in table], indices.tobytes()
+
+
+def unpack_states(table, indices):
+    states = [None] + [tuple(state) for state in table]
+    unpacked = array("I")
+    unpacked.frombytes(indices)
+    return [states[index] for index in unpacked]
+
+
+def write_entry(path, header, blobs, format=FORMAT):
+    """
+    Write ``header`` as a line of JSON followed by each of ``blobs``
+    compressed. The file is replaced atomically.
+    """
+    compressed = [zlib.compress(blob, 1) for blob in blobs]
+    header = dict(header, format=format, blobs=[len(blob) for blob in compressed])
+    fd, temp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            for blob in compressed:
+                f.write(blob)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+
+
+def read_entry(path, format=FORMAT):
+    """``(header, blobs)`` as written by ``write_entry``."""
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != format:
+            raise ValueError(f"{path}: unknown format {header.get('format')}")
+        blobs = [zlib.decompress(f.read(size)) for size in header["blobs"]]
+    return header, blobs
+
+
+class StyleCache:
+    def __init__(self, directory=None, max_size=MAX_SIZE):
+        self.directory = Path(directory) if directory else default_directory()
+        self.max_size = max_size
+
+    def path(self, key):
+        name = hashlib.blake2b(json.dumps(key).encode(), digest_size=16).hexdigest()
+        return self.directory / f"{name}.styles"
+
+    def get(self, key, length):
+        """
+        ``(styles, line_states, folds)`` cached for ``key``, or None. ``length`` is
+        the document size in bytes, entries for another size are ignored.
+        """
+        path = self.path(key)
+        try:
+            header, (styles, indices, folds) = read_entry(path)
+            if header["key"] != list(key) or header["length"] != length:
+                return None
+            # Last use time, what eviction goes by
+            os.utime(path)
+            return styles, unpack_states(header["states"], indices), folds
+        except (OSError, ValueError, KeyError, zlib.error):
+            return None
+
+    def put(self, key, length, styles, line_states, folds):
+        table, indices = pack_states(line_states)
+        header = {"key": list(key), "length": length, "states": table}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_entry(self.path(key), header, (styles, indices, folds))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(".styles"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        if self.directory.is_dir():
+            for path in self.directory.glob("*.styles"):
+                path.unlink()
+
+
+STYLE_CACHE = StyleCache()
@@ -0,0 +1,109 @@
+"""
+Editor colour themes, the JSON files in the ``themes`` directory.
+
+Nothing is read at import: the directory is indexed on the first lookup and
+each theme is parsed the first time it is used.
+"""
+import json
+import os
+from pathlib import Path
+
+from PyQt5.QtGui import QColor
+
+# Next to this module, not the working directory
+THEMES_DIR = Path(__file__).resolve().parent / "themes"
+
+
+def parse_color(value):
+    # Themes use #RRGGBBAA for translucent colours, Qt reads 8 digits as #AARRGGBB
+    if isinstance(value, str) and len(value) == 9 and value.startswith("#"):
+        color = QColor(value[:7])
+        color.setAlpha(int(value[7:], 16))
+        return color
+    return QColor(value)
+
+
+class Theme:
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.reload()
+
+    def reload(self):
+        with open(self.path, encoding="utf-8") as f:
+            self.data = json.load(f)
+        # Parsed QColors by key
+        self.colors = {}
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def color(self, key, default=None):
+        """``key`` as a QColor, ``default`` (a colour string) if it's unset."""
+        try:
+            return self.colors[key]
+        except KeyError:
+            pass
+        value = self.data.get(key, default)
+        color = self.colors[key] = None if value is None else parse_color(value)
+        return color
+
+
+class ThemeRegistry:
+    def __init__(self, directory=THEMES_DIR):
+        self.directory = Path(directory)
+        # Theme file per name, None until the first lookup
+        self.paths = None
+        self.themes = {}
+
+    def index(self):
+        if self.paths is None:
+            self.paths = {}
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    name, ext = os.path.splitext(entry.name)
+                    if ext == ".json" and entry.is_file():
+                        self.paths[name] = Path(entry.path)
+        return self.paths
+
+    def names(self):
+        return sorted(self.index())
+
+    def __contains__(self, name):
+        return name in self.themes or name in self.index()
+
+    def __getitem__(self, name):
+        try:
+            return self.themes[name]
+        except KeyError:
+            pass
+        try:
+            path = self.index()[name]
+        except KeyError:
+            raise KeyError(f"No theme named {name!r} in {self.directory}") from None
+        theme = self.themes[name] = Theme(name, path)
+        return theme
+
+    def reload(self, name=None):
+        """
+        Re-read ``name`` (or every loaded theme) from disk and rescan the
+        directory. Loaded Theme objects are updated in place, so views
+        holding them only need to re-apply their colours.
+        """
+        self.paths = None
+        names = list(self.themes) if name is None else [name]
+        for theme_name in names:
+            # Themes not loaded yet are read fresh on first use anyway
+            theme = self.themes.get(theme_name)
+            if theme is not None:
+                theme.path = self.index().get(theme_name, theme.path)
+                theme.reload()
+
+
+THEMES = ThemeRegistry()
@@ -0,0 +1,574 @@
+"""
+Workspace folders: the files under a folder, scanned in the background,
+and a trigram index of their paths and contents.
+
+Files ignored by .gitignore are left out, as are the directories of
+version control systems. Quick-open and Find in Files ask the index which files contain every
+three byte sequence of the query and only look at those. The index is
+kept in the cache directory between sessions. A rescan stats the tree
+and only reads the files whose size or modification time changed.
+
+Trigrams are taken from ASCII-lowercased lines with their leading and
+trailing whitespace stripped, so lookups are case-insensitive and never
+span lines, like the searches they serve. Candidates still have to be
+checked against the real query. A changed or removed file leaves its old
+id in the posting lists until the index is compacted.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import zlib
+from array import array
+from functools import partial
+
+from PyQt5.QtCore import QObject, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtWidgets import QLineEdit, QListWidget, QShortcut, QVBoxLayout, QWidget
+
+from gitignore import NAME as IGNORE_FILE
+from gitignore import IgnoreRules, is_ignored, is_path_ignored, rules_for
+from stylecache import default_directory as style_directory
+from stylecache import read_entry, write_entry
+
+# Bumped whenever the index layout changes
+FORMAT = 1
+# Bigger files aren't indexed, they are candidates for every search
+MAX_INDEXED_SIZE = 1024 * 1024
+# Bytes checked for a NUL to tell binary files
+BINARY_SNIFF = 8192
+SKIPPED_DIRECTORIES = frozenset({".git", ".hg", ".svn", "__pycache__", "node_modules"})
+# Files scanned between progress signals
+BATCH = 512
+# Compact once this share of the file ids belong to removed files
+DEAD_RATIO = 0.25
+# Seconds between saves of the index while single files are refreshed
+SAVE_INTERVAL = 60
+QUICK_OPEN_LIMIT = 100
+
+# File kinds
+TEXT, LARGE, BINARY = 0, 1, 2
+
+# Verbose regexes ignore whitespace, their text isn't what they match
+VERBOSE_FLAG = re.compile(r"\(\?[aiLmsux]*x")
+# Characters after the letter of a code point escape
+ESCAPE_OPERANDS = {"x": 2, "u": 4, "U": 8}
+EMPTY = array("I")
+
+
+def default_directory():
+    return style_directory().with_name("workspaces")
+
+
+def trigrams(data):
+    """The trigrams of the lines of ``data`` as ints, see the module docstring."""
+    grams = set()
+    for line in set(data.lower().split(b"\n")):
+        line = line.strip()
+        grams.update(zip(line, line[1:], line[2:]))
+    return {a << 16 | b << 8 | c for a, b, c in grams}
+
+
+def required_literals(text, regex=False):
+    """
+    Strings every match of ``text`` contains. For a regex only the runs of
+    plain characters outside groups and classes count, and none at all
+    when it has alternatives.
+    """
+    if not regex:
+        return [text]
+    if "|" in text or VERBOSE_FLAG.search(text):
+        return []
+    literals = []
+    run = ""
+    i = 0
+    while i < len(text):
+        char = text[i]
+        i += 1
+        if char == "\\" and i < len(text):
+            escaped = text[i]
+            i += 1
+            if not escaped.isalnum():
+                run += escaped
+                continue
+            # A class, anchor, code point or group reference ends the run,
+            # its operands aren't plain characters either
+            if escaped in ESCAPE_OPERANDS:
+                i += ESCAPE_OPERANDS[escaped]
+            elif escaped == "N" and text.startswith("{", i):
+                i = text.find("}", i) + 1 or len(text)
+            elif escaped.isdigit():
+                # Octal escapes have up to three digits, group numbers two
+                end = min(i + 2, len(text))
+                while i < end and text[i].isdigit():
+                    i += 1
+        elif char in "[(":
+            # Skip to the closing bracket, nested groups and escapes included
+            depth = 1
+            closing = "]" if char == "[" else ")"
+            while i < len(text) and depth:
+                if text[i] == "\\":
+                    i += 1
+                elif text[i] == char and char == "(":
+                    depth += 1
+                elif text[i] == closing:
+                    depth -= 1
+                i += 1
+        elif char in "?*{":
+            # The character before is optional
+            run = run[:-1]
+            if char == "{":
+                i = text.find("}", i) + 1 or len(text)
+        elif char == "+":
+            pass
+        elif char not in ".^$)":
+            run += char
+            continue
+        literals.append(run)
+        run = ""
+    literals.append(run)
+    return [literal for literal in literals if len(literal.strip()) >= 3]
+
+
+def post(postings, grams, file_id):
+    for gram in grams:
+        ids = postings.get(gram)
+        if ids is None:
+            ids = postings[gram] = array("I")
+        ids.append(file_id)
+
+
+def pack_postings(postings):
+    keys = array("I", postings)
+    counts = array("I", map(len, postings.values()))
+    ids = array("I")
+    for file_ids in postings.values():
+        ids.extend(file_ids)
+    return keys.tobytes(), counts.tobytes(), ids.tobytes()
+
+
+def unpack_postings(keys, counts, ids):
+    unpacked = [array("I", blob) for blob in (keys, counts, ids)]
+    postings = {}
+    offset = 0
+    for key, count in zip(unpacked[0], unpacked[1]):
+        postings[key] = unpacked[2][offset : offset + count]
+        offset += count
+    return postings
+
+
+class TrigramIndex:
+    """
+    The files under a folder, ``[path, size, mtime_ns, kind]`` per id with
+    paths relative to the folder and ``/`` separated, and the ids of the
+    files with each trigram in their path and in their text.
+    """
+
+    def __init__(self):
+        # None for ids of removed files
+        self.files = []
+        self.ids = {}
+        self.path_postings = {}
+        self.text_postings = {}
+        self.dead = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_current(self, path, size, mtime):
+        file_id = self.ids.get(path)
+        return file_id is not None and self.files[file_id][1:3] == [size, mtime]
+
+    def add(self, path, size, mtime, kind, grams=()):
+        """Index ``path``, ``grams`` are the trigrams of its text."""
+        self.remove(path)
+        file_id = len(self.files)
+        self.files.append([path, size, mtime, kind])
+        self.ids[path] = file_id
+        post(self.path_postings, trigrams(path.encode()), file_id)
+        post(self.text_postings, grams, file_id)
+
+    def remove(self, path):
+        file_id = self.ids.pop(path, None)
+        if file_id is not None:
+            self.files[file_id] = None
+            self.dead += 1
+
+    def lookup(self, postings, grams):
+        """Ids of the live files with all of ``grams``."""
+        lists = sorted((postings.get(gram, EMPTY) for gram in grams), key=len)
+        found = set(lists[0])
+        for ids in lists[1:]:
+            if not found:
+                break
+            found.intersection_update(ids)
+        files = self.files
+        return {file_id for file_id in found if files[file_id] is not None}
+
+    def find_paths(self, query, limit=QUICK_OPEN_LIMIT):
+        """
+        Paths containing every word of ``query``, those with the last word
+        in their file name first, then shorter ones.
+        """
+        words = query.lower().split()
+        if not words:
+            return []
+        grams = set()
+        for word in words:
+            grams |= trigrams(word.encode())
+        if grams:
+            ids = self.lookup(self.path_postings, grams)
+        else:
+            ids = self.ids.values()
+        found = []
+        for file_id in ids:
+            path = self.files[file_id][0]
+            lowered = path.lower()
+            if all(word in lowered for word in words):
+                name = lowered.rsplit("/", 1)[-1]
+                found.append((words[-1] not in name, len(path), path))
+        found.sort()
+        return [path for _, _, path in found[:limit]]
+
+    def candidates(self, literals):
+        """
+        ``(path, size)`` of the files that can contain all of ``literals``,
+        sorted by path. All of them when the literals are too short to
+        narrow the search. Binary files are left out, files too big to
+        index are always in.
+        """
+        grams = set()
+        for literal in literals:
+            grams |= trigrams(literal.encode())
+        files = self.files
+        if grams:
+            found = [
+                files[file_id] for file_id in self.lookup(self.text_postings, grams)
+            ]
+            found.extend(
+                file for file in files if file is not None and file[3] == LARGE
+            )
+        else:
+            found = [file for file in files if file is not None and file[3] != BINARY]
+        return sorted((file[0], file[1]) for file in found)
+
+    def compacted(self):
+        """A copy without the ids of removed files."""
+        index = TrigramIndex()
+        renumbered = array("I", bytes(4 * len(self.files)))
+        for file_id, file in enumerate(self.files):
+            if file is not None:
+                renumbered[file_id] = len(index.files)
+                index.ids[file[0]] = len(index.files)
+                index.files.append(file)
+        files = self.files
+        for postings, compact in (
+            (self.path_postings, index.path_postings),
+            (self.text_postings, index.text_postings),
+        ):
+            for gram, ids in postings.items():
+                ids = array("I", [renumbered[i] for i in ids if files[i] is not None])
+                if ids:
+                    compact[gram] = ids
+        return index
+
+    def save(self, path, root):
+        header = {"root": root, "files": self.files, "dead": self.dead}
+        blobs = pack_postings(self.path_postings) + pack_postings(self.text_postings)
+        write_entry(path, header, blobs, FORMAT)
+
+    @classmethod
+    def load(cls, path, root):
+        header, blobs = read_entry(path, FORMAT)
+        if header["root"] != root:
+            raise ValueError(f"{path}: index of {header['root']}")
+        index = cls()
+        index.files = header["files"]
+        index.dead = header["dead"]
+        index.ids = {
+            file[0]: file_id
+            for file_id, file in enumerate(index.files)
+            if file is not None
+        }
+        index.path_postings = unpack_postings(*blobs[:3])
+        index.text_postings = unpack_postings(*blobs[3:])
+        return index
+
+
+class Workspace(QObject):
+    """
+    A folder open in the editor and its TrigramIndex, kept current on a
+    worker thread.
+
+    ``refresh()`` rescans the whole tree, ``refresh(paths)`` only the given
+    files, e.g. one just saved. Queries lock the index for as long as they
+    take, the worker only while it adds or removes a file. The index file
+    is written after each scan, but after refreshed files only every
+    ``SAVE_INTERVAL`` seconds, and by ``close()`` if anything is left.
+    """
+
+    # Files scanned so far, files indexed so far
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+
+    def __init__(self, root, parent=None, directory=None):
+        super().__init__(parent)
+        self.root = os.path.abspath(root)
+        self.directory = directory or default_directory()
+        name = hashlib.blake2b(self.root.encode(), digest_size=16).hexdigest()
+        self.path = os.path.join(self.directory, f"{name}.index")
+        self.index = TrigramIndex()
+        self.loaded = False
+        # Whether a full scan finished, until then files are missing from
+        # the index or stale
+        self.scanned = False
+        # Guards the index and the pending work below
+        self.lock = threading.Lock()
+        self.full_scan = False
+        self.queued = set()
+        self.running = False
+        self.cancelled = False
+        self.done = threading.Event()
+        self.done.set()
+        # When the index file was last written, and changes since then
+        self.saved_at = float("-inf")
+        self.unsaved = False
+
+    def refresh(self, paths=None):
+        with self.lock:
+            if paths is None:
+                self.full_scan = True
+            else:
+                self.queued.update(os.path.abspath(path) for path in paths)
+            if self.running:
+                # Picked up when the current scan ends
+                return
+            self.running = True
+            self.done.clear()
+        QThreadPool.globalInstance().start(self.run)
+
+    def close(self):
+        self.cancelled = True
+        self.done.wait()
+        if self.unsaved:
+            self.save()
+
+    def relative(self, path):
+        """``path`` relative to the root, None if it's outside the folder."""
+        path = os.path.abspath(path)
+        if not path.startswith(self.root + os.sep):
+            return None
+        return path[len(self.root) + 1 :].replace(os.sep, "/")
+
+    def absolute(self, path):
+        return os.path.join(self.root, *path.split("/"))
+
+    def find_paths(self, query, limit=QUICK_OPEN_LIMIT):
+        with self.lock:
+            return self.index.find_paths(query, limit)
+
+    def candidates(self, literals):
+        with self.lock:
+            return self.index.candidates(literals)
+
+    def file_count(self):
+        with self.lock:
+            return len(self.index)
+
+    def run(self):
+        try:
+            if not self.loaded:
+                self.load()
+            while True:
+                with self.lock:
+                    # Decided under the lock, refresh() starts a new run otherwise
+                    if self.cancelled or not (self.full_scan or self.queued):
+                        self.running = False
+                        self.done.set()
+                        return
+                    full_scan, self.full_scan = self.full_scan, False
+                    queued, self.queued = self.queued, set()
+                changed = self.scan() if full_scan else False
+                for path in queued:
+                    changed |= self.update(path)
+                if self.cancelled:
+                    continue
+                if full_scan:
+                    self.scanned = True
+                if changed:
+                    self.compact()
+                    if full_scan or time.monotonic() - self.saved_at > SAVE_INTERVAL:
+                        self.save()
+                    else:
+                        # Written with a later change, or by close()
+                        self.unsaved = True
+                self.finished.emit()
+        except BaseException:
+            with self.lock:
+                self.running = False
+                self.done.set()
+            raise
+
+    def load(self):
+        self.loaded = True
+        try:
+            index = TrigramIndex.load(self.path, self.root)
+        except (OSError, ValueError, KeyError, zlib.error):
+            # Missing or outdated, the scan indexes everything
+            return
+        with self.lock:
+            self.index = index
+
+    def save(self):
+        self.saved_at = time.monotonic()
+        self.unsaved = False
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self.index.save(self.path, self.root)
+        except OSError:
+            # Only a cache, the next session scans everything again
+            pass
+
+    def compact(self):
+        index = self.index
+        if index.dead > DEAD_RATIO * len(index.files):
+            # Only this thread changes the index, queries go on meanwhile
+            compacted = index.compacted()
+            with self.lock:
+                self.index = compacted
+
+    def scan(self):
+        """Walk the folder, index new and changed files and drop removed ones."""
+        seen = set()
+        indexed = 0
+        changed = False
+        # (directory, its path relative to the root, the .gitignore rules above it)
+        pending = [(self.root, "", rules_for(self.root, ""))]
+        while pending and not self.cancelled:
+            directory, prefix, chain = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            if prefix and any(entry.name == IGNORE_FILE for entry in entries):
+                rules = IgnoreRules.read(os.path.join(directory, IGNORE_FILE), prefix)
+                if rules is not None:
+                    chain = chain + [rules]
+            for entry in entries:
+                if self.cancelled:
+                    # close() waits, a big directory shouldn't hold it up
+                    break
+                path = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in SKIPPED_DIRECTORIES and not is_ignored(
+                            chain, path, True
+                        ):
+                            pending.append((entry.path, path + "/", chain))
+                        continue
+                    if not entry.is_file() or is_ignored(chain, path, False):
+                        continue
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                seen.add(path)
+                if not self.index.is_current(path, stat.st_size, stat.st_mtime_ns):
+                    self.add(entry.path, path, stat)
+                    indexed += 1
+                    changed = True
+                if len(seen) % BATCH == 0:
+                    self.progress.emit(len(seen), indexed)
+        if self.cancelled:
+            return changed
+        removed = self.index.ids.keys() - seen
+        with self.lock:
+            for path in removed:
+                self.index.remove(path)
+        self.progress.emit(len(seen), indexed)
+        return changed or bool(removed)
+
+    def update(self, absolute):
+        path = self.relative(absolute)
+        if path is None:
+            return False
+        try:
+            stat = os.stat(absolute)
+        except OSError:
+            with self.lock:
+                self.index.remove(path)
+            return True
+        if self.index.is_current(path, stat.st_size, stat.st_mtime_ns):
+            return False
+        if path not in self.index.ids and is_path_ignored(self.root, path):
+            return False
+        self.add(absolute, path, stat)
+        return True
+
+    def add(self, absolute, path, stat):
+        kind, grams = TEXT, ()
+        try:
+            with open(absolute, "rb") as f:
+                data = f.read(MAX_INDEXED_SIZE + 1)
+        except OSError:
+            data = b""
+        if b"\0" in data[:BINARY_SNIFF]:
+            kind = BINARY
+        elif len(data) > MAX_INDEXED_SIZE:
+            kind = LARGE
+        else:
+            grams = trigrams(data)
+        with self.lock:
+            self.index.add(path, stat.st_size, stat.st_mtime_ns, kind, grams)
+
+
+class QuickOpen(QWidget):
+    """A popup to open a workspace file by typing part of its path."""
+
+    # Absolute path of the chosen file
+    opened = pyqtSignal(str)
+
+    def __init__(self, workspace, parent=None):
+        super().__init__(parent, Qt.Popup)
+        self.workspace = workspace
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(4, 4, 4, 4)
+        self.query = QLineEdit()
+        self.query.setPlaceholderText("Go to file")
+        self.query.textChanged.connect(self.update_results)
+        self.query.returnPressed.connect(self.open_current)
+        self.results = QListWidget()
+        self.results.itemActivated.connect(self.open_current)
+        layout.addWidget(self.query)
+        layout.addWidget(self.results)
+        # Up and down move through the results while typing
+        QShortcut(Qt.Key_Down, self, partial(self.move_current, 1))
+        QShortcut(Qt.Key_Up, self, partial(self.move_current, -1))
+
+    def popup(self):
+        parent = self.parentWidget()
+        width = max(parent.width() // 2, 300)
+        self.resize(width, 300)
+        corner = parent.mapToGlobal(parent.rect().topLeft())
+        self.move(corner.x() + (parent.width() - width) // 2, corner.y() + 40)
+        self.query.clear()
+        self.update_results()
+        self.show()
+        self.query.setFocus()
+
+    def update_results(self):
+        self.results.clear()
+        self.results.addItems(self.workspace.find_paths(self.query.text()))
+        self.results.setCurrentRow(0)
+
+    def move_current(self, step):
+        row = self.results.currentRow() + step
+        if 0 <= row < self.results.count():
+            self.results.setCurrentRow(row)
+
+    def open_current(self):
+        item = self.results.currentItem()
+        if item is not None:
+            self.hide()
+            self.opened.emit(self.workspace.absolute(item.text()))
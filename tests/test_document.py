@@ -0,0 +1,88 @@
+import sys
+
+import filewatch
+from document import Document
+
+
+class QueuedPool:
+    """Stands in for the thread pool, runs what was started on ``run_all()``."""
+
+    def __init__(self):
+        self.queued = []
+
+    def globalInstance(self):
+        return self
+
+    def start(self, run):
+        self.queued.append(run)
+
+    def run_all(self):
+        queued, self.queued = self.queued, []
+        for run in queued:
+            run()
+
+
+def wait_loaded(qapp, document):
+    while document.loader is not None:
+        qapp.processEvents()
+
+
+def test_reload_cancelled_by_an_edit_is_retried(qapp, tmp_path, monkeypatch):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"one\ntwo\n")
+    document = Document(minimap=False)
+    document.open(str(path))
+    wait_loaded(qapp, document)
+    view = document.view
+
+    pool = QueuedPool()
+    monkeypatch.setattr(filewatch, "QThreadPool", pool)
+    path.write_bytes(b"one\ntwo\nthree\n")
+    document.check_disk()
+    # Edited before the worker compares the file with the buffer
+    view.SendScintilla(view.SCI_INSERTTEXT, 0, b"zero\n")
+    pool.run_all()
+    assert document.reloader is None
+
+    # The edit is saved, then the file changes again
+    path.write_bytes(b"zero\none\ntwo\n")
+    document.ignore_disk_change()
+    view.setModified(False)
+    path.write_bytes(b"zero\none\ntwo\nfour\n")
+    document.check_disk()
+    pool.run_all()
+    assert view.text_range(0, view.length()) == b"zero\none\ntwo\nfour\n"
+    assert document.can_hibernate()
+    document.close()
+
+
+def test_minimap_without_numpy(qapp, monkeypatch):
+    monkeypatch.setitem(sys.modules, "numpy", None)
+    monkeypatch.delitem(sys.modules, "minimap", raising=False)
+    document = Document(minimap=False)
+    document.create_view()
+    assert not document.set_minimap(True)
+    assert document.minimap is None
+
+
+def test_invalid_utf8_opens_read_only(qapp, tmp_path, monkeypatch):
+    path = tmp_path / "latin1.txt"
+    path.write_bytes("café\n".encode("latin-1"))
+    document = Document(minimap=False)
+    document.open(str(path))
+    wait_loaded(qapp, document)
+    view = document.view
+    assert document.lossy
+    assert view.isReadOnly()
+    assert view.text_range(0, view.length()) == "caf�\n".encode("utf-8")
+
+    # Fixed by another program, the reload makes it editable again
+    pool = QueuedPool()
+    monkeypatch.setattr(filewatch, "QThreadPool", pool)
+    path.write_bytes("café\n".encode("utf-8"))
+    document.check_disk()
+    pool.run_all()
+    assert not document.lossy
+    assert not view.isReadOnly()
+    assert view.text_range(0, view.length()) == "café\n".encode("utf-8")
+    document.close()
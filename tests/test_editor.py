@@ -0,0 +1,53 @@
+import pytest
+
+import editor
+from editor import View
+
+
+def make_view(qapp, text):
+    view = View(None, "monokai")
+    view.SendScintilla(view.SCI_APPENDTEXT, len(text), text)
+    view.SendScintilla(view.SCI_EMPTYUNDOBUFFER)
+    return view
+
+
+def text(view):
+    return view.text_range(0, view.length())
+
+
+# Selections moved by Scintilla, or dropped and rebuilt
+@pytest.mark.parametrize("moved", [editor.MAX_MOVED_SELECTIONS, 1])
+def test_bulk_edit_is_one_undo_step(qapp, monkeypatch, moved):
+    monkeypatch.setattr(editor, "MAX_MOVED_SELECTIONS", moved)
+    view = make_view(qapp, b"one\ntwo\nthree\n")
+    replaced = []
+    view.replaced.connect(lambda *edit: replaced.append(edit))
+    view.set_selections([(0, 0), (4, 4), (8, 8)])
+    view.insert_at_carets("> ")
+    assert text(view) == b"> one\n> two\n> three\n"
+    assert view.selections() == [(2, 2), (8, 8), (14, 14)]
+    # An edit per caret, the text between them isn't rewritten
+    assert replaced == [(8, 8, b"> "), (4, 4, b"> "), (0, 0, b"> ")]
+    view.undo()
+    assert text(view) == b"one\ntwo\nthree\n"
+    assert not view.SendScintilla(view.SCI_CANUNDO)
+    view.redo()
+    assert text(view) == b"> one\n> two\n> three\n"
+
+
+def test_bulk_edit_overlapping_selections(qapp):
+    view = make_view(qapp, b"abcdef")
+    view.bulk_edit([(2, 4, b"Y", 1, 1), (1, 3, b"X", 0, 1), (4, 5, b"Z", 1, 1)])
+    # Each edit starts where the one before it ended
+    assert text(view) == b"aXYZf"
+    assert view.selections() == [(1, 2), (3, 3), (4, 4)]
+    view.undo()
+    assert text(view) == b"abcdef"
+
+
+def test_backspace_at_adjacent_carets(qapp):
+    view = make_view(qapp, b"abcd")
+    view.set_selections([(2, 2), (3, 3)])
+    view.delete_at_carets()
+    assert text(view) == b"ad"
+    assert view.selections() == [(1, 1), (1, 1)]
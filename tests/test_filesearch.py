@@ -0,0 +1,31 @@
+import time
+
+import filesearch
+from filesearch import FileSearch
+from search import compile_pattern
+from workspace import Workspace
+
+
+def test_search_waits_for_the_first_scan(qapp, tmp_path):
+    root = tmp_path / "tree"
+    root.mkdir()
+    for name in ("a.txt", "b.txt"):
+        (root / name).write_text("needle\n")
+    folder = Workspace(str(root), directory=str(tmp_path / "cache"))
+    search = FileSearch(folder, compile_pattern("needle"), ["needle"])
+    events = []
+    search.waiting.connect(lambda: events.append("waiting"))
+    search.found.connect(lambda results: events.extend(path for path, _ in results))
+    search.finished.connect(lambda hits: events.append(hits))
+    try:
+        search.start()
+        assert events == ["waiting"]
+
+        folder.refresh()
+        deadline = time.monotonic() + 60
+        while events[-1] != 2 and time.monotonic() < deadline:
+            qapp.processEvents()
+        assert events == ["waiting", "a.txt", "b.txt", 2]
+    finally:
+        folder.close()
+        filesearch.shutdown_pool()
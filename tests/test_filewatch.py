@@ -0,0 +1,95 @@
+import random
+
+import pytest
+
+from filewatch import diff_sequences, line_diff
+
+
+def apply_spans(a, b, spans):
+    """``a`` with each span's items replaced by those of ``b``."""
+    result = []
+    position = 0
+    for i1, i2, j1, j2 in spans:
+        assert position <= i1 <= i2
+        result += a[position:i1] + b[j1:j2]
+        position = i2
+    return result + a[position:]
+
+
+def apply_edits(old, edits):
+    for start, end, text in edits:
+        old = old[:start] + text + old[end:]
+    return old
+
+
+@pytest.mark.parametrize(
+    "a, b, spans",
+    [
+        ("abc", "abc", []),
+        ("ac", "abc", [(1, 1, 1, 2)]),
+        ("abc", "ac", [(1, 2, 1, 1)]),
+        ("abc", "axc", [(1, 2, 1, 2)]),
+        ("", "ab", [(0, 0, 0, 2)]),
+        ("ab", "", [(0, 2, 0, 0)]),
+        ("abcd", "xbcy", [(0, 1, 0, 1), (3, 4, 3, 4)]),
+    ],
+)
+def test_diff_sequences(a, b, spans):
+    assert [tuple(span) for span in diff_sequences(list(a), list(b))] == spans
+
+
+def test_diff_sequences_gives_up_past_max_changes():
+    assert diff_sequences(list("abcd"), list("wxyz"), max_changes=4) is None
+    assert diff_sequences(list("abcd"), list("wxyz"), max_changes=8) is not None
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        (b"one\ntwo\n", b"one\ntwo\n"),
+        (b"one\nthree\n", b"one\ntwo\nthree\n"),
+        (b"one\ntwo\nthree\n", b"one\nthree\n"),
+        (b"one\ntwo\nthree\n", b"one\n2\nthree\n"),
+        (b"", b"one\ntwo\n"),
+        (b"one\ntwo\n", b""),
+        (b"one\ntwo", b"one\ntwo\nthree"),
+        (b"one\r\ntwo\r\n", b"one\r\n2\r\n"),
+    ],
+)
+def test_line_diff_round_trip(old, new):
+    edits = line_diff(old, new)
+    assert apply_edits(old, edits) == new
+    assert [start for start, _, _ in edits] == sorted(
+        (start for start, _, _ in edits), reverse=True
+    )
+
+
+def test_line_diff_replaces_only_changed_lines():
+    old = b"".join(b"line %d\n" % i for i in range(100))
+    new = old.replace(b"line 10\n", b"ten\n").replace(b"line 90\n", b"")
+    edits = line_diff(old, new)
+    assert edits == [
+        (old.index(b"line 90\n"), old.index(b"line 91\n"), b""),
+        (old.index(b"line 10\n"), old.index(b"line 11\n"), b"ten\n"),
+    ]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_diffs_round_trip(seed):
+    rnd = random.Random(seed)
+    lines = [b"%d\n" % rnd.randrange(8) for _ in range(rnd.randrange(30))]
+    old = b"".join(lines)
+    for _ in range(rnd.randrange(6)):
+        i = rnd.randint(0, len(lines))
+        if rnd.random() < 0.5 or not lines:
+            lines.insert(i, b"%d\n" % rnd.randrange(8))
+        else:
+            del lines[min(i, len(lines) - 1)]
+    new = b"".join(lines)
+    if rnd.random() < 0.3:
+        new = new.rstrip(b"\n")
+    spans = diff_sequences(old.splitlines(True), new.splitlines(True))
+    assert apply_spans(old.splitlines(True), new.splitlines(True), spans) == (
+        new.splitlines(True)
+    )
+    assert apply_edits(old, line_diff(old, new)) == new
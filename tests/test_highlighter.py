@@ -0,0 +1,145 @@
+import pytest
+
+from editor import View
+from highlighter import read_styles
+
+SOURCE = (
+    b"def function(argument):\n"
+    b"    '''Docstring\n"
+    b"    over lines'''\n"
+    b"    value = [argument, (1, 2),\n"
+    b"             {'key': 3}]\n"
+    b"    return value\n"
+    b"\n"
+)
+
+
+def make_view(qapp, text, lazy_margin=100, language="python"):
+    view = View(language, "monokai", lazy_margin)
+    view.SendScintilla(view.SCI_APPENDTEXT, len(text), text)
+    return view
+
+
+def colourise(view, line):
+    """Style up to ``line`` like Scintilla does for the lines in view."""
+    end = view.SendScintilla(view.SCI_POSITIONFROMLINE, line)
+    view.SendScintilla(
+        view.SCI_COLOURISE, view.SendScintilla(view.SCI_GETENDSTYLED), end
+    )
+
+
+@pytest.fixture
+def lexed(monkeypatch):
+    """The number of bytes each restyle lexed, in order."""
+    from highlighter import ViewLexer
+
+    sizes = []
+    apply = ViewLexer.apply
+
+    def record(self, job):
+        sizes.append(len(job.styles))
+        apply(self, job)
+
+    monkeypatch.setattr(ViewLexer, "apply", record)
+    return sizes
+
+
+def test_settled_restyle_keeps_later_styles(qapp, lexed):
+    view = make_view(qapp, SOURCE * 1000)
+    colourise(view, view.lines())
+    assert view.SendScintilla(view.SCI_GETENDSTYLED) == view.length()
+
+    view.SendScintilla(view.SCI_INSERTTEXT, 0, b"#")
+    colourise(view, 40)
+    # Lexing stopped early, the lines after it needn't be styled again
+    assert view.SendScintilla(view.SCI_GETENDSTYLED) == view.length()
+
+    del lexed[:]
+    middle = view.SendScintilla(view.SCI_POSITIONFROMLINE, 4000)
+    view.SendScintilla(view.SCI_INSERTTEXT, middle, b"#")
+    colourise(view, 4040)
+    assert sum(lexed) < 20 * 1024
+
+    # The same styles as lexing it all again
+    colourise(view, view.lines())
+    fresh = make_view(qapp, view.text_range(0, view.length()))
+    colourise(fresh, fresh.lines())
+    assert read_styles(view, 0, view.length()) == read_styles(fresh, 0, fresh.length())
+
+
+def test_reversed_range_styles_nothing(qapp, lexed):
+    view = make_view(qapp, SOURCE * 100)
+    colourise(view, 300)
+    end_styled = view.SendScintilla(view.SCI_GETENDSTYLED)
+    view.lexer.highlight(end_styled, end_styled - 100)
+    view.SendScintilla(view.SCI_COLOURISE, end_styled, 10)
+    assert len(lexed) == 1
+    assert view.SendScintilla(view.SCI_GETENDSTYLED) == end_styled
+
+
+def fold_levels(view):
+    return [
+        view.SendScintilla(view.SCI_GETFOLDLEVEL, line) for line in range(view.lines())
+    ]
+
+
+def fold_summary(view):
+    """Each line's fold level, after H for a header and W for a blank line."""
+    summary = []
+    for level in fold_levels(view):
+        flags = "H" if level & view.SC_FOLDLEVELHEADERFLAG else ""
+        flags += "W" if level & view.SC_FOLDLEVELWHITEFLAG else ""
+        number = (level & view.SC_FOLDLEVELNUMBERMASK) - view.SC_FOLDLEVELBASE
+        summary.append(f"{flags}{number}")
+    return summary
+
+
+def test_deleting_lines_refolds_the_line_above(qapp):
+    view = make_view(qapp, b"def f():\n    x = 1\n" * 50)
+    colourise(view, view.lines())
+    # From the end of a body line to the end of the next header, Scintilla
+    # moves the header flag of the deleted line to the body line
+    start = view.SendScintilla(view.SCI_GETLINEENDPOSITION, 21)
+    end = view.SendScintilla(view.SCI_GETLINEENDPOSITION, 22)
+    view.SendScintilla(view.SCI_DELETERANGE, start, end - start)
+    colourise(view, view.lines())
+
+    fresh = make_view(qapp, view.text_range(0, view.length()))
+    colourise(fresh, fresh.lines())
+    assert fold_levels(view) == fold_levels(fresh)
+
+
+@pytest.mark.parametrize(
+    "language, text, expected",
+    [
+        ("javascript", b"a();\n\nb();\n\nc();\n", ["0", "W0", "0", "W0", "0", "W0"]),
+        ("html", b"<p>x</p>\ntext here\n<p>y</p>\n", ["0", "0", "0", "W0"]),
+        # Lines inside a comment fold under its first line
+        ("javascript", b"/* one\ntwo */\nc();\n", ["H0", "1", "0", "W0"]),
+        ("html", b"<!-- one\n\ntwo -->\n<p>y</p>\n", ["H0", "1", "1", "0", "W0"]),
+    ],
+)
+def test_blank_lines_in_whitespace_fold_as_blank(qapp, language, text, expected):
+    view = make_view(qapp, text, language=language)
+    colourise(view, view.lines())
+    assert fold_summary(view) == expected
+
+
+@pytest.mark.parametrize(
+    "language, text",
+    [
+        ("javascript", b"a();\nb();\nfunction f() {\n  c();\n}\n"),
+        ("html", b"<p>x</p>\n<p>y</p>\n<div>\n  <p>z</p>\n</div>\n"),
+    ],
+)
+def test_inserted_blank_line_folds_like_a_fresh_lex(qapp, language, text):
+    view = make_view(qapp, text * 20, language=language)
+    colourise(view, view.lines())
+    # Lexed again from the line after the one the blank line splits off
+    for line in (1, 6, 30):
+        position = view.SendScintilla(view.SCI_POSITIONFROMLINE, line)
+        view.SendScintilla(view.SCI_INSERTTEXT, position, b"\n")
+        colourise(view, view.lines())
+    fresh = make_view(qapp, view.text_range(0, view.length()), language=language)
+    colourise(fresh, fresh.lines())
+    assert fold_levels(view) == fold_levels(fresh)
@@ -0,0 +1,100 @@
+import re
+
+import pytest
+
+from editor import View
+from search import Finder, Search, compile_pattern, parse_template, template
+
+TEXT = b"".join(
+    b"alpha beta %d\ngamma  \n\tdelta beta\n\nbeta\n" % i for i in range(20)
+)
+# Each of these would match across a newline somewhere in TEXT
+PATTERNS = [r"beta\s+\w+", r"\s+", r"a\W*", r"^\w*$", r"beta"]
+
+
+def make_view(qapp, text):
+    view = View(None, "monokai")
+    view.SendScintilla(view.SCI_APPENDTEXT, len(text), text)
+    view.SendScintilla(view.SCI_EMPTYUNDOBUFFER)
+    return view
+
+
+def run(qapp, search):
+    search.start()
+    search.wait()
+    qapp.processEvents()
+
+
+def line_matches(pattern, text):
+    """The matches of ``pattern`` in each line on its own."""
+    found = []
+    offset = 0
+    for line in text.split(b"\n"):
+        for match in pattern.finditer(line):
+            found.append((offset + match.start(), offset + match.end()))
+        offset += len(line) + 1
+    return found
+
+
+def find(qapp, view, pattern, chunk_size):
+    found = []
+    search = Search(view, pattern, chunk_size=chunk_size)
+    search.found.connect(lambda starts, ends: found.extend(zip(starts, ends)))
+    run(qapp, search)
+    return found
+
+
+def replace(qapp, view, pattern, replacement, chunk_size):
+    edits = []
+    search = Search(view, pattern, replacement, chunk_size=chunk_size)
+    search.replaced.connect(edits.extend)
+    run(qapp, search)
+    return edits[::-1]
+
+
+@pytest.mark.parametrize("text", PATTERNS)
+@pytest.mark.parametrize("chunk_size", [1, 10, 37, 1 << 20])
+def test_find_and_replace_agree(qapp, text, chunk_size):
+    view = make_view(qapp, TEXT)
+    pattern = compile_pattern(text, regex=True)
+    expected = line_matches(pattern, TEXT)
+    found = find(qapp, view, pattern, chunk_size)
+    assert found == [match for match in expected if match[1] > match[0]]
+    edits = replace(qapp, view, pattern, template("<\\g<0>>", pattern, True), 1)
+    assert [edit[:2] for edit in edits] == expected
+    assert [edit[2] for edit in edits] == [
+        b"<" + TEXT[start:end] + b">" for start, end in expected
+    ]
+
+
+def test_replace_all_is_one_undo_step(qapp):
+    view = make_view(qapp, TEXT)
+    finder = Finder(view)
+    finder.set_query(r"beta\s+(\w+)", regex=True)
+    counts = []
+    finder.replaced.connect(counts.append)
+    finder.replace_all("\\1!")
+    finder.search.wait()
+    qapp.processEvents()
+    pattern = re.compile(rb"beta\s+(\w+)", re.IGNORECASE)
+    expected = b"\n".join(pattern.sub(rb"\1!", line) for line in TEXT.split(b"\n"))
+    assert view.text_range(0, view.length()) == expected
+    assert counts == [len(line_matches(pattern, TEXT))]
+    view.undo()
+    assert view.text_range(0, view.length()) == TEXT
+    assert not view.SendScintilla(view.SCI_CANUNDO)
+    finder.close()
+
+
+@pytest.mark.parametrize(
+    "replacement",
+    [rb"x", rb"\2-\1", rb"\g<word>\g<0>", rb"\100\0\07\n\t\\\&", rb"[\g<2>]\18"],
+)
+def test_parse_template_expands_like_re(replacement):
+    pattern = re.compile(rb"(?P<word>\w+)(x)?" + rb"()" * 16)
+    match = pattern.search(b"..abc..")
+    literals, groups = parse_template(replacement, pattern)
+    expanded = literals[0]
+    for group, literal in zip(groups, literals[1:]):
+        expanded += (match[group] or b"") + literal
+    assert expanded == match.expand(replacement)
@@ -0,0 +1,27 @@
+import importlib.util
+import os
+
+from PyQt5.QtGui import QKeySequence
+
+from conftest import SRC
+
+
+def load_menus():
+    spec = importlib.util.spec_from_file_location(
+        "griphpad_main", os.path.join(SRC, "__main__.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.MENUS
+
+
+def test_shortcuts_are_unique(qapp):
+    seen = {}
+    for _, actions in load_menus():
+        for action in actions:
+            if action is None or not action.shortcut:
+                continue
+            # Parsed like QAction does, "Ctrl+shift+S" is "Ctrl+Shift+S"
+            key = QKeySequence(action.shortcut).toString()
+            assert key not in seen, f"{action.name} and {seen[key]} share {key}"
+            seen[key] = action.name
@@ -0,0 +1,26 @@
+import pytest
+from PyQt5.QtGui import QFont
+
+from benchmark import SAMPLES
+
+# Lexers with callbacks, nested states and inline flags besides the samples
+EXTRA_SAMPLES = {
+    "css": "a:hover, .x > b { color: #fff; margin: 0 1em !important; }\n",
+    "bash": 'for f in *.txt; do echo "${f%.txt}" $((1 + 2)); done # end\n',
+    "rust": 'fn main() { let s: &str = r#"raw"#; println!("{}", 0x1f_u8); }\n',
+    "markdown": "# Title\n\n* item with `code`\n\n```python\nx = 1\n```\n",
+    "sql": "SELECT a, COUNT(*) FROM t WHERE b LIKE 'x%' -- note\nGROUP BY a;\n",
+}
+
+
+@pytest.mark.parametrize("language", sorted({**SAMPLES, **EXTRA_SAMPLES}))
+def test_combined_rules_match_the_rule_loop(qapp, language):
+    from highlighter import ViewLexer
+
+    text = {**SAMPLES, **EXTRA_SAMPLES}[language] * 3
+    font = QFont("Monospace", 8)
+    combined = ViewLexer(language, "monokai", font, combined=True)
+    looped = ViewLexer(language, "monokai", font, combined=False)
+    tokens = list(combined.get_tokens_unprocessed(text))
+    assert tokens == list(looped.get_tokens_unprocessed(text))
+    assert "".join(value for _, _, value in tokens) == text
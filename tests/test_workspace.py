@@ -0,0 +1,67 @@
+import re
+
+import pytest
+
+import workspace
+from workspace import TrigramIndex, Workspace, required_literals
+
+
+@pytest.mark.parametrize(
+    "pattern, literals",
+    [
+        (r"\x41bcdef", ["bcdef"]),
+        (r"caf\u00e9 ole", ["caf", " ole"]),
+        (r"\N{EM DASH}abcd", ["abcd"]),
+        (r"\0123abc", ["3abc"]),
+        (r"(x)\1234abc", ["4abc"]),
+        (r"\d+word\bxyz", ["word", "xyz"]),
+    ],
+)
+def test_escape_operands_are_no_literals(pattern, literals):
+    assert required_literals(pattern, regex=True) == literals
+    match = re.search(
+        pattern, "\0" + "x" + "Abcdef café ole — abcd\n3abc 7word xyz 4abc"
+    )
+    if match is not None:
+        assert all(literal in match.group() for literal in literals)
+
+
+def make_tree(root, count):
+    root.mkdir()
+    for i in range(count):
+        (root / f"{i}.txt").write_text(f"file {i}\n")
+
+
+def test_scan_stops_within_a_directory(tmp_path):
+    make_tree(tmp_path / "tree", 2 * workspace.BATCH)
+    folder = Workspace(str(tmp_path / "tree"), directory=str(tmp_path / "cache"))
+    # Closed once the first batch is in
+    folder.progress.connect(lambda *counts: setattr(folder, "cancelled", True))
+    folder.scan()
+    assert len(folder.index) == workspace.BATCH
+
+
+def test_refreshed_files_are_saved_later(tmp_path, monkeypatch):
+    make_tree(tmp_path / "tree", 3)
+    folder = Workspace(str(tmp_path / "tree"), directory=str(tmp_path / "cache"))
+    saves = []
+    save = TrigramIndex.save
+    monkeypatch.setattr(
+        TrigramIndex, "save", lambda index, *args: saves.append(save(index, *args))
+    )
+    folder.refresh()
+    folder.done.wait()
+    assert len(saves) == 1
+
+    for i in range(3):
+        path = tmp_path / "tree" / f"{i}.txt"
+        path.write_text("changed\n")
+        folder.refresh([str(path)])
+        folder.done.wait()
+    assert len(saves) == 1
+    folder.close()
+    assert len(saves) == 2
+
+    reopened = Workspace(str(tmp_path / "tree"), directory=str(tmp_path / "cache"))
+    reopened.load()
+    assert reopened.candidates(["changed"]) == [(f"{i}.txt", 8) for i in range(3)]